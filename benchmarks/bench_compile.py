@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import copy
+import json
+import argparse
+import torch
+from benchmarks.common import load_config, build_net, time_fn, summarize
+from models.optimize import optimize_for_inference
+
+STAGES = ('unet_step', 'encoder', 'decoder', 'full')
+
+
+def bench(net, config, args):
+    device = config.device
+    x = torch.rand(args.batch_size, 6, args.height, args.width, device=device)
+    latent = torch.rand(args.batch_size, 6, args.height // 8, args.width // 8, device=device)
+    t = torch.full((args.batch_size,), 500.0, device=device)
+    if net.channels_last:
+        x = x.contiguous(memory_format=torch.channels_last)
+        latent = latent.contiguous(memory_format=torch.channels_last)
+
+    results = {}
+    results['unet_step'] = summarize(time_fn(lambda: net.Unet(latent, t), device, args.warmup, args.repeat))
+    results['encoder'] = summarize(time_fn(lambda: net.encode(x), device, args.warmup, args.repeat))
+    cond, skips = net.encode(x)
+    results['decoder'] = summarize(time_fn(lambda: net.decode(cond, skips), device, args.warmup, args.repeat))
+    results['full'] = summarize(time_fn(lambda: net(x), device, args.warmup, args.repeat))
+    return results
+
+
+def output_diffs(eager, optimized, config, args):
+    """Largest absolute difference between the eager and optimized outputs of every stage."""
+    device = config.device
+    x = torch.rand(1, 6, args.height, args.width, device=device)
+    latent = torch.rand(1, 6, args.height // 8, args.width // 8, device=device)
+    t = torch.full((1,), 500.0, device=device)
+    outputs = {}
+    with torch.no_grad():
+        for name, net in (('eager', eager), ('optimized', optimized)):
+            cond, skips = net.encode(x)
+            # same sampler noise for both
+            torch.manual_seed(0)
+            outputs[name] = {'unet_step': net.Unet(latent, t), 'encoder': cond,
+                             'decoder': net.decode(cond, skips), 'full': net(x)['pred_x']}
+    return {stage: (outputs['eager'][stage].float() - outputs['optimized'][stage].float()).abs().max().item()
+            for stage in STAGES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare eager and optimized (fused, channels_last, "
+                                                 "torch.compile) execution on random weights.")
+    parser.add_argument("--config", default="unsupervised.yml", type=str, help="Config file name or path")
+    parser.add_argument("--height", default=256, type=int, help="Input height (multiple of 64)")
+    parser.add_argument("--width", default=256, type=int, help="Input width (multiple of 64)")
+    parser.add_argument("--batch_size", default=1, type=int)
+    parser.add_argument("--threads", default=None, type=int, help="torch.set_num_threads")
+    parser.add_argument("--warmup", default=2, type=int, help="Untimed runs (compilation happens here)")
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--no_compile", action="store_true", help="Only fuse and convert to channels_last")
+    parser.add_argument("--compile_mode", default=None, type=str, help="torch.compile mode, e.g. max-autotune")
+    parser.add_argument("--device", default="cpu", type=str)
+    parser.add_argument("--output", default=None, type=str, help="Write results as JSON")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    config = load_config(args.config, torch.device(args.device))
+    torch.manual_seed(0)
+    eager = build_net(config)
+    optimized = optimize_for_inference(copy.deepcopy(eager), compile=not args.no_compile,
+                                       compile_mode=args.compile_mode)
+
+    results = {'eager': bench(eager, config, args), 'optimized': bench(optimized, config, args)}
+
+    results['max_abs_diff'] = output_diffs(eager, optimized, config, args)
+
+    print(f"{'stage':<12}{'eager ms':>12}{'optimized ms':>15}{'speedup':>10}{'max |diff|':>13}")
+    for stage in STAGES:
+        e, o = results['eager'][stage]['median_ms'], results['optimized'][stage]['median_ms']
+        print(f"{stage:<12}{e:>12.1f}{o:>15.1f}{e / o:>9.2f}x{results['max_abs_diff'][stage]:>13.2e}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(results, settings=vars(args)), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import os
+import time
+import argparse
+import yaml
+import numpy as np
+import torch
+from models.ddm import Net
+from utils.config_utils import dict2namespace
+
+
+def load_config(name, device):
+    """Load configs/<name> (or a path) the way parse_args_and_config does, without parsing argv."""
+    path = name if os.path.isfile(name) else os.path.join("configs", name)
+    with open(path, "r") as f:
+        config = dict2namespace(yaml.safe_load(f))
+    config.device = device
+    return config
+
+
+def build_net(config):
+    """Randomly initialized inference `Net`; no checkpoint (and no stage-1 weights) needed."""
+    args = argparse.Namespace(mode='evaluation')
+    return Net(args, config).to(config.device).eval()
+
+
+def synchronize(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def time_fn(fn, device, warmup=1, repeat=3):
+    """Run `fn` `warmup` times untimed, then return per-run wall times in milliseconds."""
+    with torch.no_grad():
+        for _ in range(warmup):
+            fn()
+        synchronize(device)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            synchronize(device)
+            times.append(1000 * (time.perf_counter() - start))
+    return times
+
+
+def summarize(times):
+    times = np.asarray(times)
+    return {'mean_ms': float(times.mean()), 'median_ms': float(np.median(times)),
+            'min_ms': float(times.min()), 'max_ms': float(times.max())}
+
+
+def memory_profile(fn, grad=False):
+    """
+    (peak, retained) CPU tensor memory of one run of `fn` on top of what was live before, in MB;
+    retained is what is still alive when `fn` returns (its outputs and, with `grad`, the tensors
+    saved for backward). Followed at operator granularity from the memory events of
+    torch.profiler: the net allocation of every top-level op plus the frees that happen between ops.
+    """
+    with torch.set_grad_enabled(grad), torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                                              profile_memory=True) as prof:
+        result = fn()
+    del result
+    events = [e for e in prof.events() if e.cpu_parent is None]
+    live = peak = 0
+    for event in sorted(events, key=lambda e: e.time_range.start):
+        live += event.cpu_memory_usage
+        peak = max(peak, live)
+    return peak / 2 ** 20, live / 2 ** 20
+
+
+def peak_memory_mb(fn):
+    """Peak CPU tensor memory allocated by one run of `fn` on top of what was live before, in MB."""
+    return memory_profile(fn)[0]
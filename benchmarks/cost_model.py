@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+import sys
+import json
+import argparse
+import torch
+import torch.nn as nn
+from benchmarks.common import load_config, build_net, memory_profile
+from utils.profiling import module_flops
+
+BYTES = 4  # float32
+MB = 2 ** 20
+
+
+class Counter(object):
+    """
+    Running totals of a walk through the network: parameters, FLOPs (2 per multiply-add) of the
+    convolutions / linear layers and of the attention matmuls, and activation memory in elements.
+    Without `grad`, `live` follows the tensors the forward keeps alive and `peak` its maximum; with
+    `grad`, `saved` accumulates the tensors autograd keeps for backward.
+    """
+
+    def __init__(self, batch, grad=False):
+        self.batch = batch
+        self.grad = grad
+        self.params = 0
+        self.flops = 0
+        self.attn_flops = 0
+        self.live = 0
+        self.peak = 0
+        self.saved = 0
+        self.attn_saved = 0
+        self.attn_peak = 0
+        self.max_transient = 0
+
+    def conv(self, cin, cout, k, h, w, groups=1, bias=True):
+        """Conv2d with an h x w output."""
+        self.params += cin // groups * cout * k * k + (cout if bias else 0)
+        self.flops += 2 * self.batch * h * w * cout * (cin // groups) * k * k
+
+    def conv_transpose(self, cin, cout, k, h, w):
+        """ConvTranspose2d with an h x w input."""
+        self.params += cin * cout * k * k + cout
+        self.flops += 2 * self.batch * h * w * cin * cout * k * k
+
+    def linear(self, fin, fout, rows):
+        self.params += fin * fout + fout
+        self.flops += 2 * rows * fin * fout
+
+    def norm(self, c):
+        self.params += 2 * c
+
+    def alloc(self, n):
+        """A tensor the forward keeps alive; in grad mode the saved tensors stand for these."""
+        if not self.grad:
+            self.live += n
+            self.peak = max(self.peak, self.live)
+
+    def free(self, n):
+        if not self.grad:
+            self.live -= n
+
+    def transient(self, n):
+        """Temporaries of one module on top of what is alive."""
+        self.peak = max(self.peak, self.live + n)
+        self.max_transient = max(self.max_transient, n)
+
+    def save(self, n):
+        if self.grad:
+            self.saved += n
+            self.live += n
+            self.peak = max(self.peak, self.live)
+
+
+# DiffusionUNet (models/unet.py)
+
+def resnet_block(c, cin, cout, h, w, temb_ch):
+    n = c.batch * h * w
+    c.norm(cin)
+    c.conv(cin, cout, 3, h, w)
+    c.linear(temb_ch, cout, c.batch)
+    c.norm(cout)
+    c.conv(cout, cout, 3, h, w)
+    if cin != cout:
+        c.conv(cin, cout, 1, h, w)
+    # GroupNorm input and output, sigmoid and product of each norm + swish
+    c.save(4 * (cin + cout) * n)
+    c.transient(max(3 * cin, cin + cout, 3 * cout) * n)
+
+
+def attn_block(c, ch, h, w):
+    """Full spatial self-attention: the scores are (h*w) x (h*w) per image."""
+    n, scores = c.batch * h * w, c.batch * (h * w) ** 2
+    c.norm(ch)
+    for _ in range(4):
+        c.conv(ch, ch, 1, h, w)
+    c.attn_flops += 2 * 2 * scores * ch
+    c.save(6 * ch * n + scores)
+    if c.grad:
+        c.attn_saved += scores
+    c.attn_peak = max(c.attn_peak, 2 * scores)
+    c.transient(4 * ch * n + 2 * scores)
+
+
+def unet(c, model, h, w):
+    """One DiffusionUNet call on an h x w latent."""
+    b, ch, mult, num_res_blocks = c.batch, model.ch, tuple(model.ch_mult), model.num_res_blocks
+    temb_ch = 4 * ch
+    in_ch = model.in_channels * 2
+    c.linear(ch, temb_ch, b)
+    c.linear(temb_ch, temb_ch, b)
+    c.save(in_ch * b * h * w)
+    c.conv(in_ch, ch, 3, h, w)
+
+    hs = [(ch, h, w)]
+    c.alloc(ch * b * h * w)
+    block_in = ch
+    for i_level in range(len(mult)):
+        block_out = ch * mult[i_level]
+        for _ in range(num_res_blocks):
+            resnet_block(c, block_in, block_out, h, w, temb_ch)
+            block_in = block_out
+            if i_level == 2:
+                attn_block(c, block_in, h, w)
+            hs.append((block_in, h, w))
+            c.alloc(block_in * b * h * w)
+        if i_level != len(mult) - 1:
+            # zero pad right/bottom, then a stride 2 convolution
+            c.save(block_in * b * (h + 1) * (w + 1))
+            c.transient(block_in * b * (h + 1) * (w + 1))
+            h, w = (h - 2) // 2 + 1, (w - 2) // 2 + 1
+            c.conv(block_in, block_in, 3, h, w)
+            hs.append((block_in, h, w))
+            c.alloc(block_in * b * h * w)
+
+    size = block_in * b * h * w
+    resnet_block(c, block_in, block_in, h, w, temb_ch)
+    c.alloc(size)
+    attn_block(c, block_in, h, w)
+    resnet_block(c, block_in, block_in, h, w, temb_ch)
+    current = size
+
+    for i_level in reversed(range(len(mult))):
+        block_out = ch * mult[i_level]
+        for _ in range(num_res_blocks + 1):
+            skip_ch = hs.pop()[0]
+            cat = (block_in + skip_ch) * b * h * w
+            c.alloc(cat)
+            resnet_block(c, block_in + skip_ch, block_out, h, w, temb_ch)
+            c.free(cat + current + skip_ch * b * h * w)
+            block_in, current = block_out, block_out * b * h * w
+            c.alloc(current)
+            if i_level == 2:
+                attn_block(c, block_in, h, w)
+        if i_level != 0:
+            # nearest upsampling, then a convolution
+            h, w = 2 * h, 2 * w
+            c.conv(block_in, block_in, 3, h, w)
+            c.save(block_in * b * h * w)
+            c.transient(2 * block_in * b * h * w)
+            c.free(current)
+            current = block_in * b * h * w
+            c.alloc(current)
+
+    c.norm(block_in)
+    c.conv(block_in, model.out_ch, 3, h, w)
+    c.save(4 * block_in * b * h * w)
+    c.transient((3 * block_in + model.out_ch) * b * h * w)
+    c.free(current)
+
+
+# CTDN (models/decom.py); frozen in stage 2, so it never saves activations
+
+def res_block(c, cin, cout, h, w):
+    c.conv(cin, cout, 3, h, w)
+    c.conv(cout, cout, 3, h, w)
+    c.conv(cin, cout, 1, h, w)
+    c.transient(3 * cout * c.batch * h * w)
+
+
+def strided(size):
+    """Output size of a 3x3, stride 2, padding 1 convolution."""
+    return (size - 1) // 2 + 1
+
+
+def encode(c, channels, h, w):
+    """ReconNet.encode: feature pyramid and channel_down. Returns the pyramid sizes (the decoder skips)."""
+    b = c.batch
+    c.conv(3, channels, 5, h, w)
+    c.conv(channels, channels, 5, h, w)
+    c.transient(2 * channels * b * h * w)
+    features = channels * b * h * w
+    c.alloc(features)
+    skips = []
+    for i, (cin, cout) in enumerate(((channels, channels), (channels, 2 * channels), (2 * channels, 4 * channels))):
+        res_block(c, cin, cout, h, w)
+        block = cout * b * h * w
+        c.alloc(block)
+        if i == 0:
+            # the later blocks read a pyramid level, which stays alive as a skip
+            c.free(features)
+        h, w = strided(h), strided(w)
+        c.conv(cout, cout, 3, h, w)
+        c.alloc(cout * b * h * w)
+        c.free(block)
+        skips.append((cout, h, w))
+    # channel_down: 4C -> 2C -> C -> 3 with LeakyReLU, sigmoid
+    c.conv(4 * channels, 2 * channels, 3, h, w)
+    c.conv(2 * channels, channels, 3, h, w)
+    c.conv(channels, 3, 3, h, w)
+    c.transient(4 * channels * b * h * w)
+    c.alloc(2 * 3 * b * h * w)  # latent and its normalized copy
+    return skips
+
+
+def decode(c, channels, skips):
+    """ReconNet.decode from the 3-channel latent, with the pyramid skips alive."""
+    b = c.batch
+    _, h, w = skips[-1]
+    c.conv(3, channels, 3, h, w)
+    c.conv(channels, 2 * channels, 3, h, w)
+    c.conv(2 * channels, 4 * channels, 3, h, w)
+    c.transient(6 * channels * b * h * w)
+    c.alloc(4 * channels * b * h * w)
+    cin = 4 * channels
+    for (skip_ch, _, _), cout in zip(reversed(skips), (2 * channels, channels, channels)):
+        res_block(c, cin, cin, h, w)
+        c.transient(cin * b * h * w)
+        res_block(c, cin, cin, h, w)
+        c.conv_transpose(cin, cout, 3, h, w)
+        h, w = 2 * h, 2 * w
+        c.transient(2 * cout * b * h * w)
+        # every intermediate stays referenced by a local of ReconNet.decode
+        c.alloc(cout * b * h * w)
+        cin = cout
+    c.conv(channels, channels, 3, h, w)
+    c.conv(channels, 3, 1, h, w)
+    c.transient((2 * channels + 3) * b * h * w)
+
+
+def retinex(c, channels, h, w):
+    """Retinex_decom on the 3-channel latent; both attentions are over channels, not pixels."""
+    b, n = c.batch, c.batch * h * w
+    c.conv(3, channels, 3, h, w)
+    c.conv(1, channels, 3, h, w)
+    for _ in range(4):
+        res_block(c, channels, channels, h, w)
+    for _ in range(3):
+        # Depth_conv: depthwise 3x3 + pointwise 1x1
+        c.conv(channels, channels, 3, h, w, groups=channels)
+        c.conv(channels, channels, 1, h, w)
+    c.attn_flops += 2 * 2 * b * h * w * channels * channels
+    c.conv(channels, 3 * channels, 1, h, w)
+    c.conv(3 * channels, 3 * channels, 3, h, w, groups=3 * channels)
+    c.conv(channels, channels, 1, h, w)
+    heads = 8
+    c.attn_flops += 2 * 2 * n * heads * (channels // heads) ** 2
+    res_block(c, channels, channels, h, w)
+    c.conv(channels, 3, 3, h, w)
+    res_block(c, channels, channels, h, w)
+    c.conv(channels, 1, 3, h, w)
+    c.transient(8 * channels * n)
+
+
+def latent_size(height, width):
+    return strided(strided(strided(height))), strided(strided(strided(width)))
+
+
+def predict(config, height, width, batch_size=1, timesteps=None, train_batch=None, train_size=None,
+            channels=64):
+    """
+    Predicted cost of `config` at an inference resolution and for a training step.
+    Memory is in MB (float32). FLOPs of a training step count backward as twice the forward of
+    the UNet calls. Training memory covers the UNet call on the noised input plus the sampling
+    loop, which backpropagates through every step.
+    """
+    model = config.model
+    timesteps = timesteps or config.diffusion.num_sampling_timesteps
+    train_batch = train_batch or config.training.batch_size
+    train_size = train_size or config.data.patch_size
+
+    # inference: encode, `timesteps` UNet calls, decode
+    h8, w8 = latent_size(height, width)
+    enc = Counter(batch_size)
+    skips = encode(enc, channels, height, width)
+    step = Counter(batch_size)
+    unet(step, model, h8, w8)
+    dec = Counter(batch_size)
+    decode(dec, channels, skips)
+    ret = Counter(batch_size)
+    retinex(ret, channels, h8, w8)
+
+    skip_elements = sum(ch * batch_size * h * w for ch, h, w in skips)
+    latent = 3 * batch_size * h8 * w8
+    # condition, the latent of every step (kept by the eager loop) and the concatenated UNet input
+    sampling = skip_elements + latent * (timesteps + 4)
+    # condition, sampled latent and its denormalized copy
+    decoding = skip_elements + 3 * latent
+    activation = max(enc.peak, sampling + step.peak, decoding + dec.peak)
+    unet_params, ctdn_params = step.params, enc.params + dec.params + ret.params
+    params = unet_params + ctdn_params
+
+    inference = {
+        'gflops': (enc.flops + timesteps * step.flops + dec.flops) / 1e9,
+        'attention_gflops': timesteps * step.attn_flops / 1e9,
+        'parts_gflops': {'encode': enc.flops / 1e9, 'unet_step': step.flops / 1e9, 'decode': dec.flops / 1e9},
+        'weights_mb': BYTES * params / MB,
+        'activation_mb': BYTES * activation / MB,
+        'attention_mb': BYTES * step.attn_peak / MB,
+    }
+    inference['total_mb'] = inference['weights_mb'] + inference['activation_mb']
+
+    # training: frozen CTDN on low and high, one UNet call with grad, sampling loop with grad
+    th8, tw8 = latent_size(train_size, train_size)
+    t_enc = Counter(train_batch)
+    encode(t_enc, channels, train_size, train_size)
+    t_ret = Counter(train_batch)
+    retinex(t_ret, channels, th8, tw8)
+    t_step = Counter(train_batch, grad=True)
+    unet(t_step, model, th8, tw8)
+    # the loop's own arithmetic only saves per-sample scalars; its output latent stays alive
+    sampling_saved = timesteps * t_step.saved + 3 * train_batch * th8 * tw8
+    saved = t_step.saved + sampling_saved
+    optimizer_states = 3 if getattr(config.optim, 'amsgrad', False) else 2
+    state = {'weights_mb': BYTES * params / MB,
+             'ema_mb': BYTES * params / MB,
+             'gradients_mb': BYTES * unet_params / MB,
+             'optimizer_mb': BYTES * optimizer_states * unet_params / MB}
+    training = {
+        'gflops': (2 * (t_enc.flops + t_ret.flops) + 3 * (timesteps + 1) * t_step.flops) / 1e9,
+        'attention_gflops': (2 * t_ret.attn_flops + 3 * (timesteps + 1) * t_step.attn_flops) / 1e9,
+        'state_mb': state,
+        'activation_mb': BYTES * saved / MB,
+        'sampling_activation_mb': BYTES * sampling_saved / MB,
+        'attention_mb': BYTES * (timesteps + 1) * t_step.attn_saved / MB,
+        'transient_mb': BYTES * max(t_enc.peak, t_step.max_transient) / MB,
+    }
+    training['total_mb'] = sum(state.values()) + training['activation_mb'] + training['transient_mb']
+
+    return {'params': {'unet': unet_params, 'ctdn': ctdn_params, 'total': params},
+            'inference': dict(inference, height=height, width=width, batch_size=batch_size, timesteps=timesteps),
+            'training': dict(training, patch_size=train_size, batch_size=train_batch, timesteps=timesteps)}
+
+
+def measure(config, height, width, batch_size, timesteps):
+    """Measured counterparts of `predict` on random weights, on CPU."""
+    config.diffusion.num_sampling_timesteps = timesteps
+    torch.manual_seed(0)
+    net = build_net(config)
+    counted = [0]
+
+    def count(module, inputs, output):
+        counted[0] += module_flops(module, inputs, output)
+
+    handles = [m.register_forward_hook(count) for m in net.modules()
+               if isinstance(m, (nn.Conv2d, nn.ConvTranspose2d, nn.Linear))]
+
+    def flops_of(fn):
+        counted[0] = 0
+        with torch.no_grad():
+            result = fn()
+        return counted[0] / 1e9, result
+
+    x = torch.rand(batch_size, 6, height, width)
+    encode_gflops, (cond, skips) = flops_of(lambda: net.encode(x))
+    latent = torch.randn(batch_size, 6, cond.shape[2], cond.shape[3])
+    unet_gflops, _ = flops_of(lambda: net.Unet(latent, torch.full((batch_size,), 500.0)))
+    decode_gflops, _ = flops_of(lambda: net.decode(cond, skips))
+    for handle in handles:
+        handle.remove()
+
+    inference_peak, _ = memory_profile(lambda: net(x))
+    b = net.betas
+    cond = cond.detach()
+    _, sampling_retained = memory_profile(lambda: net.sample_training(cond, b), grad=True)
+    return {'params': {'unet': sum(p.numel() for p in net.Unet.parameters()),
+                       'ctdn': sum(p.numel() for p in net.decom.parameters())},
+            'parts_gflops': {'encode': encode_gflops, 'unet_step': unet_gflops, 'decode': decode_gflops},
+            'inference_activation_mb': inference_peak,
+            'sampling_saved_mb': sampling_retained}
+
+
+def validate(config, sizes, batch_size, timesteps):
+    """Predicted vs measured at small sizes; returns one row per quantity and size."""
+    rows = []
+    for size in sizes:
+        predicted = predict(config, size, size, batch_size, timesteps, train_batch=batch_size, train_size=size)
+        measured = measure(config, size, size, batch_size, timesteps)
+        pairs = [('params.unet', predicted['params']['unet'], measured['params']['unet']),
+                 ('params.ctdn', predicted['params']['ctdn'], measured['params']['ctdn'])]
+        pairs += [('gflops.' + part, predicted['inference']['parts_gflops'][part], measured['parts_gflops'][part])
+                  for part in ('encode', 'unet_step', 'decode')]
+        pairs += [('inference_activation_mb', predicted['inference']['activation_mb'],
+                   measured['inference_activation_mb']),
+                  ('sampling_saved_mb', predicted['training']['sampling_activation_mb'],
+                   measured['sampling_saved_mb'])]
+        for name, p, m in pairs:
+            rows.append({'size': size, 'quantity': name, 'predicted': p, 'measured': m,
+                         'error': p / m - 1 if m else 0.0})
+    return rows
+
+
+def check(rows, count_tolerance, memory_tolerance):
+    """Mark every row whose relative error exceeds the tolerance of its kind; returns the number marked."""
+    failures = 0
+    for row in rows:
+        tolerance = memory_tolerance if row['quantity'].endswith('_mb') else count_tolerance
+        row['failed'] = abs(row['error']) > tolerance
+        failures += row['failed']
+    return failures
+
+
+def print_prediction(prediction):
+    params, inference, training = prediction['params'], prediction['inference'], prediction['training']
+    print("parameters: UNet {:.2f}M, CTDN {:.2f}M, total {:.2f}M".format(
+        params['unet'] / 1e6, params['ctdn'] / 1e6, params['total'] / 1e6))
+    print("inference {}x{}, batch {}, {} steps:".format(inference['height'], inference['width'],
+                                                        inference['batch_size'], inference['timesteps']))
+    print("  {:.1f} GFLOPs (encode {:.1f}, UNet step {:.1f}, decode {:.1f}; attention matmuls {:.2f})".format(
+        inference['gflops'], inference['parts_gflops']['encode'], inference['parts_gflops']['unet_step'],
+        inference['parts_gflops']['decode'], inference['attention_gflops']))
+    print("  memory {:.0f} MB = weights {:.0f} + activations {:.0f} (largest attention scores {:.1f})".format(
+        inference['total_mb'], inference['weights_mb'], inference['activation_mb'], inference['attention_mb']))
+    state = training['state_mb']
+    print("training {0}x{0} patches, batch {1}, {2} steps:".format(training['patch_size'], training['batch_size'],
+                                                                   training['timesteps']))
+    print("  {:.1f} GFLOPs per iteration (attention matmuls {:.2f})".format(training['gflops'],
+                                                                           training['attention_gflops']))
+    print("  memory {:.0f} MB = weights {:.0f} + EMA {:.0f} + gradients {:.0f} + Adam {:.0f} "
+          "+ saved activations {:.0f} (sampling loop {:.0f}, attention scores {:.1f}) + transient {:.0f}".format(
+              training['total_mb'], state['weights_mb'], state['ema_mb'], state['gradients_mb'],
+              state['optimizer_mb'], training['activation_mb'], training['sampling_activation_mb'],
+              training['attention_mb'], training['transient_mb']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict parameters, FLOPs and memory of a config for training "
+                                                 "and inference, and check the predictions against measured runs.")
+    parser.add_argument("--config", default="unsupervised.yml", type=str, help="Config file name or path")
+    parser.add_argument("--height", default=None, type=int, help="Inference height (default: data.patch_size)")
+    parser.add_argument("--width", default=None, type=int, help="Inference width (default: data.patch_size)")
+    parser.add_argument("--batch_size", default=1, type=int, help="Inference batch size")
+    parser.add_argument("--timesteps", default=None, type=int,
+                        help="num_sampling_timesteps (default: from the config)")
+    parser.add_argument("--train_batch", default=None, type=int, help="Default: training.batch_size")
+    parser.add_argument("--train_size", default=None, type=int, help="Training patch size (default: data.patch_size)")
+    parser.add_argument("--validate", action="store_true", help="Compare with measured runs on random weights")
+    parser.add_argument("--validate_sizes", default=None, type=int, nargs='+',
+                        help="Square sizes to validate at (default: 64, 128 and data.patch_size)")
+    parser.add_argument("--validate_timesteps", default=2, type=int)
+    parser.add_argument("--count_tolerance", default=0.01, type=float,
+                        help="Allowed relative error of the parameter and FLOP counts")
+    parser.add_argument("--memory_tolerance", default=0.25, type=float,
+                        help="Allowed relative error of the memory predictions")
+    parser.add_argument("--output", default=None, type=str, help="Write results as JSON")
+    args = parser.parse_args()
+
+    config = load_config(args.config, torch.device('cpu'))
+    height = args.height or config.data.patch_size
+    width = args.width or config.data.patch_size
+    prediction = predict(config, height, width, args.batch_size, args.timesteps, args.train_batch, args.train_size)
+    print_prediction(prediction)
+
+    results = {'prediction': prediction, 'settings': vars(args)}
+    failures = 0
+    if args.validate:
+        sizes = args.validate_sizes or sorted({64, 128, config.data.patch_size})
+        rows = validate(config, sizes, 1, args.validate_timesteps)
+        failures = check(rows, args.count_tolerance, args.memory_tolerance)
+        print("\n{:<6}{:<26}{:>14}{:>14}{:>9}".format('size', 'quantity', 'predicted', 'measured', 'error'))
+        for row in rows:
+            print("{:<6}{:<26}{:>14.4g}{:>14.4g}{:>+8.1%}{}".format(row['size'], row['quantity'], row['predicted'],
+                                                                  row['measured'], row['error'],
+                                                                  '  FAIL' if row['failed'] else ''))
+        print("{} prediction(s) out of tolerance (counts {:.0%}, memory {:.0%})".format(
+            failures, args.count_tolerance, args.memory_tolerance))
+        results['validation'] = rows
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
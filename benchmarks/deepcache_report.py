@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import copy
+import json
+import time
+import argparse
+import torch
+from benchmarks.common import load_config, synchronize
+from datasets.dataset import LLdataset, AllWeatherDataset
+from datasets.sampler import unpack_batch
+from metrics import to_numpy, compute_psnr, compute_ssim
+from models import InferenceDiffusion, DiffusiveRestoration
+
+
+def run(restoration, val_loader, device, max_images):
+    """Enhance the validation set; returns ({id: output}, {id: ground truth}, total model time in ms)."""
+    outputs, gts, elapsed = {}, {}, 0.0
+    with torch.no_grad():
+        for batch in val_loader:
+            x, y, sizes = unpack_batch(batch)
+            synchronize(device)
+            start = time.perf_counter()
+            pred = restoration.forward_sample(x)
+            synchronize(device)
+            elapsed += 1000 * (time.perf_counter() - start)
+            for k in range(x.shape[0]):
+                h, w = sizes[k].tolist()
+                outputs[y[k]] = pred[k, :, :h, :w].cpu()
+                gts[y[k]] = x[k, 3:, :h, :w].cpu()
+            if max_images and len(outputs) >= max_images:
+                break
+    return outputs, gts, elapsed
+
+
+def build_restoration(config, model_args, interval, level):
+    """A fresh inference model per setting, so no static sampler or captured graph carries over."""
+    config = copy.deepcopy(config)
+    config.sampling.deepcache_interval = interval
+    config.sampling.deepcache_level = level
+    restoration = DiffusiveRestoration(InferenceDiffusion(model_args, config), model_args, config)
+    restoration.warmup(getattr(config.sampling, 'warmup_shapes', None) or [])
+    return restoration
+
+
+def mean_metrics(reference, outputs):
+    psnr, ssim = [], []
+    for name, pred in outputs.items():
+        ref_np, pred_np = to_numpy(reference[name]), to_numpy(pred)
+        psnr.append(compute_psnr(ref_np, pred_np))
+        ssim.append(compute_ssim(ref_np, pred_np))
+    return sum(psnr) / len(psnr), sum(ssim) / len(ssim)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quality versus speed of DeepCache feature reuse on the "
+                                                 "validation set (LOLv1 by default).")
+    parser.add_argument("--config", default="unsupervised.yml", type=str, help="Config file name or path")
+    parser.add_argument("--resume", default="ckpt/stage2/stage2_weight.pth.tar", type=str)
+    parser.add_argument("--intervals", default=[2, 3, 5], type=int, nargs='+', help="Reuse intervals to test")
+    parser.add_argument("--levels", default=[1, 2], type=int, nargs='+', help="Cache levels to test")
+    parser.add_argument("--max_images", default=0, type=int, help="Stop after this many images (0: all)")
+    parser.add_argument("--seed", default=0, type=int, help="Sampler seed shared by all runs")
+    parser.add_argument("--output", default=None, type=str, help="Write results as JSON")
+    args = parser.parse_args()
+
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    config = load_config(args.config, device)
+    config.sampling.seed = args.seed
+    config.sampling.cache_dir = None
+    model_args = argparse.Namespace(mode='evaluation', resume=args.resume)
+
+    dataset = LLdataset(config)
+    val_dataset = AllWeatherDataset(config.data.data_dir, patch_size=config.data.patch_size,
+                                    filelist=dataset.get_filelist('{}_val'.format(config.data.val_dataset)),
+                                    train=False, resize=getattr(config.data, 'val_resize', True))
+    val_loader = dataset.get_val_loader(val_dataset)
+
+    restoration = build_restoration(config, model_args, 1, 1)
+    baseline, gts, baseline_ms = run(restoration, val_loader, device, args.max_images)
+    psnr, ssim = mean_metrics(gts, baseline)
+    results = [{'interval': 1, 'level': None, 'psnr': psnr, 'ssim': ssim, 'ms_per_image': baseline_ms / len(baseline),
+                'speedup': 1.0, 'psnr_vs_full': None}]
+    for level in args.levels:
+        for interval in args.intervals:
+            restoration = build_restoration(config, model_args, interval, level)
+            outputs, _, elapsed = run(restoration, val_loader, device, args.max_images)
+            psnr, ssim = mean_metrics(gts, outputs)
+            results.append({'interval': interval, 'level': level, 'psnr': psnr, 'ssim': ssim,
+                            'ms_per_image': elapsed / len(outputs), 'speedup': baseline_ms / elapsed,
+                            'psnr_vs_full': mean_metrics(baseline, outputs)[0]})
+
+    print(f"{'interval':>8}{'level':>7}{'PSNR':>8}{'SSIM':>8}{'ms/img':>10}{'speedup':>9}{'PSNR vs full':>14}")
+    for r in results:
+        level = '-' if r['level'] is None else r['level']
+        vs_full = '-' if r['psnr_vs_full'] is None else f"{r['psnr_vs_full']:.2f}"
+        print(f"{r['interval']:>8}{level:>7}{r['psnr']:>8.2f}{r['ssim']:>8.4f}{r['ms_per_image']:>10.1f}"
+              f"{r['speedup']:>8.2f}x{vs_full:>14}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'dataset': config.data.val_dataset, 'results': results, 'settings': vars(args)}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
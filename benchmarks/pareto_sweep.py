@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import os
+import copy
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import yaml
+import numpy as np
+import torch
+import datasets
+from benchmarks.common import load_config, synchronize
+from metrics import resolve_metrics
+from metrics_eval import evaluate_loader
+from models import InferenceDiffusion, DiffusiveRestoration
+from models.cache import checkpoint_fingerprint, sampler_signature
+
+# metrics where lower is better; the others (PSNR, SSIM) are maximized
+LOWER_IS_BETTER = ('lpips', 'niqe', 'pi')
+
+
+class TimedForward(object):
+    """Wraps `forward_sample` to record the wall time and size of every batch."""
+
+    def __init__(self, fn, device):
+        self.fn = fn
+        self.device = device
+        self.batches = []
+
+    def __call__(self, x, ids=None):
+        synchronize(self.device)
+        start = time.perf_counter()
+        output = self.fn(x, ids=ids)
+        synchronize(self.device)
+        self.batches.append((1000 * (time.perf_counter() - start), x.shape[0]))
+        return output
+
+
+def parse_grid(entries):
+    """['sampling.eta=0,0.5', ...] -> [('sampling.eta', [0, 0.5]), ...]; values are parsed as YAML."""
+    grid = []
+    for entry in entries:
+        key, values = entry.split('=', 1)
+        grid.append((key, [yaml.safe_load(v) for v in values.split(',')]))
+    return grid
+
+
+def apply_overrides(config, overrides):
+    config = copy.deepcopy(config)
+    for key, value in overrides.items():
+        *path, name = key.split('.')
+        section = config
+        for part in path:
+            section = getattr(section, part)
+        setattr(section, name, value)
+    return config
+
+
+def latency_stats(batches):
+    """Per-image latency and throughput; the first batch (warmup, compilation) is left out when possible."""
+    if len(batches) > 1:
+        batches = batches[1:]
+    per_image = np.array([ms / n for ms, n in batches for _ in range(n)])
+    total_ms = sum(ms for ms, _ in batches)
+    return {'ms_per_image': float(per_image.mean()), 'p50_ms': float(np.percentile(per_image, 50)),
+            'p90_ms': float(np.percentile(per_image, 90)),
+            'images_per_s': 1000 * len(per_image) / total_ms if total_ms else 0.0}
+
+
+def setting_config(base_config, overrides):
+    config = apply_overrides(base_config, overrides)
+    # result cache hits would make the recorded latencies meaningless
+    config.sampling.cache_dir = None
+    return config
+
+
+def data_signature(config):
+    """Data settings that change which images are evaluated or how they are batched and padded."""
+    data = config.data
+    return {'data_dir': data.data_dir, 'val_dataset': data.val_dataset, 'patch_size': data.patch_size,
+            'val_resize': getattr(data, 'val_resize', True), 'batch_size': config.sampling.batch_size}
+
+
+def run_setting(config, args, device, image_folder):
+    model_args = argparse.Namespace(mode='evaluation', resume=args.resume, image_folder=image_folder)
+    DATASET = datasets.__dict__[config.data.type](config)
+    _, val_loader = DATASET.get_loaders()
+    if args.max_images:
+        val_loader = DATASET.get_val_loader(val_loader.dataset,
+                                            indices=range(min(args.max_images, len(val_loader.dataset))))
+
+    restoration = DiffusiveRestoration(InferenceDiffusion(model_args, config), model_args, config)
+    timed = TimedForward(restoration.forward_sample, device)
+    restoration.forward_sample = timed
+    results = evaluate_loader(val_loader, restoration, device, is_paired=args.paired, parity=not args.fast_metrics,
+                              metrics=args.metrics)
+    return dict(latency_stats(timed.batches), images=sum(n for _, n in timed.batches),
+                **{name.lower(): value for name, value in results.items()})
+
+
+def dominates(a, b, objectives):
+    """`a` is at least as fast and as good as `b` on every objective, and strictly better on one."""
+    better = False
+    for name in ('ms_per_image',) + tuple(objectives):
+        sign = 1 if name == 'ms_per_image' or name in LOWER_IS_BETTER else -1
+        if sign * a[name] > sign * b[name]:
+            return False
+        better = better or sign * a[name] < sign * b[name]
+    return better
+
+
+def pareto_frontier(results, objectives):
+    return [r for r in results if not any(dominates(o, r, objectives) for o in results if o is not r)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep inference settings over the validation set and report the "
+                                                 "quality versus latency Pareto frontier.")
+    parser.add_argument("--config", default="unsupervised.yml", type=str, help="Config file name or path")
+    parser.add_argument("--resume", default="ckpt/stage2/stage2_weight.pth.tar", type=str)
+    parser.add_argument("--grid", nargs='+', type=str,
+                        default=["diffusion.num_sampling_timesteps=5,10,20", "sampling.eta=0.0,0.5"],
+                        help="Settings to sweep as key=v1,v2,... (any config key, e.g. sampling.precision=fp32,bf16 "
+                             "sampling.tile_size=0,256 sampling.attention=math,sdpa)")
+    parser.add_argument("--max_images", default=0, type=int, help="Evaluate on the first N images (0: all)")
+    parser.add_argument("--paired", action="store_true", help="Ground truth is available (PSNR/SSIM)")
+    parser.add_argument("--metrics", default="psnr,ssim,lpips,niqe", type=str)
+    parser.add_argument("--fast_metrics", action="store_true", help="Float PSNR/SSIM instead of skimage parity")
+    parser.add_argument("--objectives", default=["psnr"], nargs='+', type=str,
+                        help="Quality metrics of the frontier, traded against ms per image")
+    parser.add_argument("--cache_dir", default="results/pareto", type=str,
+                        help="Per-setting results; settings found here are not run again")
+    parser.add_argument("--output", default=None, type=str, help="Write all results and the frontier as JSON")
+    args = parser.parse_args()
+
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    base_config = load_config(args.config, device)
+    args.metrics = resolve_metrics(args.metrics, args.paired)
+    missing = [name for name in args.objectives if name not in args.metrics]
+    if missing:
+        raise ValueError("objectives {} are not among the computed metrics {}".format(missing, args.metrics))
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    if getattr(base_config.sampling, 'cache_dir', None):
+        print("=> Ignoring sampling.cache_dir: cached results would skip the timed model calls")
+    context = {'checkpoint': checkpoint_fingerprint(args.resume) if os.path.isfile(args.resume) else None,
+               'config': args.config, 'max_images': args.max_images, 'paired': args.paired,
+               'metrics': list(args.metrics), 'parity': not args.fast_metrics, 'device': device.type}
+    grid = parse_grid(args.grid)
+    results = []
+    for values in itertools.product(*[values for _, values in grid]):
+        overrides = dict(zip([key for key, _ in grid], values))
+        config = setting_config(base_config, overrides)
+        # the effective settings rather than the config file name, so edits to the YAML are not served stale
+        setting = dict(context, sampler=sampler_signature(config), data=data_signature(config))
+        key = hashlib.sha256(json.dumps(setting, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        path = os.path.join(args.cache_dir, key + '.json')
+        if os.path.isfile(path):
+            with open(path) as f:
+                result = json.load(f)
+            print("=> cached {}: {}".format(key, overrides))
+        else:
+            print("=> running {}: {}".format(key, overrides))
+            result = dict(run_setting(config, args, device, os.path.join(args.cache_dir, key)),
+                          overrides=overrides, key=key)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(result, f, indent=2)
+            os.replace(path + '.tmp', path)
+        results.append(result)
+
+    frontier = pareto_frontier(results, args.objectives)
+    names = [key for key, _ in grid]
+    columns = ['ms_per_image', 'images_per_s'] + list(args.metrics)
+    print("\n" + "".join("{:>16}".format(name.split('.')[-1][:15]) for name in names) +
+          "".join("{:>14}".format(c) for c in columns) + "  pareto")
+    for result in sorted(results, key=lambda r: r['ms_per_image']):
+        print("".join("{:>16}".format(str(result['overrides'][name])) for name in names) +
+              "".join("{:>14.4f}".format(result[c]) for c in columns) + ("  *" if result in frontier else ""))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'context': context, 'objectives': args.objectives, 'results': results,
+                       'frontier': sorted(frontier, key=lambda r: r['ms_per_image'])}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import sys
+import json
+import platform
+import argparse
+import resource
+import torch
+from benchmarks.common import load_config, build_net, time_fn, summarize, peak_memory_mb
+
+STAGES = ('feature_pyramid', 'retinex_decom', 'unet_step', 'decoder', 'sample_training')
+
+
+def stage_fns(net, config, batch_size, height, width):
+    """The isolated stages at one input size, as {name: fn}; inputs are random and built once."""
+    device = config.device
+    low = torch.rand(batch_size, 3, height, width, device=device)
+    if net.channels_last:
+        low = low.contiguous(memory_format=torch.channels_last)
+    cond, skips = net.encode(low)
+    low_fea = net.decom.ReconNet.channel_down(skips[2])
+    latent = torch.randn(batch_size, 6, height // 8, width // 8, device=device)
+    t = torch.full((batch_size,), 500.0, device=device)
+    b = net.betas.to(device)
+    return {
+        'feature_pyramid': lambda: net.decom.ReconNet.pyramid(low),
+        # training-time decomposition, applied to the encoder latent as in CTDN
+        'retinex_decom': lambda: net.decom.retinex(low_fea),
+        'unet_step': lambda: net.Unet(latent, t),
+        'decoder': lambda: net.decode(cond, skips),
+        'sample_training': lambda: net.sample_training(cond, b),
+    }
+
+
+def case_key(case):
+    return '{stage}@{height}x{width}/b{batch_size}/t{timesteps}'.format(**case)
+
+
+def run(args):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device('cpu')
+    config = load_config(args.config, device)
+    torch.manual_seed(args.seed)
+    net = build_net(config)
+    stages = args.stages or STAGES
+
+    results = []
+    for height, width in args.resolutions:
+        for batch_size in args.batch_sizes:
+            for timesteps in args.timesteps:
+                config.diffusion.num_sampling_timesteps = timesteps
+                with torch.no_grad():
+                    fns = stage_fns(net, config, batch_size, height, width)
+                for stage in stages:
+                    # only the sampling loop depends on the number of steps
+                    if stage != 'sample_training' and timesteps != args.timesteps[0]:
+                        continue
+                    case = {'stage': stage, 'height': height, 'width': width, 'batch_size': batch_size,
+                            'timesteps': timesteps if stage == 'sample_training' else None}
+                    repeat = args.loop_repeat if stage == 'sample_training' else args.repeat
+                    case.update(summarize(time_fn(fns[stage], device, args.warmup, repeat)))
+                    case['peak_mb'] = peak_memory_mb(fns[stage])
+                    results.append(case)
+                    print("{:<48}{:>10.1f} ms{:>10.1f} MB".format(case_key(case), case['median_ms'], case['peak_mb']))
+
+    report = {'settings': vars(args),
+              'environment': {'torch': torch.__version__, 'threads': torch.get_num_threads(),
+                              'machine': platform.machine(), 'processor': platform.processor(),
+                              'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("=> wrote {}".format(args.output))
+    return report
+
+
+def compare(args):
+    """Print the change of every case against the baseline; returns the number of regressions."""
+    with open(args.baseline) as f:
+        baseline = {case_key(case): case for case in json.load(f)['results']}
+    with open(args.current) as f:
+        current = {case_key(case): case for case in json.load(f)['results']}
+
+    regressions = 0
+    print("{:<48}{:>12}{:>12}{:>9}{:>12}{:>12}{:>9}".format(
+        'case', 'base ms', 'ms', 'change', 'base MB', 'MB', 'change'))
+    for key in sorted(set(baseline) & set(current)):
+        old, new = baseline[key], current[key]
+        time_change = new['median_ms'] / old['median_ms'] - 1
+        memory_change = new['peak_mb'] / old['peak_mb'] - 1 if old['peak_mb'] > 0 else 0.0
+        regressed = time_change > args.time_tolerance or memory_change > args.memory_tolerance
+        regressions += regressed
+        print("{:<48}{:>12.1f}{:>12.1f}{:>+8.1%}{:>12.1f}{:>12.1f}{:>+8.1%}{}".format(
+            key, old['median_ms'], new['median_ms'], time_change, old['peak_mb'], new['peak_mb'], memory_change,
+            '  REGRESSION' if regressed else ''))
+    for key in sorted(set(baseline) ^ set(current)):
+        print("{:<48} only in {}".format(key, 'baseline' if key in baseline else 'current'))
+    print("{} regression(s) (time tolerance {:.0%}, memory tolerance {:.0%})".format(
+        regressions, args.time_tolerance, args.memory_tolerance))
+    return regressions
+
+
+def resolution(value):
+    height, width = value.lower().split('x')
+    return int(height), int(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU time and memory of every inference stage on random weights, "
+                                                 "and regression checks against a stored baseline.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Benchmark the stages over a sweep and write JSON")
+    run_parser.add_argument("--config", default="unsupervised.yml", type=str, help="Config file name or path")
+    run_parser.add_argument("--resolutions", default=[(256, 256), (512, 512)], type=resolution, nargs='+',
+                            help="HxW input sizes (multiples of 64)")
+    run_parser.add_argument("--batch_sizes", default=[1], type=int, nargs='+')
+    run_parser.add_argument("--timesteps", default=[10, 20], type=int, nargs='+',
+                            help="num_sampling_timesteps values for the sampling loop")
+    run_parser.add_argument("--stages", default=None, choices=STAGES, nargs='+', help="Subset of the stages")
+    run_parser.add_argument("--threads", default=None, type=int, help="torch.set_num_threads")
+    run_parser.add_argument("--warmup", default=1, type=int)
+    run_parser.add_argument("--repeat", default=5, type=int)
+    run_parser.add_argument("--loop_repeat", default=2, type=int, help="Timed runs of the full sampling loop")
+    run_parser.add_argument("--seed", default=0, type=int, help="Seed of the random weights")
+    run_parser.add_argument("--output", default=None, type=str, help="Write results as JSON")
+
+    compare_parser = commands.add_parser('compare', help="Flag regressions of a run against a baseline")
+    compare_parser.add_argument("baseline", type=str, help="JSON written by `run`")
+    compare_parser.add_argument("current", type=str, help="JSON written by `run`")
+    compare_parser.add_argument("--time_tolerance", default=0.10, type=float,
+                                help="Allowed relative increase of the median time")
+    compare_parser.add_argument("--memory_tolerance", default=0.10, type=float,
+                                help="Allowed relative increase of the peak memory")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    elif compare(args):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from datasets.pair_index import PairIndex, size_index_path, read_size_index, write_size_index
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+def scan_images(directory):
+    """
+    List image files of `directory` with a single os.scandir pass.
+
+    Returns:
+        images (dict): stem -> (path, mtime_ns, size_bytes). When several files share a stem
+                       (e.g. '1.png' and '1.jpg') the first one in name order is kept.
+        duplicates (list): Paths dropped because of a stem collision.
+    """
+    images, duplicates = {}, []
+    with os.scandir(directory) as it:
+        entries = sorted((e for e in it if not e.name.startswith('.')), key=lambda e: e.name)
+    for entry in entries:
+        stem, ext = os.path.splitext(entry.name)
+        if ext.lower() not in IMAGE_EXTENSIONS or not entry.is_file():
+            continue
+        if stem in images:
+            duplicates.append(entry.path)
+            continue
+        st = entry.stat()
+        images[stem] = (os.path.abspath(entry.path), st.st_mtime_ns, st.st_size)
+    return images, duplicates
+
+
+def probe_image(path, verify=False):
+    """
+    Read only the image header: (width, height, channels). With `verify`, PIL additionally
+    checks the file structure (chunk CRCs for PNG) without decoding the pixels.
+    """
+    with Image.open(path) as img:
+        width, height = img.size
+        channels = len(img.getbands())
+        if verify:
+            img.verify()
+    return width, height, channels
+
+
+def find_pair_dirs(base_dir):
+    """Either base_dir itself holds 'low'/'high' (LOL layout) or each subfolder does (LSRW cameras)."""
+    if os.path.isdir(os.path.join(base_dir, "low")) and os.path.isdir(os.path.join(base_dir, "high")):
+        return [base_dir]
+    pair_dirs = []
+    with os.scandir(base_dir) as it:
+        for entry in sorted(it, key=lambda e: e.name):
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            if os.path.isdir(os.path.join(entry.path, "low")) and os.path.isdir(os.path.join(entry.path, "high")):
+                pair_dirs.append(entry.path)
+            else:
+                print(f"WARNING: '{entry.path}' has no 'low'/'high' subdirectories. Skipping.")
+    return pair_dirs
+
+
+def match_pairs(pool, pair_dir):
+    low_scan, high_scan = pool.map(scan_images, [os.path.join(pair_dir, "low"), os.path.join(pair_dir, "high")])
+    (low_images, low_dups), (high_images, high_dups) = low_scan, high_scan
+    for path in low_dups + high_dups:
+        print(f"WARNING in {pair_dir}: '{path}' shares its stem with another file. Ignored.")
+
+    missing_in_high = sorted(set(low_images) - set(high_images))
+    missing_in_low = sorted(set(high_images) - set(low_images))
+    if missing_in_high:
+        print(f"WARNING in {pair_dir}: {len(missing_in_high)} files in 'low' have no match in 'high': {missing_in_high[:10]}")
+    if missing_in_low:
+        print(f"WARNING in {pair_dir}: {len(missing_in_low)} files in 'high' have no match in 'low': {missing_in_low[:10]}")
+
+    return [(low_images[stem], high_images[stem]) for stem in sorted(set(low_images) & set(high_images))]
+
+
+def check_pair(pair, previous, verify):
+    """Return a size index row for a pair, or (None, reason) if it must not reach training."""
+    (low, low_mtime, low_bytes), (high, high_mtime, high_bytes) = pair
+    row = previous.get((low, high))
+    if row is not None and (row['low_mtime_ns'], row['high_mtime_ns'], row['low_bytes'], row['high_bytes']) \
+            == (low_mtime, high_mtime, low_bytes, high_bytes):
+        return row, None
+
+    try:
+        low_w, low_h, low_c = probe_image(low, verify)
+        high_w, high_h, high_c = probe_image(high, verify)
+    except Exception as e:
+        return None, f"unreadable: {e}"
+    if low_c != 3 or high_c != 3:
+        return None, f"expected 3 channels, got {low_c} (low) and {high_c} (high)"
+    if (low_w, low_h) != (high_w, high_h):
+        print(f"WARNING: size mismatch {low} {low_w}x{low_h} vs {high} {high_w}x{high_h}")
+    return {'low': low, 'high': high, 'width': low_w, 'height': low_h, 'channels': low_c,
+            'low_mtime_ns': low_mtime, 'high_mtime_ns': high_mtime,
+            'low_bytes': low_bytes, 'high_bytes': high_bytes}, None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create a paired list file from 'low'/'high' directories, either directly under "
+                    "--base_dir (LOL) or under each of its subfolders (LSRW Huawei/Nikon).")
+    parser.add_argument("--base_dir", default="/scratch/user/u.ok285885/data/LOL-v1/our485/",
+                        help="Directory with 'low' and 'high' subdirectories, or with camera subfolders that have them")
+    parser.add_argument("--output", default="/scratch/user/u.ok285885/data/LOL-v1/LOLv1_val.txt",
+                        help="Output list file; the size index is written next to it as <stem>.sizes.tsv")
+    parser.add_argument("--workers", default=16, type=int, help="Threads used to scan and probe images")
+    parser.add_argument("--update", action="store_true",
+                        help="Reuse entries of an existing size index whose files did not change")
+    parser.add_argument("--verify", action="store_true",
+                        help="Also verify file structure (slower, still no full decode)")
+    parser.add_argument("--index", action="store_true",
+                        help="Also write a binary pair index <stem>.idx (see datasets/pair_index.py)")
+    args = parser.parse_args()
+
+    base_dir = args.base_dir
+    if not os.path.isdir(base_dir):
+        sys.exit(f"Error: Base directory '{base_dir}' does not exist.")
+    pair_dirs = find_pair_dirs(base_dir)
+    if not pair_dirs:
+        sys.exit(f"Error: no 'low'/'high' directories found under '{base_dir}'.")
+
+    output_path = os.path.abspath(args.output)
+    sizes_path = size_index_path(output_path)
+    previous = {}
+    if args.update and os.path.isfile(sizes_path):
+        previous = {(row['low'], row['high']): row for row in read_size_index(sizes_path)}
+        print(f"Loaded {len(previous)} existing entries from {sizes_path}")
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        pairs = []
+        for pair_dir in pair_dirs:
+            found = match_pairs(pool, pair_dir)
+            print(f"Found {len(found)} paired images in {pair_dir}.")
+            pairs.extend(found)
+        checked = list(pool.map(lambda pair: check_pair(pair, previous, args.verify), pairs, chunksize=64))
+
+    rows, rejected = [], 0
+    for pair, (row, reason) in zip(pairs, checked):
+        if row is None:
+            rejected += 1
+            print(f"WARNING: dropping {pair[0][0]}: {reason}")
+        else:
+            rows.append(row)
+    reused = sum(1 for row in rows if previous.get((row['low'], row['high'])) is row)
+
+    print(f"\nTotal pairs found: {len(pairs)}")
+    print(f"Rejected pairs: {rejected}")
+    if args.update:
+        print(f"Unchanged pairs reused from the existing index: {reused}")
+
+    # Write the pairs to output file: each line is "low_path high_path"
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w") as out_f:
+        for row in rows:
+            out_f.write(f"{row['low']} {row['high']}\n")
+    os.replace(tmp_path, output_path)
+    write_size_index(sizes_path, rows)
+    print(f"\nPaired list written to: {output_path}")
+    print(f"Size index written to: {sizes_path}")
+
+    if args.index:
+        index_path = os.path.splitext(output_path)[0] + ".idx"
+        PairIndex.from_lines(f"{row['low']} {row['high']}" for row in rows).save(index_path)
+        print(f"Pair index written to: {index_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -88,3 +88,18 @@ class PairResize:
         label_resized = F.resize(label, self.size)
         return image_resized, label_resized
 
+
+
+def get_pair_transforms(patch_size, train=True, resize=True):
+    if not resize:
+        return PairCompose([PairToTensor()])
+    if train:
+        return PairCompose([
+            PairResize((patch_size, patch_size)),
+            PairRandomHorizontalFilp(),
+            PairToTensor()
+        ])
+    return PairCompose([
+        PairResize((patch_size, patch_size)),
+        PairToTensor()
+    ])
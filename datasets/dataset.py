@@ -2,63 +2,115 @@ import os
 import torch
 import torch.utils.data
 from PIL import Image
-from datasets.data_augment import PairCompose, PairToTensor, PairRandomHorizontalFilp, PairResize
+from datasets.data_augment import get_pair_transforms
+from datasets.streaming import StreamingPairDataset
+from datasets.pair_index import PairIndex, size_index_path, read_size_index
+from datasets.sampler import BucketBatchSampler, pad_collate
 
 
 class LLdataset:
     def __init__(self, config):
         self.config = config
 
+    def get_filelist(self, name):
+        # prefer a prebuilt binary index (see datasets/pair_index.py) over the text list, unless the
+        # list was edited after the index was built: then rebuild it, or read the list if that fails
+        index_path = os.path.join(self.config.data.data_dir, name + '.idx')
+        list_path = os.path.join(self.config.data.data_dir, name + '.txt')
+        if not os.path.isfile(index_path):
+            return name + '.txt'
+        if os.path.isfile(list_path) and os.path.getmtime(list_path) > os.path.getmtime(index_path):
+            try:
+                PairIndex.from_list_file(list_path).save(index_path)
+                print("=> Rebuilt stale pair index {} from {}".format(index_path, list_path))
+            except OSError as e:
+                print("=> Pair index {} is older than {} and could not be rebuilt ({}); using the list"
+                      .format(index_path, list_path, e))
+                return name + '.txt'
+        return name + '.idx'
+
+    def get_train_dataset(self):
+        if getattr(self.config.data, 'streaming', False):
+            source = os.path.join(self.config.data.data_dir, '{}_train'.format(self.config.data.train_dataset))
+            if not os.path.isdir(source):
+                source += '.txt'
+            return StreamingPairDataset(source,
+                                        patch_size=self.config.data.patch_size,
+                                        batch_size=self.config.training.batch_size,
+                                        shuffle_buffer=getattr(self.config.data, 'shuffle_buffer', 10000),
+                                        prefetch=getattr(self.config.data, 'prefetch', 16),
+                                        num_threads=getattr(self.config.data, 'prefetch_threads', 4),
+                                        seed=getattr(self.config.data, 'seed', 0))
+        return AllWeatherDataset(self.config.data.data_dir,
+                                 patch_size=self.config.data.patch_size,
+                                 filelist=self.get_filelist('{}_train'.format(self.config.data.train_dataset)))
+
     def get_loaders(self):
-        train_dataset = AllWeatherDataset(self.config.data.data_dir,
-                                          patch_size=self.config.data.patch_size,
-                                          filelist='{}_train.txt'.format(self.config.data.train_dataset))
+        train_dataset = self.get_train_dataset()
         val_dataset = AllWeatherDataset(self.config.data.data_dir,
                                         patch_size=self.config.data.patch_size,
-                                        filelist='{}_val.txt'.format(self.config.data.val_dataset), train=False)
+                                        filelist=self.get_filelist('{}_val'.format(self.config.data.val_dataset)),
+                                        train=False, resize=getattr(self.config.data, 'val_resize', True))
 
+        is_streaming = isinstance(train_dataset, torch.utils.data.IterableDataset)
         train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=self.config.training.batch_size,
-                                                   shuffle=True, num_workers=self.config.data.num_workers,
+                                                   shuffle=not is_streaming, num_workers=self.config.data.num_workers,
                                                    pin_memory=True)
-        val_loader = torch.utils.data.DataLoader(val_dataset, batch_size=self.config.sampling.batch_size,
-                                                 shuffle=False, num_workers=self.config.data.num_workers,
-                                                 pin_memory=True)
+        val_loader = self.get_val_loader(val_dataset)
 
         return train_loader, val_loader
 
+    def get_val_loader(self, val_dataset, indices=None):
+        # group images by padded shape so sampling.batch_size > 1 works for native resolutions
+        sizes = [val_dataset.image_size(i) for i in range(len(val_dataset))]
+        val_sampler = BucketBatchSampler(sizes, batch_size=self.config.sampling.batch_size, indices=indices)
+        return torch.utils.data.DataLoader(val_dataset, batch_sampler=val_sampler, collate_fn=pad_collate,
+                                           num_workers=self.config.data.num_workers, pin_memory=True)
+
 
 class AllWeatherDataset(torch.utils.data.Dataset):
-    def __init__(self, dir, patch_size, filelist=None, train=True):
+    def __init__(self, dir, patch_size, filelist=None, train=True, resize=True):
         super().__init__()
 
         self.dir = dir
         self.file_list = filelist
         self.train_list = os.path.join(dir, self.file_list)
-        with open(self.train_list) as f:
-            contents = f.readlines()
-            input_names = [i.strip() for i in contents]
-
-        self.input_names = input_names
+        self.pairs = PairIndex.open(self.train_list)
+        self.known_sizes = None
         self.patch_size = patch_size
-
-        if train:
-            self.transforms = PairCompose([
-                PairResize((self.patch_size, self.patch_size)),
-                PairRandomHorizontalFilp(),
-                PairToTensor()
-            ])
-        else:
-            self.transforms = PairCompose([
-                PairResize((self.patch_size, self.patch_size)),
-                PairToTensor()
-            ])
+        self.resize = resize
+        # return image_key() instead of the bare file name as the sample id
+        self.keyed_ids = False
+
+        self.transforms = get_pair_transforms(self.patch_size, train, resize)
+
+    def image_size(self, index):
+        """
+        (h, w) of the transformed image at `index`, taken from the <stem>.sizes.tsv index written
+        by create_pairs.py when present, else read from the file header only.
+        """
+        if self.resize:
+            return self.patch_size, self.patch_size
+        if self.known_sizes is None:
+            sizes_path = size_index_path(self.train_list)
+            self.known_sizes = {row['low']: (row['height'], row['width']) for row in read_size_index(sizes_path)} \
+                if os.path.isfile(sizes_path) else {}
+        low_img_name = self.pairs.low_path(index)
+        if low_img_name in self.known_sizes:
+            return self.known_sizes[low_img_name]
+        with Image.open(low_img_name) as img:
+            w, h = img.size
+        return h, w
+
+    def image_key(self, index):
+        """`<subset>/<file name>` of the low image, the subset being the folder above `low/` (e.g. Huawei in LSRW)."""
+        parts = self.pairs.low_path(index).split('/')
+        return '{}/{}'.format(parts[-3], parts[-1]) if len(parts) >= 3 else parts[-1]
 
     def get_images(self, index):
-        input_name = self.input_names[index].replace('\n', '')
-
-        low_img_name, high_img_name = input_name.split(' ')[0], input_name.split(' ')[1]
+        low_img_name, high_img_name = self.pairs[index]
 
-        img_id = low_img_name.split('/')[-1]
+        img_id = self.image_key(index) if self.keyed_ids else low_img_name.split('/')[-1]
         low_img, high_img = Image.open(low_img_name), Image.open(high_img_name)
 
         low_img, high_img = self.transforms(low_img, high_img)
@@ -70,4 +122,4 @@ class AllWeatherDataset(torch.utils.data.Dataset):
         return res
 
     def __len__(self):
-        return len(self.input_names)
+        return len(self.pairs)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+import numpy as np
+
+INDEX_MAGIC = b'LDPIDX01'
+HEADER_SIZE = len(INDEX_MAGIC) + 16
+
+
+class PairIndex:
+    """
+    Read-only (low_path, high_path) list packed into one byte buffer plus an int64 offset table.
+
+    A Python list of strings is touched by reference counting on every access, so forked
+    DataLoader workers slowly copy it page by page. Here both arrays are flat numpy buffers
+    (memory-mapped when loaded from a binary index), which keeps worker memory flat.
+    Row i of `offsets` holds (low_start, high_start, high_end) into `blob`.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_lines(cls, lines, source='<lines>', check_exists=False):
+        """
+        Args:
+            lines: Iterable of "low_path high_path" lines (str or bytes).
+            source: Name used in validation errors.
+            check_exists: Also stat every path (slow on large network file systems).
+        """
+        blob = bytearray()
+        offsets = []
+        for lineno, line in enumerate(lines, start=1):
+            if isinstance(line, str):
+                line = os.fsencode(line)
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) < 2:
+                raise ValueError("{}:{}: expected 'low_path high_path', got {!r}".format(
+                    source, lineno, os.fsdecode(line.strip())))
+            low, high = fields[0], fields[1]
+            if check_exists:
+                for path in (low, high):
+                    if not os.path.isfile(path):
+                        raise FileNotFoundError('{}:{}: {} does not exist'.format(source, lineno, os.fsdecode(path)))
+            low_start = len(blob)
+            blob += low
+            high_start = len(blob)
+            blob += high
+            offsets.append((low_start, high_start, len(blob)))
+
+        offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 3)
+        return cls(np.frombuffer(bytes(blob), dtype=np.uint8), offsets)
+
+    @classmethod
+    def from_list_file(cls, path, check_exists=False):
+        with open(path, 'rb') as f:
+            data = f.read()
+        return cls.from_lines(data.splitlines(), source=path, check_exists=check_exists)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a binary index written by `save`; memory-mapped by default."""
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if header[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError('{} is not a pair index file'.format(path))
+        count, blob_size = np.frombuffer(header[len(INDEX_MAGIC):], dtype='<u8')
+        count, blob_size = int(count), int(blob_size)
+        offsets_size = count * 3 * 8
+        if mmap:
+            offsets = np.memmap(path, dtype='<i8', mode='r', offset=HEADER_SIZE, shape=(count, 3))
+            blob = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE + offsets_size, shape=(blob_size,)) \
+                if blob_size else np.zeros(0, dtype=np.uint8)
+        else:
+            with open(path, 'rb') as f:
+                f.seek(HEADER_SIZE)
+                offsets = np.fromfile(f, dtype='<i8', count=count * 3).reshape(count, 3)
+                blob = np.fromfile(f, dtype=np.uint8, count=blob_size)
+        return cls(blob, offsets)
+
+    @classmethod
+    def open(cls, path, check_exists=False):
+        """Load `path` as a binary index if it carries the index header, else parse it as a text list."""
+        with open(path, 'rb') as f:
+            is_binary = f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+        if is_binary:
+            return cls.load(path)
+        return cls.from_list_file(path, check_exists=check_exists)
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(np.asarray([len(self), self.blob.size], dtype='<u8').tobytes())
+            f.write(np.ascontiguousarray(self.offsets, dtype='<i8').tobytes())
+            f.write(np.ascontiguousarray(self.blob).tobytes())
+        os.replace(tmp_path, path)
+
+    def _path(self, start, end):
+        return os.fsdecode(self.blob[start:end].tobytes())
+
+    def low_path(self, index):
+        low_start, high_start, _ = self.offsets[index]
+        return self._path(low_start, high_start)
+
+    def high_path(self, index):
+        _, high_start, high_end = self.offsets[index]
+        return self._path(high_start, high_end)
+
+    def __getitem__(self, index):
+        low_start, high_start, high_end = self.offsets[index]
+        return self._path(low_start, high_start), self._path(high_start, high_end)
+
+    def __len__(self):
+        return self.offsets.shape[0]
+
+
+SIZE_INDEX_COLUMNS = ('low', 'high', 'width', 'height', 'channels',
+                      'low_mtime_ns', 'high_mtime_ns', 'low_bytes', 'high_bytes')
+
+
+def size_index_path(list_path):
+    """Sidecar written next to a pair list (or its .idx) by create_pairs.py: <stem>.sizes.tsv"""
+    return os.path.splitext(list_path)[0] + '.sizes.tsv'
+
+
+def read_size_index(path):
+    """
+    Read a sizes sidecar into a list of row dicts (see SIZE_INDEX_COLUMNS), in list order.
+    Integer columns are converted to int.
+    """
+    rows = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            values = line.rstrip('\n').split('\t')
+            if len(values) != len(SIZE_INDEX_COLUMNS):
+                raise ValueError('{}: malformed row {!r}'.format(path, line))
+            row = dict(zip(SIZE_INDEX_COLUMNS, values))
+            for key in SIZE_INDEX_COLUMNS[2:]:
+                row[key] = int(row[key])
+            rows.append(row)
+    return rows
+
+
+def write_size_index(path, rows):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('#' + '\t'.join(SIZE_INDEX_COLUMNS) + '\n')
+        for row in rows:
+            f.write('\t'.join(str(row[key]) for key in SIZE_INDEX_COLUMNS) + '\n')
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a 'low_path high_path' list file into a binary pair index.")
+    parser.add_argument("list_file", help="Text list with one 'low_path high_path' pair per line")
+    parser.add_argument("--output", default=None, help="Index file to write (default: <list_file without .txt>.idx)")
+    parser.add_argument("--check_exists", action="store_true", help="Fail on pairs whose files do not exist")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.list_file)[0] + '.idx'
+    try:
+        index = PairIndex.from_list_file(args.list_file, check_exists=args.check_exists)
+    except (ValueError, FileNotFoundError) as e:
+        sys.exit(f"Error: {e}")
+    index.save(output)
+    print(f"Wrote {len(index)} pairs to {output}")
+
+
+if __name__ == "__main__":
+    main()
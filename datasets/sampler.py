@@ -0,0 +1,75 @@
+import math
+from collections import OrderedDict
+import torch
+import torch.utils.data
+import torch.nn.functional as F
+
+
+def padded_shape(h, w, multiple=64):
+    return int(multiple * math.ceil(h / multiple)), int(multiple * math.ceil(w / multiple))
+
+
+class BucketBatchSampler(torch.utils.data.Sampler):
+    """
+    Batch sampler that only groups images sharing the same padded-to-`multiple` shape, so a
+    batch can be padded once and run through the sampler without extra padding waste.
+
+    Buckets are emitted in order of first appearance and keep dataset order inside, which
+    keeps validation output deterministic.
+
+    Args:
+        sizes: Sequence of (h, w) for every dataset index.
+        batch_size: Maximum number of images per batch.
+        multiple: Padding multiple used by the model (64 for LightenDiffusion).
+        indices: Optional subset of dataset indices to sample from.
+    """
+
+    def __init__(self, sizes, batch_size, multiple=64, indices=None, drop_last=False):
+        super().__init__(None)
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+
+        self.buckets = OrderedDict()
+        for index in (range(len(sizes)) if indices is None else indices):
+            h, w = sizes[index]
+            self.buckets.setdefault(padded_shape(h, w, multiple), []).append(index)
+
+    def __iter__(self):
+        for bucket in self.buckets.values():
+            for start in range(0, len(bucket), self.batch_size):
+                batch = bucket[start:start + self.batch_size]
+                if len(batch) < self.batch_size and self.drop_last:
+                    continue
+                yield batch
+
+    def __len__(self):
+        if self.drop_last:
+            return sum(len(bucket) // self.batch_size for bucket in self.buckets.values())
+        return sum(math.ceil(len(bucket) / self.batch_size) for bucket in self.buckets.values())
+
+
+def pad_collate(batch, multiple=64):
+    """
+    Collate (image, img_id) items of different sizes by reflect-padding them to their common
+    padded shape. Returns (x, img_ids, sizes) where sizes[k] is the original (h, w) of item k.
+    """
+    images, img_ids = zip(*batch)
+    sizes = torch.tensor([img.shape[-2:] for img in images], dtype=torch.long)
+    pad_h, pad_w = padded_shape(int(sizes[:, 0].max()), int(sizes[:, 1].max()), multiple)
+
+    padded = []
+    for img in images:
+        h, w = img.shape[-2:]
+        pad = (0, pad_w - w, 0, pad_h - h)
+        mode = 'reflect' if pad_h - h < h and pad_w - w < w else 'replicate'
+        padded.append(F.pad(img.unsqueeze(0), pad, mode=mode).squeeze(0))
+    return torch.stack(padded, dim=0), list(img_ids), sizes
+
+
+def unpack_batch(batch):
+    """Accept both (x, img_ids) and pad_collate's (x, img_ids, sizes) batches."""
+    if len(batch) == 3:
+        return batch
+    x, img_ids = batch
+    sizes = torch.tensor([list(x.shape[-2:])] * x.shape[0], dtype=torch.long)
+    return x, img_ids, sizes
@@ -0,0 +1,159 @@
+import os
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import torch
+import torch.utils.data
+from PIL import Image
+from datasets.data_augment import get_pair_transforms
+
+
+def list_shards(source):
+    """
+    Resolve a streaming source into an ordered list of list files.
+
+    Args:
+        source: Either a single pair list file or a directory of `*.txt` shard files.
+
+    Returns:
+        shards (list): Sorted shard paths.
+    """
+    if os.path.isdir(source):
+        with os.scandir(source) as it:
+            shards = sorted(entry.path for entry in it
+                            if entry.is_file() and entry.name.endswith('.txt') and not entry.name.startswith('.'))
+        if not shards:
+            raise FileNotFoundError('No .txt shards found in {}'.format(source))
+        return shards
+    if not os.path.isfile(source):
+        raise FileNotFoundError('Pair list {} does not exist'.format(source))
+    return [source]
+
+
+def get_rank_and_world_size():
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    return 0, 1
+
+
+class StreamingPairDataset(torch.utils.data.IterableDataset):
+    """
+    Streams "low_path high_path" pairs from a list file or a directory of shards without
+    ever holding the full list in memory.
+
+    Every line is assigned to exactly one (rank, worker) shard by its position in the stream,
+    lines are shuffled through a bounded buffer seeded by (seed, epoch, shard), and images are
+    decoded ahead of time by a small thread pool. Since the per-shard order is deterministic,
+    resuming mid-epoch only has to skip list lines, not decode them.
+    """
+
+    def __init__(self, source, patch_size, batch_size, shuffle_buffer=10000, prefetch=16,
+                 num_threads=4, seed=0, train=True):
+        super().__init__()
+        self.source = source
+        self.shards = list_shards(source)
+        self.patch_size = patch_size
+        self.batch_size = batch_size
+        self.shuffle_buffer = shuffle_buffer
+        self.prefetch = prefetch
+        self.num_threads = num_threads
+        self.seed = seed
+        self.train = train
+        self.transforms = get_pair_transforms(patch_size, train)
+
+        self.epoch = 0
+        self.resume_batches = 0
+
+    def set_epoch(self, epoch):
+        if epoch != self.epoch:
+            self.resume_batches = 0
+        self.epoch = epoch
+
+    def state_dict(self, batches):
+        """
+        Position to save alongside a checkpoint after `batches` batches of the current epoch
+        have been consumed by this rank.
+        """
+        return {'epoch': self.epoch, 'batches': self.resume_batches + batches, 'seed': self.seed}
+
+    def load_state_dict(self, state):
+        self.epoch = state['epoch']
+        self.resume_batches = state['batches']
+        self.seed = state.get('seed', self.seed)
+
+    def _shard_info(self):
+        rank, world_size = get_rank_and_world_size()
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is None:
+            worker_id, num_workers = 0, 1
+        else:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+        return rank * num_workers + worker_id, world_size * num_workers, worker_id, num_workers
+
+    def _skip_samples(self, worker_id, num_workers):
+        # The DataLoader pulls whole batches from its workers round-robin, so after
+        # `resume_batches` batches worker w has produced ceil((resume_batches - w) / num_workers).
+        worker_batches = max(0, -(-(self.resume_batches - worker_id) // num_workers))
+        return worker_batches * self.batch_size
+
+    def _iter_lines(self):
+        shards = list(self.shards)
+        if self.train:
+            random.Random('{}-{}'.format(self.seed, self.epoch)).shuffle(shards)
+        for shard in shards:
+            with open(shard) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield line
+
+    def _iter_shard(self, shard_id, num_shards):
+        for i, line in enumerate(self._iter_lines()):
+            if i % num_shards == shard_id:
+                yield line
+
+    def _iter_shuffled(self, lines, rng):
+        if not self.train or self.shuffle_buffer <= 1:
+            yield from lines
+            return
+        buffer = []
+        for line in lines:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(line)
+                continue
+            k = rng.randrange(len(buffer))
+            yield buffer[k]
+            buffer[k] = line
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def get_images(self, line):
+        low_img_name, high_img_name = line.split(' ')[0], line.split(' ')[1]
+
+        img_id = low_img_name.split('/')[-1]
+        low_img, high_img = Image.open(low_img_name), Image.open(high_img_name)
+
+        low_img, high_img = self.transforms(low_img, high_img)
+
+        return torch.cat([low_img, high_img], dim=0), img_id
+
+    def __iter__(self):
+        shard_id, num_shards, worker_id, num_workers = self._shard_info()
+        rng = random.Random('{}-{}-{}'.format(self.seed, self.epoch, shard_id))
+
+        lines = self._iter_shuffled(self._iter_shard(shard_id, num_shards), rng)
+        for _ in range(self._skip_samples(worker_id, num_workers)):
+            if next(lines, None) is None:
+                return
+
+        pending = deque()
+        pool = ThreadPoolExecutor(max_workers=self.num_threads)
+        try:
+            for line in lines:
+                pending.append(pool.submit(self.get_images, line))
+                if len(pending) >= self.prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
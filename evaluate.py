@@ -3,8 +3,12 @@ import torch
 import models
 import datasets
 import utils
-from models import DenoisingDiffusion, DiffusiveRestoration
+from models import InferenceDiffusion, DiffusiveRestoration
+from models.ddm import unwrap_model
+from metrics import resolve_metrics
 from metrics_eval import evaluate_loader
+from models.cache import checkpoint_fingerprint, sampler_signature
+from results_store import ResultsStore, print_summary
 from utils.config_utils import parse_args_and_config
 
 def main():
@@ -12,6 +16,7 @@ def main():
     device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
     print("Using device:", device)
     config.device = device
+    metrics = resolve_metrics(args.metrics, args.paired)
 
     if torch.cuda.is_available():
         print("Note: Single GPU evaluation is supported.")
@@ -20,15 +25,42 @@ def main():
     DATASET = datasets.__dict__[config.data.type](config)
     _, val_loader = DATASET.get_loaders()
 
+    store = None
+    if args.results_db:
+        store = ResultsStore(args.results_db, {'checkpoint': checkpoint_fingerprint(args.resume),
+                                               'sampler': sampler_signature(config),
+                                               'dataset': config.data.val_dataset,
+                                               'val_resize': getattr(config.data, 'val_resize', True),
+                                               'paired': args.paired,
+                                               'parity': not args.fast_metrics})
+        val_dataset = val_loader.dataset
+        val_dataset.keyed_ids = True
+        done = store.done(required=metrics)
+        remaining = [i for i in range(len(val_dataset)) if val_dataset.image_key(i) not in done]
+        print("=> {} images already in {} (run {}), {} to evaluate".format(
+            len(val_dataset) - len(remaining), args.results_db, store.run_key, len(remaining)))
+        val_loader = DATASET.get_val_loader(val_dataset, indices=remaining)
+
     print("=> Creating denoising-diffusion model...")
-    diffusion = DenoisingDiffusion(args, config)
+    diffusion = InferenceDiffusion(args, config)
     restoration_model = DiffusiveRestoration(diffusion, args, config)
 
-    results = evaluate_loader(val_loader, restoration_model, device, is_paired=args.paired)
+    profiling = utils.profiling.profiling_from_config(args, config, unwrap_model(diffusion.model))
+    results = evaluate_loader(val_loader, restoration_model, device, is_paired=args.paired,
+                              parity=not args.fast_metrics, workers=args.metric_workers,
+                              queue_size=args.metric_queue, store=store,
+                              metrics=metrics, profiling=profiling)
+    if profiling is not None:
+        profiling.close()
     
     print("\nAverage Evaluation Metrics:")
     for metric, value in results.items():
         print(f"{metric}: {value:.4f}")
 
+    if store is not None:
+        print("\nAll stored results of this run:")
+        print_summary(store.aggregate())
+        store.close()
+
 if __name__ == '__main__':
     main()
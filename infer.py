@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import os
+import glob
+import time
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import torch
+import torchvision.transforms.functional as TF
+from PIL import Image
+import utils
+from datasets.sampler import padded_shape, pad_collate
+from models import InferenceDiffusion, DiffusiveRestoration
+from utils.config_utils import parse_args_and_config
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+
+def list_inputs(pattern):
+    if os.path.isdir(pattern):
+        with os.scandir(pattern) as it:
+            return sorted(e.path for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(p for p in glob.glob(pattern) if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_image(path):
+    with Image.open(path) as img:
+        return TF.to_tensor(img.convert('RGB')), path
+
+
+class FolderPipeline:
+    """
+    Three-stage inference pipeline: a decode pool reads images ahead of the model, images are
+    grouped by padded shape into batches of up to `batch_size`, and a writer pool encodes the
+    outputs. Decoded, batched and pending-write images are each bounded by `queue_size` so
+    memory stays flat on large folders.
+    """
+
+    def __init__(self, restoration, args):
+        self.restoration = restoration
+        self.args = args
+        self.root = None
+        self.write_slots = threading.BoundedSemaphore(args.queue_size)
+        self.model_time = 0.0
+        self.count = 0
+
+    def output_path(self, path):
+        """Output file of `path`, keeping its directories relative to the common root of the inputs."""
+        relative = os.path.relpath(path, self.root) if self.root else os.path.basename(path)
+        return os.path.join(self.args.image_folder, os.path.splitext(relative)[0] + '.' + self.args.format)
+
+    def plan_outputs(self, paths):
+        """Set the input root and refuse inputs that would write the same output file."""
+        self.root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else None
+        seen = {}
+        for path in paths:
+            output = self.output_path(os.path.abspath(path))
+            if output in seen:
+                raise ValueError("{} and {} would both be written to {}".format(seen[output], path, output))
+            seen[output] = path
+
+    def write(self, img, path):
+        try:
+            output = self.output_path(path)
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            utils.logging.encode_image(img, output, quality=self.args.quality,
+                                       compress_level=self.args.png_compress_level, lossless=self.args.lossless)
+        finally:
+            self.write_slots.release()
+
+    def run_batch(self, items, writer):
+        x, paths, sizes = pad_collate(items)
+        t1 = time.time()
+        with torch.no_grad():
+            pred_x = self.restoration.forward_sample(x, ids=list(paths)).cpu()
+        self.model_time += time.time() - t1
+        for k in range(pred_x.shape[0]):
+            h, w = sizes[k].tolist()
+            self.write_slots.acquire()
+            writer.submit(self.write, pred_x[k, :, :h, :w], paths[k])
+        self.count += len(items)
+        print(f"Processed {self.count} images")
+
+    def run(self, paths):
+        self.plan_outputs(paths)
+        buckets = OrderedDict()
+        pending = deque()
+        with ThreadPoolExecutor(self.args.decode_workers) as decoder, \
+                ThreadPoolExecutor(self.args.write_workers) as writer:
+            for path in paths:
+                pending.append(decoder.submit(load_image, path))
+                if len(pending) < self.args.queue_size:
+                    continue
+                self.add(pending.popleft().result(), buckets, writer)
+            while pending:
+                self.add(pending.popleft().result(), buckets, writer)
+            for items in buckets.values():
+                self.run_batch(items, writer)
+
+    def add(self, item, buckets, writer):
+        key = padded_shape(*item[0].shape[-2:])
+        bucket = buckets.setdefault(key, [])
+        bucket.append(item)
+        if len(bucket) >= self.args.batch_size:
+            self.run_batch(buckets.pop(key), writer)
+        elif sum(len(b) for b in buckets.values()) > self.args.queue_size:
+            # too many distinct shapes waiting: run the fullest partial batch
+            key = max(buckets, key=lambda k: len(buckets[k]))
+            self.run_batch(buckets.pop(key), writer)
+
+
+def main():
+    args, config = parse_args_and_config(mode="inference")
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    print("Using device:", device)
+    config.device = device
+
+    paths = list_inputs(args.input)
+    if not paths:
+        raise SystemExit(f"No images found for '{args.input}'")
+    print(f"=> Found {len(paths)} images")
+
+    print("=> Creating denoising-diffusion model...")
+    diffusion = InferenceDiffusion(args, config)
+    restoration_model = DiffusiveRestoration(diffusion, args, config)
+    restoration_model.warmup(batch_sizes=getattr(config.sampling, 'warmup_batch_sizes', None) or [1, args.batch_size])
+
+    os.makedirs(args.image_folder, exist_ok=True)
+    pipeline = FolderPipeline(restoration_model, args)
+    t1 = time.time()
+    pipeline.run(paths)
+    total = time.time() - t1
+    print(f"\n{pipeline.count} images in {total:.2f}s ({pipeline.count / total:.2f} img/s), "
+          f"model busy {100 * pipeline.model_time / total:.1f}% of the time")
+    print("Shape stats:", restoration_model.stats())
+
+
+if __name__ == '__main__':
+    main()
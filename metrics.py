@@ -1,10 +1,54 @@
 import numpy as np
-from skimage.metrics import peak_signal_noise_ratio, structural_similarity
-import lpips  # pip install lpips
 import torch
 
-# Create LPIPS model
-lpips_model = lpips.LPIPS(net='alex')
+# Metric names in display order. PI needs LPIPS and NIQE; PSNR and SSIM need ground truth
+# (unpaired LPIPS compares against the low image).
+METRICS = ('psnr', 'ssim', 'lpips', 'niqe', 'pi')
+METRIC_DEPENDENCIES = {'pi': ('lpips', 'niqe')}
+REFERENCE_METRICS = ('psnr', 'ssim')
+
+
+def build_lpips(device):
+    import lpips  # pip install lpips
+    model = lpips.LPIPS(net='alex')
+    return (model if device is None else model.to(device)).eval()
+
+
+def build_niqe(device):
+    import pyiqa
+    return pyiqa.create_metric('niqe_matlab', device=device)
+
+
+# Model-backed metrics are imported and instantiated on first use, once per device.
+BACKENDS = {'lpips': build_lpips, 'niqe': build_niqe}
+_backends = {}
+
+
+def get_backend(name, device=None):
+    """Shared instance of a metric backend on `device` (None: the backend's own default device)."""
+    key = (name, None if device is None else str(torch.device(device)))
+    if key not in _backends:
+        _backends[key] = BACKENDS[name](device)
+    return _backends[key]
+
+
+def resolve_metrics(names, is_paired=True):
+    """
+    Validate a list or comma separated string of metric names and add their dependencies.
+    Without ground truth, PSNR and SSIM are dropped. Returns the names in METRICS order.
+    """
+    if isinstance(names, str):
+        names = [n.strip().lower() for n in names.split(',') if n.strip()]
+    unknown = set(names) - set(METRICS)
+    if unknown:
+        raise ValueError("unknown metrics {}; choose from {}".format(sorted(unknown), ', '.join(METRICS)))
+    selected = set(names)
+    for name in names:
+        selected.update(METRIC_DEPENDENCIES.get(name, ()))
+    if not is_paired:
+        selected -= set(REFERENCE_METRICS)
+    return tuple(name for name in METRICS if name in selected)
+
 
 def to_numpy(image_tensor):
     # Convert a torch.Tensor of shape [C, H, W] in [0, 1] to a numpy array [H, W, C] in [0, 255] as uint8.
@@ -13,10 +57,12 @@ def to_numpy(image_tensor):
     return image_np
 
 def compute_psnr(gt, pred):
+    from skimage.metrics import peak_signal_noise_ratio
     # gt and pred are numpy arrays of shape [H, W, C] in uint8.
     return peak_signal_noise_ratio(gt, pred, data_range=255)
 
 def compute_ssim(gt, pred):
+    from skimage.metrics import structural_similarity
     # Use the new parameter channel_axis (set to -1) for multichannel images.
     return structural_similarity(gt, pred, data_range=255, channel_axis=-1, win_size=7)
 
@@ -29,7 +75,8 @@ def compute_lpips(gt, pred):
     # Normalize inputs from [0, 1] to [-1, 1]
     gt_norm = gt * 2 - 1
     pred_norm = pred * 2 - 1
-    # Move inputs to the same device as lpips_model.
+    # Move inputs to the same device as the LPIPS model.
+    lpips_model = get_backend('lpips')
     device = next(lpips_model.parameters()).device
     gt_norm = gt_norm.to(device)
     pred_norm = pred_norm.to(device)
@@ -37,13 +84,11 @@ def compute_lpips(gt, pred):
         dist = lpips_model(gt_norm, pred_norm)
     return dist.item()
 
-import pyiqa
-
 def compute_niqe(image_tensor):
     # image_tensor should be a torch.Tensor of shape [1, C, H, W] in [0, 1].
     if image_tensor.dim() == 3:
         image_tensor = image_tensor.unsqueeze(0)
-    niqe_metric = pyiqa.create_metric('niqe_matlab')
+    niqe_metric = get_backend('niqe')
     return niqe_metric(image_tensor).item()
 
 
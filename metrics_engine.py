@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+from collections import OrderedDict
+import torch
+import torch.nn.functional as F
+from metrics import get_backend
+
+
+def quantize_uint8(x):
+    """What `metrics.to_numpy` does to an image: clamp, scale to [0, 255] and truncate to uint8."""
+    return x.clamp(0, 1).mul(255).byte()
+
+
+def batch_psnr(gt, pred, data_range):
+    """PSNR of each image in a [B, C, H, W] batch, as skimage's peak_signal_noise_ratio."""
+    mse = (gt - pred).pow(2).flatten(1).mean(dim=1)
+    return 10 * torch.log10(data_range ** 2 / mse)
+
+
+def batch_ssim(gt, pred, data_range, win_size=7):
+    """
+    SSIM of each image in a [B, C, H, W] batch, as skimage's structural_similarity with
+    channel_axis set: uniform win_size x win_size window, sample covariance, the (win_size - 1) / 2
+    pixel border excluded from the mean and the channels averaged. A pooling without padding
+    yields exactly the windows skimage keeps after cropping that border.
+    """
+    pool = lambda x: F.avg_pool2d(x, win_size, stride=1)
+    cov_norm = win_size ** 2 / (win_size ** 2 - 1)
+    ux, uy = pool(gt), pool(pred)
+    vx = cov_norm * (pool(gt * gt) - ux * ux)
+    vy = cov_norm * (pool(pred * pred) - uy * uy)
+    vxy = cov_norm * (pool(gt * pred) - ux * uy)
+    c1, c2 = (0.01 * data_range) ** 2, (0.03 * data_range) ** 2
+    s = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux ** 2 + uy ** 2 + c1) * (vx + vy + c2))
+    return s.flatten(1).mean(dim=1)
+
+
+class MetricEngine:
+    """
+    Batched PSNR / SSIM / LPIPS / NIQE on tensors, with the LPIPS and NIQE models taken from the
+    lazy registry in metrics.py, on `device`. Images of the same size are evaluated together.
+
+    With `parity=True` (default) PSNR and SSIM are computed in float64 on uint8-truncated images
+    with data_range 255, which reproduces the skimage numbers of `metrics.compute_psnr` and
+    `metrics.compute_ssim`. With `parity=False` they use the float images directly. LPIPS and
+    NIQE always see the float images, as before.
+    """
+
+    def __init__(self, device, parity=True, metrics=('psnr', 'ssim', 'lpips', 'niqe')):
+        self.device = device
+        self.parity = parity
+        self.metrics = tuple(metrics)
+        self.lpips = get_backend('lpips', device) if 'lpips' in self.metrics else None
+        self.niqe = get_backend('niqe', device) if 'niqe' in self.metrics else None
+
+    def prepare(self, images):
+        if self.parity:
+            return quantize_uint8(images).double(), 255.0
+        return images.clamp(0, 1), 1.0
+
+    @torch.no_grad()
+    def compute_batch(self, preds, refs=None):
+        """
+        Args:
+            preds: [B, C, H, W] outputs in [0, 1].
+            refs: [B, C, H, W] references (ground truth, or the low image when unpaired), or None.
+        Returns:
+            dict of metric name -> list of B floats.
+        """
+        preds = preds.to(self.device).float()
+        refs = None if refs is None else refs.to(self.device).float()
+        results = {}
+        if refs is not None and ('psnr' in self.metrics or 'ssim' in self.metrics):
+            (p, data_range), (r, _) = self.prepare(preds), self.prepare(refs)
+            if 'psnr' in self.metrics:
+                results['psnr'] = batch_psnr(r, p, data_range).tolist()
+            if 'ssim' in self.metrics:
+                results['ssim'] = batch_ssim(r, p, data_range).tolist()
+        if refs is not None and self.lpips is not None:
+            results['lpips'] = self.lpips(refs * 2 - 1, preds * 2 - 1).flatten().tolist()
+        if self.niqe is not None:
+            results['niqe'] = self.niqe(preds).flatten().tolist()
+        return results
+
+    def compute(self, preds, refs=None):
+        """
+        Metrics of a list of [C, H, W] images of any sizes; `refs` is a matching list or None.
+        Returns one dict per image, in input order.
+        """
+        groups = OrderedDict()
+        for k, pred in enumerate(preds):
+            groups.setdefault(tuple(pred.shape), []).append(k)
+        per_image = [dict() for _ in preds]
+        for members in groups.values():
+            batch_refs = None if refs is None else torch.stack([refs[k] for k in members])
+            results = self.compute_batch(torch.stack([preds[k] for k in members]), batch_refs)
+            for name, values in results.items():
+                for k, value in zip(members, values):
+                    per_image[k][name] = value
+        return per_image
@@ -1,88 +1,129 @@
 #!/usr/bin/env python3
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import numpy as np
 import torch.nn.functional as F
-from metrics import to_numpy, compute_psnr, compute_ssim, compute_lpips, compute_niqe, compute_pi
+from metrics import METRICS, compute_pi, resolve_metrics
+from metrics_engine import MetricEngine
+from datasets.sampler import unpack_batch
 import utils
 
-def evaluate_loader(val_loader, restoration_model, device, is_paired=True):
+def score_batch(engine, preds, refs, names, save_dir):
+    """Save and score the outputs of one batch; returns one record per image, in batch order."""
+    scores = engine.compute(preds, refs)
+    records = []
+    for k, name in enumerate(names):
+        utils.logging.save_image(preds[k], os.path.join(save_dir, f"{name}"))
+        record = dict(scores[k], name=name)
+        if 'pi' in engine.metrics:
+            record['pi'] = compute_pi(record['lpips'], record['niqe'])
+        records.append(record)
+    return records
+
+
+class MetricTotals:
+    FORMATS = {'psnr': '.2f'}
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.totals = {name: 0.0 for name in metrics}
+        self.count = 0
+
+    def add(self, record):
+        print(f"Processed image {record['name']}")
+        print(f"[{record['name']}] " + ", ".join(
+            f"{name.upper()}={record[name]:{self.FORMATS.get(name, '.4f')}}" for name in self.metrics))
+        for name in self.metrics:
+            self.totals[name] += record[name]
+        self.count += 1
+
+    def results(self):
+        if self.count == 0:
+            return {}
+        return {name.upper(): total / self.count for name, total in self.totals.items()}
+
+
+def evaluate_loader(val_loader, restoration_model, device, is_paired=True, parity=True, workers=0, queue_size=8,
+                    store=None, metrics=METRICS, profiling=None):
     """
     Evaluate the restoration model on a validation DataLoader.
     Uses the forward_sample() method of DiffusiveRestoration for processing.
 
     Args:
-        val_loader: DataLoader yielding (x, y) with x of shape [B, 6, H, W].
+        val_loader: DataLoader yielding (x, y) or (x, y, sizes) with x of shape [B, 6, H, W].
         restoration_model: Instance of DiffusiveRestoration.
         device: torch.device for computation.
         is_paired: Boolean flag; if True, ground-truth is available.
-        
+        parity: Compute PSNR/SSIM on uint8-truncated images, matching the skimage numbers.
+        workers: Threads that save and score outputs while the model runs the next batch
+            (0: score inline).
+        queue_size: Maximum batches waiting for the workers; inference blocks beyond that.
+        store: Optional ResultsStore receiving every per-image record as it is aggregated.
+        metrics: Metric names (see metrics.METRICS); dependencies are added and PSNR/SSIM are
+            dropped for unpaired data. Unused metric backends are never loaded.
+        profiling: Optional utils.profiling.Profiling session, stepped after every batch.
+
     Returns:
         results (dict): Dictionary of average metrics.
     """
-    psnr_total, ssim_total, lpips_total = 0.0, 0.0, 0.0
-    niqe_total, pi_total = 0.0, 0.0
-    count = 0
+    metrics = resolve_metrics(metrics, is_paired)
+    totals = MetricTotals(metrics)
+    engine = MetricEngine(device, parity=parity, metrics=metrics)
+    pool = ThreadPoolExecutor(workers) if workers > 0 else None
+    # results are consumed in submission order, so the log and totals do not depend on timing
+    pending = deque()
+
+    def consume(records):
+        for record in records:
+            totals.add(record)
+            if store is not None:
+                store.add(record, commit=False)
+        if store is not None:
+            store.commit()
 
     restoration_model.diffusion.model.eval()
-    with torch.no_grad():
-        for i, (x, y) in enumerate(val_loader):
-            print(f"evaluating {i+1}/{len(val_loader)}...")
-            # x is expected to be [B, 6, H, W]. For paired data, gt is the last 3 channels.
-            low_img = x[:, :3, :, :].to(device)
-            if is_paired:
-                gt_img = x[:, 3:, :, :].to(device)
-            else:
-                gt_img = None
-
-            # Debug prints
-            #print(f"x shape: {x.shape}, y: {y}")
-            #print(f"low_img shape: {low_img.shape}")
-
-            b, c, h, w = low_img.shape
-            if c != 3:
-                print(f"Warning: Expected 3 channels in low image, got {c}. Skipping sample {y[0]}.")
-                continue
-
-            # Use the shared forward_sample method to get the prediction.
-            pred_img = restoration_model.forward_sample(x)
-            
-            # Save the restored image.
-            save_dir = os.path.join(restoration_model.args.image_folder, restoration_model.config.data.val_dataset)
-            os.makedirs(save_dir, exist_ok=True)
-            save_path = os.path.join(save_dir, f"{y[0]}")
-            utils.logging.save_image(pred_img, save_path)
-            print(f"Processed image {y[0]}")
-
-            # Compute metrics.
-            if is_paired:
-                gt_np = to_numpy(gt_img[0])
-                pred_np = to_numpy(pred_img[0])
-                psnr = compute_psnr(gt_np, pred_np)
-                ssim = compute_ssim(gt_np, pred_np)
-                lpips_val = compute_lpips(gt_img[0], pred_img[0])
-                psnr_total += psnr
-                ssim_total += ssim
-                lpips_total += lpips_val
-                print(f"[{y[0]}] Supervised: PSNR={psnr:.2f}, SSIM={ssim:.4f}, LPIPS={lpips_val:.4f}", end=", ")
-            else:
-                lpips_val = compute_lpips(low_img[0], pred_img[0])
-                print(f"[{y[0]}] Unpaired: LPIPS={lpips_val:.4f}", end=", ")
-            
-            niqe_val = compute_niqe(pred_img[0])
-            pi_val = compute_pi(lpips_val, niqe_val)
-            print(f"NIQE={niqe_val:.4f}, PI={pi_val:.4f}")
-            
-            niqe_total += niqe_val
-            pi_total += pi_val
-            count += 1
-
-    results = {}
-    if count > 0:
-        if is_paired:
-            results["PSNR"] = psnr_total / count
-            results["SSIM"] = ssim_total / count
-            results["LPIPS"] = lpips_total / count
-        results["NIQE"] = niqe_total / count
-        results["PI"] = pi_total / count
-    return results
+    save_dir = os.path.join(restoration_model.args.image_folder, restoration_model.config.data.val_dataset)
+    os.makedirs(save_dir, exist_ok=True)
+    try:
+        with torch.no_grad():
+            for i, batch in enumerate(val_loader):
+                print(f"evaluating {i+1}/{len(val_loader)}...")
+                # x is expected to be [B, 6, H, W]. For paired data, gt is the last 3 channels.
+                x, y, sizes = unpack_batch(batch)
+                low_img = x[:, :3, :, :].to(device)
+                if is_paired:
+                    gt_img = x[:, 3:, :, :].to(device)
+                else:
+                    gt_img = None
+
+                b, c, h, w = low_img.shape
+                if c != 3:
+                    print(f"Warning: Expected 3 channels in low image, got {c}. Skipping samples {list(y)}.")
+                    continue
+
+                # Use the shared forward_sample method to get the prediction.
+                pred_img = restoration_model.forward_sample(x, ids=list(y))
+                if profiling is not None:
+                    profiling.step()
+
+                crops = [tuple(sizes[k].tolist()) for k in range(b)]
+                preds = [pred_img[k, :, :img_h, :img_w] for k, (img_h, img_w) in enumerate(crops)]
+                # unpaired data is scored against the low image (LPIPS only)
+                ref_img = gt_img if is_paired else low_img
+                refs = [ref_img[k, :, :img_h, :img_w] for k, (img_h, img_w) in enumerate(crops)]
+
+                if pool is None:
+                    consume(score_batch(engine, preds, refs, list(y), save_dir))
+                    continue
+                pending.append(pool.submit(score_batch, engine, preds, refs, list(y), save_dir))
+                while len(pending) > queue_size or (pending and pending[0].done()):
+                    consume(pending.popleft().result())
+            while pending:
+                consume(pending.popleft().result())
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    return totals.results()
@@ -1,2 +1,3 @@
 from models.ddm import *
 from models.restoration import *
+from models.inference import *
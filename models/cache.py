@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import torch
+
+_fingerprints = {}
+
+
+def checkpoint_fingerprint(path):
+    """sha256 of a checkpoint file, memoized per (path, size, mtime) for the life of the process."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _fingerprints:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _fingerprints[memo_key] = digest.hexdigest()
+    return _fingerprints[memo_key]
+
+
+def sampler_signature(config):
+    """Every setting that changes the sampler output for a given input and checkpoint."""
+    diffusion = config.diffusion
+    return {'beta_schedule': diffusion.beta_schedule,
+            'beta_start': diffusion.beta_start,
+            'beta_end': diffusion.beta_end,
+            'num_diffusion_timesteps': diffusion.num_diffusion_timesteps,
+            'num_sampling_timesteps': diffusion.num_sampling_timesteps,
+            'seed': getattr(config.sampling, 'seed', None),
+            'ema': getattr(config.sampling, 'ema', False),
+            # the folded update of the static engine rounds differently from the eager loop
+            'static_engine': getattr(config.sampling, 'static_engine', False),
+            # fused GroupNorm+swish, channels_last and compiled kernels round differently too
+            'execution': getattr(config.sampling, 'execution', 'eager'),
+            # the planner's padding is seen by global attention, and its resizing changes the output
+            'canonical_shapes': sorted([int(v) for v in shape] for shape in
+                                       getattr(config.sampling, 'canonical_shapes', None) or []) or None,
+            'max_pad_ratio': getattr(config.sampling, 'max_pad_ratio', 0.25),
+            'max_downscale': getattr(config.sampling, 'max_downscale', 0.15),
+            'deepcache_interval': getattr(config.sampling, 'deepcache_interval', 1) or 1,
+            'deepcache_level': getattr(config.sampling, 'deepcache_level', 1),
+            'quantized': getattr(config.sampling, 'quantized', None),
+            'backend': getattr(config.sampling, 'backend', 'torch'),
+            'eta': getattr(config.sampling, 'eta', 0.),
+            'precision': getattr(config.sampling, 'precision', 'fp32'),
+            'tile_size': getattr(config.sampling, 'tile_size', 0) or 0,
+            'tile_overlap': getattr(config.sampling, 'tile_overlap', 64),
+            # SDPA kernels accumulate in a different order than the bmm/softmax reference
+            'attention': getattr(config.sampling, 'attention', 'math'),
+            'routing': None if not getattr(config.sampling, 'routing', False) else
+            {'dim': getattr(config.sampling, 'route_dim', 0.25), 'bright': getattr(config.sampling, 'route_bright', 0.45),
+             'bright_action': getattr(config.sampling, 'route_bright_action', 'passthrough'),
+             'reduced_steps': getattr(config.sampling, 'route_reduced_steps', 5)}}
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk store of enhanced images with a size budget and LRU eviction.
+
+    Keys are sha256 digests of the input pixels plus a context string (checkpoint fingerprint
+    and sampler signature), so a changed checkpoint or sampler setting never returns stale
+    results. Recency is kept in the file mtimes, which lets the LRU order survive restarts.
+    """
+
+    def __init__(self, directory, max_bytes, context):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.context = json.dumps(context, sort_keys=True).encode()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith('.pt'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, entry.name[:-3], st.st_size))
+        self.entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self.total_bytes = sum(self.entries.values())
+
+    def key(self, image):
+        image = image.detach().cpu().contiguous()
+        digest = hashlib.sha256(self.context)
+        digest.update('{}{}'.format(tuple(image.shape), image.dtype).encode())
+        digest.update(image.numpy().tobytes())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pt')
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(self.path(key))
+            return torch.load(self.path(key), map_location='cpu')
+        except (OSError, RuntimeError, EOFError):
+            # evicted or corrupted underneath us: treat as a miss
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put(self, key, output):
+        path = self.path(key)
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        torch.save(output.detach().cpu().clone(), tmp_path)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries),
+                'bytes': self.total_bytes}
@@ -6,8 +6,10 @@ import torch.nn as nn
 import torch.backends.cudnn as cudnn
 import torch.nn.functional as F
 import utils
+from datasets.sampler import unpack_batch
 from models.unet import DiffusionUNet
 from models.decom import CTDN
+from models.sampling_engine import StaticDDIMSampler
 
 
 class EMAHelper(object):
@@ -55,6 +57,10 @@ class EMAHelper(object):
         self.shadow = state_dict
 
 
+def unwrap_model(model):
+    return model.module if isinstance(model, nn.DataParallel) else model
+
+
 def get_beta_schedule(beta_schedule, *, beta_start, beta_end, num_diffusion_timesteps):
     def sigmoid(x):
         return 1 / (np.exp(-x) + 1)
@@ -99,6 +105,9 @@ class Net(nn.Module):
 
         self.betas = torch.from_numpy(betas).float()
         self.num_timesteps = self.betas.shape[0]
+        # set by models.optimize.optimize_for_inference
+        self.channels_last = False
+        self.static_sampler = None
 
     @staticmethod
     def compute_alpha(beta, t):
@@ -108,35 +117,98 @@ class Net(nn.Module):
 
     @staticmethod
     def load_stage1(model, model_dir):
-        checkpoint = utils.logging.load_checkpoint(os.path.join(model_dir, 'stage1_weight.pth.tar'), 'cuda')
+        # the model is moved to its device afterwards
+        checkpoint = utils.logging.load_checkpoint(os.path.join(model_dir, 'stage1_weight.pth.tar'), 'cpu')
         model.load_state_dict(checkpoint['model'], strict=True)
         return model
 
-    def sample_training(self, x_cond, b, eta=0.):
-        skip = self.config.diffusion.num_diffusion_timesteps // self.config.diffusion.num_sampling_timesteps
+    def sampling_timesteps(self, steps=None):
+        """DDIM (t, next_t) pairs in the order they are visited, from noise to t = 0."""
+        steps = steps or self.config.diffusion.num_sampling_timesteps
+        skip = self.config.diffusion.num_diffusion_timesteps // steps
         seq = range(0, self.config.diffusion.num_diffusion_timesteps, skip)
-        n, c, h, w = x_cond.shape
         seq_next = [-1] + list(seq[:-1])
-        x = torch.randn(n, c, h, w, device=self.device)
+        return list(zip(reversed(seq), reversed(seq_next)))
+
+    def encode(self, x):
+        """Low image [B, 3(+3), H, W] -> (normalized diffusion condition, decoder skips)."""
+        low_fea, skips = self.decom.ReconNet.encode(x[:, :3, ...])
+        return utils.data_transform(low_fea), skips
+
+    def decode(self, pred_fea, skips):
+        """Sampled latent in [-1, 1] -> enhanced image, reusing the encoder skips."""
+        return self.decom.ReconNet.decode(utils.inverse_data_transform(pred_fea), skips)
+
+    def sample_noise(self, shape, generators=None):
+        """
+        Standard normal noise of `shape`. With one torch.Generator per sample the draw for each
+        sample depends only on its own seed, not on the batch it happens to be part of.
+        """
+        if generators is None:
+            return torch.randn(shape, device=self.device)
+        return torch.stack([torch.randn(shape[1:], generator=g) for g in generators], dim=0).to(self.device)
+
+    def deepcache(self):
+        """(reuse interval, cache level) of DeepCache-style feature reuse; an interval <= 1 disables it."""
+        interval = getattr(self.config.sampling, 'deepcache_interval', 1) or 1
+        return interval, getattr(self.config.sampling, 'deepcache_level', 1)
+
+    def unet_step(self, x, t, step, deep=None):
+        """
+        UNet call of sampling step `step`. With `sampling.deepcache_interval` N > 1 (inference only),
+        the deep features are recomputed every N steps and reused in between. Returns (et, deep).
+        """
+        interval, level = self.deepcache()
+        if interval <= 1 or torch.is_grad_enabled():
+            return self.Unet(x, t), None
+        return self.Unet.forward_cached(x, t, level, None if step % interval == 0 else deep)
+
+    def get_static_sampler(self, b, eta):
+        """
+        The static sampler of the current settings. It bakes in the timestep schedule, the folded
+        coefficients and the CUDA graph choice, so it is rebuilt whenever any of them changes.
+        """
+        # a captured graph cannot switch between full and cached UNet passes
+        cuda_graph = getattr(self.config.sampling, 'cuda_graph', False) and self.deepcache()[0] <= 1
+        key = (b.device, eta, tuple(self.sampling_timesteps()), self.deepcache(), cuda_graph)
+        sampler = self.static_sampler
+        if sampler is None or sampler.key != key:
+            sampler = StaticDDIMSampler(self, b, eta=eta, cuda_graph=cuda_graph)
+            sampler.key = key
+            self.static_sampler = sampler
+        return sampler
+
+    def sample_training(self, x_cond, b, eta=0., seed=None, steps=None):
+        n, c, h, w = x_cond.shape
+        generators = None if seed is None else [torch.Generator().manual_seed(seed) for _ in range(n)]
+        x = self.sample_noise((n, c, h, w), generators)
+        # the static engine is built for num_sampling_timesteps; other step counts run the regular loop
+        if steps is None and not torch.is_grad_enabled() and getattr(self.config.sampling, 'static_engine', False):
+            return self.get_static_sampler(b, eta).sample(x_cond, x, lambda: self.sample_noise(x.shape, generators))
+
         xs = [x]
-        for i, j in zip(reversed(seq), reversed(seq_next)):
+        deep = None
+        for step, (i, j) in enumerate(self.sampling_timesteps(steps)):
             t = (torch.ones(n) * i).to(x.device)
             next_t = (torch.ones(n) * j).to(x.device)
             at = self.compute_alpha(b, t.long())
             at_next = self.compute_alpha(b, next_t.long())
             xt = xs[-1].to(x.device)
 
-            et = self.Unet(torch.cat([x_cond, xt], dim=1), t)
+            et, deep = self.unet_step(torch.cat([x_cond, xt], dim=1), t, step, deep)
             x0_t = (xt - et * (1 - at).sqrt()) / at.sqrt()
 
             c1 = eta * ((1 - at / at_next) * (1 - at_next) / (1 - at)).sqrt()
             c2 = ((1 - at_next) - c1 ** 2).sqrt()
-            xt_next = at_next.sqrt() * x0_t + c1 * torch.randn_like(x) + c2 * et
+            xt_next = at_next.sqrt() * x0_t + c2 * et
+            if eta > 0:
+                xt_next = xt_next + c1 * self.sample_noise(x.shape, generators)
             xs.append(xt_next.to(x.device))
 
         return xs[-1]
 
-    def forward(self, inputs):
+    def forward(self, inputs, steps=None):
+        """At inference `steps` overrides num_sampling_timesteps; 0 skips diffusion and decodes the condition."""
         data_dict = {}
 
         b = self.betas.to(inputs.device)
@@ -170,14 +242,17 @@ class Net(nn.Module):
             data_dict["reference_fea"] = reference_fea
 
         else:
-            output = self.decom(inputs, pred_fea=None)
-            low_fea = output["low_fea"]
-            low_condition_norm = utils.data_transform(low_fea)
+            if self.channels_last:
+                inputs = inputs.contiguous(memory_format=torch.channels_last)
+            # only the low branch is needed at inference; its pyramid doubles as the decoder skips
+            low_condition_norm, skips = self.encode(inputs)
 
-            pred_fea = self.sample_training(low_condition_norm, b)
-            pred_fea = utils.inverse_data_transform(pred_fea)
-            pred_x = self.decom(inputs, pred_fea=pred_fea)["pred_img"]
-            data_dict["pred_x"] = pred_x
+            if steps == 0:
+                pred_fea = low_condition_norm
+            else:
+                pred_fea = self.sample_training(low_condition_norm, b, eta=getattr(self.config.sampling, 'eta', 0.),
+                                                seed=getattr(self.config.sampling, 'seed', None), steps=steps)
+            data_dict["pred_x"] = self.decode(pred_fea, skips)
 
         return data_dict
 
@@ -206,15 +281,25 @@ class DenoisingDiffusion(object):
         checkpoint = utils.logging.load_checkpoint(load_path, None)
         self.model.load_state_dict(checkpoint['state_dict'], strict=True)
         if ema:
+            self.ema_helper.load_state_dict(checkpoint['ema_helper'])
             self.ema_helper.ema(self.model)
         print("=> loaded checkpoint {} step {}".format(load_path, self.step))
+        return checkpoint
 
     def train(self, DATASET):
         cudnn.benchmark = True
         train_loader, val_loader = DATASET.get_loaders()
 
         if os.path.isfile(self.args.resume):
-            self.load_ddm_ckpt(self.args.resume)
+            checkpoint = self.load_ddm_ckpt(self.args.resume)
+            if 'data_state' in checkpoint and hasattr(train_loader.dataset, 'load_state_dict'):
+                # resume a streaming epoch from the position it was saved at
+                self.start_epoch, self.step = checkpoint['data_state']['epoch'], checkpoint['step']
+                self.optimizer.load_state_dict(checkpoint['optimizer'])
+                self.ema_helper.load_state_dict(checkpoint['ema_helper'])
+                train_loader.dataset.load_state_dict(checkpoint['data_state'])
+
+        profiling = utils.profiling.profiling_from_config(self.args, self.config, unwrap_model(self.model))
 
         for name, param in self.model.named_parameters():
             if "decom" in name:
@@ -224,6 +309,8 @@ class DenoisingDiffusion(object):
 
         for epoch in range(self.start_epoch, self.config.training.n_epochs):
             print('epoch: ', epoch)
+            if hasattr(train_loader.dataset, 'set_epoch'):
+                train_loader.dataset.set_epoch(epoch)
             data_start = time.time()
             data_time = 0
             for i, (x, y) in enumerate(train_loader):
@@ -249,21 +336,29 @@ class DenoisingDiffusion(object):
                 loss.backward()
                 self.optimizer.step()
                 self.ema_helper.update(self.model)
+                if profiling is not None:
+                    profiling.step()
                 data_start = time.time()
 
                 if self.step % self.config.training.validation_freq == 0 and self.step != 0:
                     self.model.eval()
                     self.sample_validation_patches(val_loader, self.step)
 
-                    utils.logging.save_checkpoint({'step': self.step,
-                                                   'epoch': epoch + 1,
-                                                   'state_dict': self.model.state_dict(),
-                                                   'optimizer': self.optimizer.state_dict(),
-                                                   'ema_helper': self.ema_helper.state_dict(),
-                                                   'params': self.args,
-                                                   'config': self.config},
+                    state = {'step': self.step,
+                             'epoch': epoch + 1,
+                             'state_dict': self.model.state_dict(),
+                             'optimizer': self.optimizer.state_dict(),
+                             'ema_helper': self.ema_helper.state_dict(),
+                             'params': self.args,
+                             'config': self.config}
+                    if hasattr(train_loader.dataset, 'state_dict'):
+                        state['data_state'] = train_loader.dataset.state_dict(batches=i + 1)
+                    utils.logging.save_checkpoint(state,
                                                   filename=os.path.join(self.config.data.ckpt_dir, 'model_latest'))
 
+        if profiling is not None:
+            profiling.close()
+
     def noise_estimation_loss(self, output):
         pred_fea, reference_fea = output["pred_fea"], output["reference_fea"]
         noise_output, e = output["noise_output"], output["e"]
@@ -281,11 +376,15 @@ class DenoisingDiffusion(object):
 
         with torch.no_grad():
             print('Performing validation at step: {}'.format(step))
-            for i, (x, y) in enumerate(val_loader):
+            for i, batch in enumerate(val_loader):
+                x, y, sizes = unpack_batch(batch)
                 b, _, img_h, img_w = x.shape
 
                 img_h_64 = int(64 * np.ceil(img_h / 64.0))
                 img_w_64 = int(64 * np.ceil(img_w / 64.0))
                 x = F.pad(x, (0, img_w_64 - img_w, 0, img_h_64 - img_h), 'reflect')
-                pred_x = self.model(x.to(self.device))["pred_x"][:, :, :img_h, :img_w]
-                utils.logging.save_image(pred_x, os.path.join(image_folder, str(step), '{}'.format(y[0])))
+                pred_x = self.model(x.to(self.device))["pred_x"]
+                for k in range(b):
+                    h, w = sizes[k].tolist()
+                    utils.logging.save_image(pred_x[k, :, :h, :w],
+                                             os.path.join(image_folder, str(step), '{}'.format(y[k])))
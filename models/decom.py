@@ -158,32 +158,42 @@ class ReconNet(nn.Module):
 
         self.relu = nn.LeakyReLU()
 
+    def encode(self, x):
+        """
+        Encode a 3-channel image into the 3-channel latent used by the diffusion model,
+        together with the pyramid features the decoder reuses as skips.
+        """
+        low_fea_down2, low_fea_down4, low_fea_down8 = self.pyramid(x)
+        return self.channel_down(low_fea_down8), (low_fea_down2, low_fea_down4, low_fea_down8)
+
+    def decode(self, pred_fea, skips):
+        low_fea_down2, low_fea_down4, low_fea_down8 = skips
+
+        pred_fea = self.channel_up(pred_fea)
+
+        pred_fea_up2 = self.up_sampling0(
+            self.block_up1(self.block_up0(pred_fea) + low_fea_down8))
+        pred_fea_up4 = self.up_sampling1(
+            self.block_up3(self.block_up2(pred_fea_up2) + low_fea_down4))
+        pred_fea_up8 = self.up_sampling2(
+            self.block_up5(self.block_up4(pred_fea_up4) + low_fea_down2))
+
+        pred_img = self.conv3(self.relu(self.conv2(pred_fea_up8)))
+
+        return pred_img
+
     def forward(self, x, pred_fea=None):
 
         if pred_fea is None:
-            low_fea_down2, low_fea_down4, low_fea_down8 = self.pyramid(x[:, :3, ...])
-            low_fea_down8 = self.channel_down(low_fea_down8)
-
-            high_fea_down2, high_fea_down4, high_fea_down8 = self.pyramid(x[:, 3:, ...])
-            high_fea_down8 = self.channel_down(high_fea_down8)
+            low_fea_down8, _ = self.encode(x[:, :3, ...])
+            high_fea_down8, _ = self.encode(x[:, 3:, ...])
 
             return low_fea_down8, high_fea_down8
         else:
             # =================low ori decoder=================
-            low_fea_down2, low_fea_down4, low_fea_down8 = self.pyramid(x[:, :3, ...])
-
-            pred_fea = self.channel_up(pred_fea)
-
-            pred_fea_up2 = self.up_sampling0(
-                self.block_up1(self.block_up0(pred_fea) + low_fea_down8))
-            pred_fea_up4 = self.up_sampling1(
-                self.block_up3(self.block_up2(pred_fea_up2) + low_fea_down4))
-            pred_fea_up8 = self.up_sampling2(
-                self.block_up5(self.block_up4(pred_fea_up4) + low_fea_down2))
-
-            pred_img = self.conv3(self.relu(self.conv2(pred_fea_up8)))
+            _, skips = self.encode(x[:, :3, ...])
 
-            return pred_img
+            return self.decode(pred_fea, skips)
 
 
 class Self_Attention(nn.Module):
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import os
+import argparse
+import torch
+import utils
+from models.ddm import Net
+
+SLIM_DTYPES = {'fp32': torch.float32, 'fp16': torch.float16, 'bf16': torch.bfloat16}
+
+
+def read_checkpoint(path):
+    """torch.load to CPU, memory-mapped where supported so unused entries (optimizer state) are never read."""
+    try:
+        return torch.load(path, map_location='cpu', mmap=True, weights_only=False)
+    except (TypeError, RuntimeError):
+        # torch < 2.1, or a checkpoint in the legacy (non-zip) format
+        return torch.load(path, map_location='cpu')
+
+
+def inference_state_dict(checkpoint, ema=False):
+    """Model weights of a training checkpoint without the DataParallel prefix, optionally with the EMA weights."""
+    state_dict = {k[len('module.'):] if k.startswith('module.') else k: v
+                  for k, v in checkpoint['state_dict'].items()}
+    if ema:
+        if 'ema_helper' not in checkpoint:
+            raise ValueError("checkpoint has no EMA weights")
+        state_dict.update(checkpoint['ema_helper'])
+    return state_dict
+
+
+def export_slim_checkpoint(resume, output, ema=False, stage1=None, dtype='fp32'):
+    """
+    Write the inference weights of a training checkpoint as one safetensors file: EMA weights
+    folded in on request, the CTDN weights optionally replaced by a stage-1 checkpoint (stage-2
+    checkpoints already contain them), and floating point weights cast to `dtype`.
+    """
+    checkpoint = read_checkpoint(resume)
+    state_dict = inference_state_dict(checkpoint, ema)
+    if stage1:
+        state_dict.update({'decom.' + k: v for k, v in read_checkpoint(stage1)['model'].items()})
+    state_dict = {k: v.to(SLIM_DTYPES[dtype]) if v.is_floating_point() else v for k, v in state_dict.items()}
+    metadata = {'source': os.path.basename(resume), 'step': checkpoint.get('step', 0), 'ema': ema,
+                'stage1': os.path.basename(stage1) if stage1 else '', 'dtype': dtype}
+    utils.slim_checkpoint.save_tensors(output, state_dict, metadata)
+
+
+class InferenceDiffusion(object):
+    """
+    Inference-only stand-in for `DenoisingDiffusion`, with the attributes `DiffusiveRestoration`
+    uses (args, config, device, model, load_ddm_ckpt). It holds a bare `Net` in eval mode: no
+    DataParallel, optimizer or EMA shadow. The net is built on the meta device and the
+    checkpoint tensors are assigned to it, so the weights are never allocated twice. Accepts
+    training checkpoints and slim `.safetensors` exports.
+    """
+
+    def __init__(self, args, config):
+        self.args = args
+        self.config = config
+        self.device = config.device
+        self.step = 0
+
+        if os.path.isfile(getattr(args, 'resume', '')):
+            try:
+                with torch.device('meta'):
+                    self.model = Net(args, config)
+                self.on_meta = True
+            except (AttributeError, TypeError):
+                # torch < 2.0 cannot construct modules on the meta device
+                self.model = Net(args, config)
+                self.on_meta = False
+        else:
+            self.model = Net(args, config).to(self.device)
+            self.on_meta = False
+        self.model.eval().requires_grad_(False)
+
+    def load_ddm_ckpt(self, load_path, ema=False):
+        if load_path.endswith('.safetensors'):
+            return self.load_slim_ckpt(load_path, ema)
+        checkpoint = read_checkpoint(load_path)
+        self.load_state_dict(inference_state_dict(checkpoint, ema))
+        self.step = checkpoint.get('step', 0)
+        print("=> loaded checkpoint {} step {}{}".format(load_path, self.step, " (EMA weights)" if ema else ""))
+        return checkpoint
+
+    def load_slim_ckpt(self, load_path, ema=False):
+        state_dict, metadata = utils.slim_checkpoint.load_tensors(load_path, device=self.device)
+        if ema and metadata.get('ema') != 'True':
+            raise ValueError("{} was exported without EMA weights".format(load_path))
+        # half precision exports are upcast; fp32 tensors stay views of the mapped file
+        self.load_state_dict({k: v.float() if v.is_floating_point() else v for k, v in state_dict.items()})
+        self.step = int(metadata.get('step', 0))
+        print("=> loaded slim checkpoint {} step {} ({})".format(load_path, self.step, metadata.get('dtype', 'fp32')))
+        return metadata
+
+    def load_state_dict(self, state_dict):
+        if self.on_meta:
+            try:
+                self.model.load_state_dict(state_dict, strict=True, assign=True)
+            except TypeError:
+                # torch < 2.1 has no `assign`: the meta net cannot take the tensors, so rebuild it
+                self.model = Net(self.args, self.config).eval().requires_grad_(False)
+                self.model.load_state_dict(state_dict, strict=True)
+            self.on_meta = False
+        else:
+            self.model.load_state_dict(state_dict, strict=True)
+        self.model.to(self.device).eval().requires_grad_(False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a training checkpoint as a slim, memory-mappable "
+                                                 "safetensors inference checkpoint.")
+    parser.add_argument("--resume", default="ckpt/stage2/stage2_weight.pth.tar", type=str)
+    parser.add_argument("--output", default="ckpt/stage2/stage2_weight.safetensors", type=str)
+    parser.add_argument("--ema", action="store_true", help="Fold in the EMA weights")
+    parser.add_argument("--stage1", default=None, type=str, help="Take the CTDN weights from this stage-1 checkpoint")
+    parser.add_argument("--dtype", default="fp32", choices=sorted(SLIM_DTYPES))
+    args = parser.parse_args()
+
+    export_slim_checkpoint(args.resume, args.output, ema=args.ema, stage1=args.stage1, dtype=args.dtype)
+    print("=> wrote {} ({:.1f} MB -> {:.1f} MB)".format(args.output, os.path.getsize(args.resume) / 2 ** 20,
+                                                       os.path.getsize(args.output) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
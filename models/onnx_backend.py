@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import os
+import sys
+import copy
+import argparse
+import yaml
+import torch
+import torch.nn as nn
+from models.ddm import Net, get_beta_schedule
+from models.inference import InferenceDiffusion
+from utils.config_utils import dict2namespace
+
+GRAPHS = ('encoder', 'unet_step', 'decoder')
+SKIPS = ('skip_down2', 'skip_down4', 'skip_down8')
+
+
+class EncoderGraph(nn.Module):
+    """Low image [N, 3, H, W] -> normalized diffusion condition and the three decoder skips."""
+
+    def __init__(self, net):
+        super().__init__()
+        self.net = net
+
+    def forward(self, x):
+        cond, skips = self.net.encode(x)
+        return (cond,) + tuple(skips)
+
+
+class UNetStepGraph(nn.Module):
+    """One noise prediction of the DDIM loop, with the timestep [N] as an input."""
+
+    def __init__(self, net):
+        super().__init__()
+        self.unet = net.Unet
+
+    def forward(self, x, t):
+        return self.unet(x, t)
+
+
+class DecoderGraph(nn.Module):
+    def __init__(self, net):
+        super().__init__()
+        self.net = net
+
+    def forward(self, pred_fea, skip_down2, skip_down4, skip_down8):
+        return self.net.decode(pred_fea, (skip_down2, skip_down4, skip_down8))
+
+
+def spatial_axes(suffix):
+    return {0: 'batch', 2: 'height' + suffix, 3: 'width' + suffix}
+
+
+@torch.no_grad()
+def export_onnx(net, output_dir, height=256, width=256, opset=17):
+    """
+    Export the inference path of an (unwrapped, eval) `Net` as three ONNX graphs with dynamic
+    batch and spatial axes: encoder.onnx, unet_step.onnx and decoder.onnx.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    net = net.cpu().eval()
+    x = torch.rand(1, 3, height, width)
+    cond, skips = net.encode(x)
+    t = torch.full((1,), 500.0)
+
+    torch.onnx.export(EncoderGraph(net), (x,), os.path.join(output_dir, 'encoder.onnx'), opset_version=opset,
+                      input_names=['x'], output_names=['cond'] + list(SKIPS),
+                      dynamic_axes={'x': spatial_axes(''), 'cond': spatial_axes('_8'),
+                                    'skip_down2': spatial_axes('_2'), 'skip_down4': spatial_axes('_4'),
+                                    'skip_down8': spatial_axes('_8')})
+    torch.onnx.export(UNetStepGraph(net), (torch.cat([cond, cond], dim=1), t),
+                      os.path.join(output_dir, 'unet_step.onnx'), opset_version=opset,
+                      input_names=['x', 't'], output_names=['et'],
+                      dynamic_axes={'x': spatial_axes('_8'), 't': {0: 'batch'}, 'et': spatial_axes('_8')})
+    torch.onnx.export(DecoderGraph(net), (cond,) + tuple(skips), os.path.join(output_dir, 'decoder.onnx'),
+                      opset_version=opset, input_names=['pred_fea'] + list(SKIPS), output_names=['pred_img'],
+                      dynamic_axes={'pred_fea': spatial_axes('_8'), 'skip_down2': spatial_axes('_2'),
+                                    'skip_down4': spatial_axes('_4'), 'skip_down8': spatial_axes('_8'),
+                                    'pred_img': spatial_axes('')})
+
+
+class OnnxNet:
+    """
+    ONNX Runtime replacement for the eval forward of `Net`: the encoder, one UNet step and the
+    decoder run as ORT sessions, and the DDIM loop (eta = 0, optional per-sample seeds) runs in
+    Python exactly as in `Net.sample_training`.
+    """
+
+    # these only depend on self.config / self.device
+    sampling_timesteps = Net.sampling_timesteps
+    sample_noise = Net.sample_noise
+
+    def __init__(self, config, onnx_dir, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("sampling.backend: onnx requires onnxruntime (pip install onnxruntime)")
+
+        self.config = config
+        self.device = torch.device('cpu')
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.sessions = {name: ort.InferenceSession(os.path.join(onnx_dir, name + '.onnx'), options,
+                                                    providers=['CPUExecutionProvider'])
+                         for name in GRAPHS}
+
+        betas = get_beta_schedule(
+            beta_schedule=config.diffusion.beta_schedule,
+            beta_start=config.diffusion.beta_start,
+            beta_end=config.diffusion.beta_end,
+            num_diffusion_timesteps=config.diffusion.num_diffusion_timesteps,
+        )
+        self.b = torch.from_numpy(betas).float()
+
+    def run(self, name, **inputs):
+        outputs = self.sessions[name].run(None, {k: v.contiguous().numpy() for k, v in inputs.items()})
+        return [torch.from_numpy(output) for output in outputs]
+
+    def encode(self, x):
+        cond, *skips = self.run('encoder', x=x)
+        return cond, tuple(skips)
+
+    def unet(self, x, t):
+        return self.run('unet_step', x=x, t=t)[0]
+
+    def decode(self, pred_fea, skips):
+        return self.run('decoder', pred_fea=pred_fea, **dict(zip(SKIPS, skips)))[0]
+
+    def sample(self, x_cond, seed=None, steps=None):
+        n, c, h, w = x_cond.shape
+        generators = None if seed is None else [torch.Generator().manual_seed(seed) for _ in range(n)]
+        xt = self.sample_noise((n, c, h, w), generators)
+        for i, j in self.sampling_timesteps(steps):
+            t = torch.full((n,), float(i))
+            at = Net.compute_alpha(self.b, t.long())
+            at_next = Net.compute_alpha(self.b, torch.full((n,), j, dtype=torch.long))
+            et = self.unet(torch.cat([x_cond, xt], dim=1), t)
+            x0_t = (xt - et * (1 - at).sqrt()) / at.sqrt()
+            xt = at_next.sqrt() * x0_t + (1 - at_next).sqrt() * et
+        return xt
+
+    def __call__(self, inputs, steps=None):
+        x = inputs[:, :3, ...].detach().float().cpu()
+        cond, skips = self.encode(x)
+        if steps == 0:
+            pred_fea = cond
+        else:
+            pred_fea = self.sample(cond, seed=getattr(self.config.sampling, 'seed', None), steps=steps)
+        return {"pred_x": self.decode(pred_fea, skips).to(inputs.device)}
+
+    def eval(self):
+        return self
+
+
+def reference_config(config, seed):
+    """Copy of `config` whose sampler is the plain seeded eta = 0 DDIM loop that OnnxNet runs."""
+    config = copy.deepcopy(config)
+    sampling = config.sampling
+    sampling.seed, sampling.eta = seed, 0.
+    sampling.static_engine = sampling.cuda_graph = sampling.routing = False
+    sampling.deepcache_interval = 1
+    return config
+
+
+@torch.no_grad()
+def check_parity(net, onnx_net, shape, seed=0):
+    """
+    Max |PyTorch - ORT| of each graph and of a full seeded enhancement of a random [1, 3, H, W]
+    image. The PyTorch reference samples with `reference_config`; `net.config` is left as is.
+    """
+    x = torch.rand((1, 3) + tuple(shape))
+    cond, skips = net.encode(x)
+    ort_cond, ort_skips = onnx_net.encode(x)
+    diffs = {'encoder': max((a - b).abs().max().item() for a, b in zip((cond,) + skips, (ort_cond,) + ort_skips))}
+
+    latent = torch.cat([cond, torch.randn_like(cond)], dim=1)
+    t = torch.full((1,), 500.0)
+    diffs['unet_step'] = (net.Unet(latent, t) - onnx_net.unet(latent, t)).abs().max().item()
+    diffs['decoder'] = (net.decode(cond, skips) - onnx_net.decode(cond, skips)).abs().max().item()
+
+    config = net.config
+    net.config = reference_config(config, seed)
+    try:
+        reference = net(torch.cat([x, x], dim=1))["pred_x"]
+    finally:
+        net.config = config
+    ort_cond, ort_skips = onnx_net.encode(x)
+    output = onnx_net.decode(onnx_net.sample(ort_cond, seed=seed), ort_skips)
+    diffs['full'] = (reference - output).abs().max().item()
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the encoder, UNet step and decoder of a stage-2 "
+                                                 "checkpoint to ONNX.")
+    parser.add_argument("--config", default="unsupervised.yml", type=str, help="Config file name")
+    parser.add_argument("--resume", default="ckpt/stage2/stage2_weight.pth.tar", type=str)
+    parser.add_argument("--output_dir", default="ckpt/onnx", type=str)
+    parser.add_argument("--height", default=256, type=int, help="Export height (multiple of 64)")
+    parser.add_argument("--width", default=256, type=int, help="Export width (multiple of 64)")
+    parser.add_argument("--opset", default=17, type=int)
+    parser.add_argument("--check", action="store_true",
+                        help="Compare ORT against PyTorch at the export size and at a different size")
+    parser.add_argument("--tolerance", default=1e-3, type=float, help="Max abs difference allowed by --check")
+    args = parser.parse_args()
+
+    with open(os.path.join("configs", args.config), "r") as f:
+        config = dict2namespace(yaml.safe_load(f))
+    config.device = torch.device("cpu")
+
+    model_args = argparse.Namespace(mode='evaluation', resume=args.resume)
+    diffusion = InferenceDiffusion(model_args, config)
+    diffusion.load_ddm_ckpt(args.resume, ema=getattr(config.sampling, 'ema', False))
+    net = diffusion.model
+    export_onnx(net, args.output_dir, args.height, args.width, args.opset)
+    print(f"=> exported {', '.join(name + '.onnx' for name in GRAPHS)} to {args.output_dir}")
+
+    if args.check:
+        onnx_net = OnnxNet(config, args.output_dir)
+        failed = False
+        for shape in ((args.height, args.width), (args.height + 64, args.width + 128)):
+            diffs = check_parity(net, onnx_net, shape)
+            print(f"{shape[0]}x{shape[1]}: " + ", ".join(f"{k}={v:.2e}" for k, v in diffs.items()))
+            failed |= any(v > args.tolerance for v in diffs.values())
+        if failed:
+            print(f"Parity check failed (tolerance {args.tolerance})")
+            sys.exit(1)
+        print("Parity check passed")
+
+
+if __name__ == '__main__':
+    main()
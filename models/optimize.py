@@ -0,0 +1,105 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from models.unet import ResnetBlock, DiffusionUNet, AttnBlock
+
+ATTENTION_BACKENDS = ('math', 'sdpa')
+
+
+class GroupNormSwish(nn.GroupNorm):
+    """GroupNorm followed by swish (x * sigmoid(x) == silu) in one module, with GroupNorm's parameters."""
+
+    def forward(self, x):
+        return F.silu(F.group_norm(x, self.num_groups, self.weight, self.bias, self.eps))
+
+    @classmethod
+    def from_group_norm(cls, norm):
+        fused = cls(norm.num_groups, norm.num_channels, eps=norm.eps, affine=norm.affine)
+        fused.load_state_dict(norm.state_dict())
+        return fused.to(norm.weight.device, norm.weight.dtype)
+
+
+def fuse_norm_act(unet):
+    """Replace every Normalize + nonlinearity pair of a DiffusionUNet by GroupNormSwish, in place."""
+    for module in unet.modules():
+        if isinstance(module, ResnetBlock) and not module.fused_norm_act:
+            module.norm1 = GroupNormSwish.from_group_norm(module.norm1)
+            module.norm2 = GroupNormSwish.from_group_norm(module.norm2)
+            module.fused_norm_act = True
+    if isinstance(unet, DiffusionUNet) and not unet.fused_norm_act:
+        unet.norm_out = GroupNormSwish.from_group_norm(unet.norm_out)
+        unet.fused_norm_act = True
+    return unet
+
+
+def set_attention_backend(unet, backend):
+    """Select how every AttnBlock of a DiffusionUNet computes attention (see AttnBlock.backend), in place."""
+    if backend not in ATTENTION_BACKENDS:
+        raise ValueError("unknown attention backend {}; choose from {}".format(backend, ', '.join(ATTENTION_BACKENDS)))
+    if backend == 'sdpa' and not hasattr(F, 'scaled_dot_product_attention'):
+        raise ValueError("attention backend 'sdpa' needs torch >= 2.0")
+    for module in unet.modules():
+        if isinstance(module, AttnBlock):
+            module.backend = backend
+    return unet
+
+
+def compile_errors():
+    """
+    Exception types meaning torch.compile itself failed (unsupported code, backend or compiler
+    failures, no C++ compiler), as opposed to errors of the model call it would also raise eagerly.
+    """
+    import torch._dynamo.exc as dynamo_exc
+    errors = [dynamo_exc.BackendCompilerFailed, dynamo_exc.Unsupported]
+    try:
+        import torch._inductor.exc as inductor_exc
+        errors += [getattr(inductor_exc, name) for name in ('InductorError', 'InvalidCxxCompiler', 'CppCompileError')
+                   if hasattr(inductor_exc, name)]
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+class CompiledWithFallback:
+    """
+    Calls a `torch.compile`d version of `fn` and permanently falls back to `fn` itself the first
+    time compilation fails (unsupported code or platform, missing compiler, ...). Any other error
+    of the compiled call (out of memory, a bad input) is raised as is and compilation stays on.
+    """
+
+    def __init__(self, fn, name, **compile_kwargs):
+        self.eager = fn
+        self.name = name
+        self.compiled = torch.compile(fn, **compile_kwargs)
+        self.errors = compile_errors()
+        self.failed = False
+
+    def __call__(self, *args, **kwargs):
+        if not self.failed:
+            try:
+                return self.compiled(*args, **kwargs)
+            except self.errors as e:
+                self.failed = True
+                print(f"Warning: torch.compile failed for {self.name}, falling back to eager: {e}")
+        return self.eager(*args, **kwargs)
+
+
+def optimize_for_inference(net, compile=True, channels_last=True, fuse=True, compile_mode=None):
+    """
+    Opt-in fast execution mode for an (unwrapped) `Net`, applied in place:
+      - fuse: GroupNorm + swish pairs of the UNet become GroupNormSwish;
+      - channels_last: parameters and the model input use NHWC memory format;
+      - compile: the UNet step and the CTDN encoder/decoder go through torch.compile, with
+        eager fallback. Weights and state_dict keys are unchanged.
+    """
+    if fuse:
+        fuse_norm_act(net.Unet)
+    if channels_last:
+        net.to(memory_format=torch.channels_last)
+        net.channels_last = True
+    if compile and hasattr(torch, 'compile'):
+        net.Unet.forward = CompiledWithFallback(net.Unet.forward, 'DiffusionUNet', mode=compile_mode)
+        recon = net.decom.ReconNet
+        recon.encode = CompiledWithFallback(recon.encode, 'CTDN encoder', mode=compile_mode)
+        recon.decode = CompiledWithFallback(recon.decode, 'CTDN decoder', mode=compile_mode)
+    return net
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+import os
+import copy
+import time
+import argparse
+import yaml
+import torch
+import torch.nn as nn
+import torchvision.transforms.functional as TF
+from PIL import Image
+from torch.ao import quantization as tq
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+import utils
+from datasets.sampler import pad_collate
+from models.inference import InferenceDiffusion
+from models.unet import ResnetBlock
+from utils.config_utils import dict2namespace
+
+# Only the inference path is quantized, one contiguous region at a time: every UNet ResnetBlock
+# and the CTDN pyramid, channel down/up and decoder Res_blocks. A region quantizes its input once,
+# runs INT8 (or quantized GroupNorm/sigmoid/add) end to end and dequantizes its output, so
+# attention, the UNet's input/output convolutions, the transposed convolutions and the decoder
+# head stay in float between regions.
+RECON_REGIONS = ('pyramid', 'channel_down', 'channel_up') + tuple('block_up{}'.format(i) for i in range(6))
+# layers of a region that stay float: the sigmoid head of the encoder
+FLOAT_LAYERS = {'decom.ReconNet.channel_down': ('conv2',)}
+
+
+def default_backend():
+    engines = torch.backends.quantized.supported_engines
+    for backend in ('x86', 'fbgemm', 'qnnpack'):
+        if backend in engines:
+            return backend
+    raise RuntimeError("this PyTorch build has no quantized CPU engine")
+
+
+def quantized_regions(net):
+    """Qualified names of the submodules of a `Net` that static quantization converts as a whole."""
+    return [name for name, module in net.named_modules() if name.startswith('Unet.') and
+            isinstance(module, ResnetBlock)] + ['decom.ReconNet.' + name for name in RECON_REGIONS]
+
+
+def set_module(net, name, module):
+    parent, _, child = name.rpartition('.')
+    setattr(net.get_submodule(parent) if parent else net, child, module)
+
+
+@torch.no_grad()
+def region_inputs(net, regions):
+    """Example inputs of every region, recorded from one small single-step forward."""
+    inputs, handles = {}, []
+    for name in regions:
+        def hook(module, args, name=name):
+            inputs.setdefault(name, args)
+        handles.append(net.get_submodule(name).register_forward_pre_hook(hook))
+    try:
+        net.eval()(torch.rand(1, 6, 64, 64), steps=1)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return inputs
+
+
+def prepare_static(net, backend, regions=None):
+    """
+    Trace each region with torch.fx and attach observers, in place: quant/dequant pairs go only
+    at the region boundaries, not around every convolution. Returns the region names.
+    """
+    torch.backends.quantized.engine = backend
+    regions = quantized_regions(net) if regions is None else regions
+    examples = region_inputs(net, regions)
+    for name in regions:
+        qconfig_mapping = tq.get_default_qconfig_mapping(backend)
+        for layer in FLOAT_LAYERS.get(name, ()):
+            qconfig_mapping.set_module_name(layer, None)
+        set_module(net, name, prepare_fx(net.get_submodule(name).eval(), qconfig_mapping, examples[name]))
+    return regions
+
+
+def convert_static(net, regions):
+    for name in regions:
+        set_module(net, name, convert_fx(net.get_submodule(name)))
+
+
+def quantize_dynamic(net):
+    """
+    Dynamic PTQ: INT8 weights, activations quantized on the fly. PyTorch only has dynamic
+    kernels for Linear, which here is the timestep embedding MLP: this shrinks those weights
+    but does not speed up inference. Use static mode for speed.
+    """
+    return tq.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+@torch.no_grad()
+def calibrate(net, images):
+    """Run full enhancements (all sampling steps, so every timestep is observed) over `images`."""
+    net.eval()
+    for k, image in enumerate(images):
+        x, _, _ = pad_collate([(image, k)])
+        net(torch.cat([x, x], dim=1))
+
+
+def quantize(net, mode='static', calibration_images=None, backend=None):
+    """Quantize a float CPU `Net` in place; returns the artifact metadata for `save_quantized`."""
+    backend = backend or default_backend()
+    if mode == 'dynamic':
+        torch.backends.quantized.engine = backend
+        quantize_dynamic(net)
+        return {'mode': mode, 'backend': backend, 'regions': []}
+    if not calibration_images:
+        raise ValueError("static quantization needs calibration images")
+    regions = prepare_static(net, backend)
+    calibrate(net, calibration_images)
+    convert_static(net, regions)
+    return {'mode': mode, 'backend': backend, 'regions': regions}
+
+
+def save_quantized(net, meta, path):
+    torch.save(dict(meta, state_dict=net.state_dict()), path)
+
+
+def load_quantized(net, path):
+    """Rebuild the quantized structure of an artifact from `save_quantized` on a float `Net` and load it."""
+    artifact = utils.logging.load_checkpoint(path, 'cpu')
+    if artifact['mode'] == 'dynamic':
+        torch.backends.quantized.engine = artifact['backend']
+        quantize_dynamic(net)
+    else:
+        if 'regions' not in artifact:
+            raise ValueError("{} holds per-layer INT8 convolutions from an older models.quantize; "
+                             "quantize the checkpoint again".format(path))
+        prepare_static(net, artifact['backend'], artifact['regions'])
+        convert_static(net, artifact['regions'])
+    net.load_state_dict(artifact['state_dict'], strict=True)
+    return net
+
+
+def load_images(folder, limit):
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')))
+    images = []
+    for name in names[:limit]:
+        with Image.open(os.path.join(folder, name)) as img:
+            images.append(TF.to_tensor(img.convert('RGB')))
+    return images
+
+
+def main():
+    from metrics import to_numpy, compute_psnr, compute_ssim
+
+    parser = argparse.ArgumentParser(description="Post-training INT8 quantization of a stage-2 checkpoint "
+                                                 "for CPU inference.")
+    parser.add_argument("--config", default="unsupervised.yml", type=str, help="Config file name")
+    parser.add_argument("--resume", default="ckpt/stage2/stage2_weight.pth.tar", type=str)
+    parser.add_argument("--mode", default="static", choices=["static", "dynamic"],
+                        help="static: INT8 regions, for speed; dynamic: INT8 Linear weights only, size-only")
+    parser.add_argument("--backend", default=None, type=str, help="Quantized engine (x86, fbgemm, qnnpack)")
+    parser.add_argument("--calib_dir", required=True, type=str, help="Folder of low-light images for calibration")
+    parser.add_argument("--num_calib", default=32, type=int)
+    parser.add_argument("--eval_dir", default=None, type=str, help="Images for the fp32 comparison "
+                                                                   "(default: calib_dir)")
+    parser.add_argument("--num_eval", default=8, type=int)
+    parser.add_argument("--threads", default=None, type=int, help="torch.set_num_threads")
+    parser.add_argument("--output", default="ckpt/stage2/stage2_int8.pt", type=str, help="Quantized artifact")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with open(os.path.join("configs", args.config), "r") as f:
+        config = dict2namespace(yaml.safe_load(f))
+    config.device = torch.device("cpu")
+    # same noise for the fp32 and INT8 runs
+    config.sampling.seed = 0 if getattr(config.sampling, 'seed', None) is None else config.sampling.seed
+
+    model_args = argparse.Namespace(mode='evaluation', resume=args.resume)
+    diffusion = InferenceDiffusion(model_args, config)
+    diffusion.load_ddm_ckpt(args.resume, ema=getattr(config.sampling, 'ema', False))
+    fp32 = diffusion.model
+
+    int8 = copy.deepcopy(fp32)
+    start = time.time()
+    meta = quantize(int8, args.mode, load_images(args.calib_dir, args.num_calib), args.backend)
+    print(f"=> {args.mode} quantization ({meta['backend']}, {len(meta['regions'])} INT8 regions) "
+          f"took {time.time() - start:.1f}s")
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    save_quantized(int8, meta, args.output)
+    print(f"=> saved {args.output}")
+
+    fp32_ms, int8_ms, psnr, ssim = 0.0, 0.0, 0.0, 0.0
+    images = load_images(args.eval_dir or args.calib_dir, args.num_eval)
+    with torch.no_grad():
+        for k, image in enumerate(images):
+            x, _, _ = pad_collate([(image, k)])
+            x = torch.cat([x, x], dim=1)
+            h, w = image.shape[-2:]
+            start = time.perf_counter()
+            ref = fp32(x)["pred_x"][0, :, :h, :w].clamp(0, 1)
+            fp32_ms += 1000 * (time.perf_counter() - start)
+            start = time.perf_counter()
+            out = int8(x)["pred_x"][0, :, :h, :w].clamp(0, 1)
+            int8_ms += 1000 * (time.perf_counter() - start)
+            psnr += compute_psnr(to_numpy(ref), to_numpy(out))
+            ssim += compute_ssim(to_numpy(ref), to_numpy(out))
+
+    n = len(images)
+    print(f"fp32: {fp32_ms / n:.1f} ms/img, int8: {int8_ms / n:.1f} ms/img, speedup {fp32_ms / int8_ms:.2f}x")
+    print(f"int8 vs fp32: PSNR={psnr / n:.2f}, SSIM={ssim / n:.4f}")
+
+
+if __name__ == '__main__':
+    main()
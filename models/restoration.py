@@ -3,7 +3,20 @@ import numpy as np
 import utils
 import os
 import time
+import contextlib
 import torch.nn.functional as F
+from datasets.sampler import unpack_batch
+from models.cache import ResultCache, checkpoint_fingerprint, sampler_signature
+from models.shape_planner import ShapePlanner, ExecutableCache
+from models.optimize import optimize_for_inference, set_attention_backend, CompiledWithFallback
+from models.quantize import load_quantized
+from models.onnx_backend import OnnxNet
+from models.ddm import unwrap_model
+from models.tiling import run_tiled
+from models.routing import build_router
+
+# autocast dtypes of sampling.precision
+PRECISIONS = {'fp32': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}
 
 class DiffusiveRestoration:
     def __init__(self, diffusion, args, config):
@@ -13,44 +26,217 @@ class DiffusiveRestoration:
         self.diffusion = diffusion
 
         if os.path.isfile(args.resume):
-            self.diffusion.load_ddm_ckpt(args.resume, ema=False)
+            self.diffusion.load_ddm_ckpt(args.resume, ema=getattr(self.config.sampling, 'ema', False))
             self.diffusion.model.eval()
         else:
             print('Pre-trained model path is missing!')
 
-    def forward_sample(self, x):
+        quantized = getattr(self.config.sampling, 'quantized', None)
+        if quantized:
+            if torch.device(self.diffusion.device).type != 'cpu':
+                raise ValueError("sampling.quantized models run on CPU only")
+            print("=> Using INT8 model {}".format(quantized))
+            load_quantized(unwrap_model(self.diffusion.model), quantized)
+
+        self.planner = self.build_planner()
+        if self.planner is not None:
+            # few distinct shapes: cuDNN autotunes each once and reuses the fastest kernels
+            torch.backends.cudnn.benchmark = True
+
+        if getattr(self.config.sampling, 'execution', 'eager') == 'optimized':
+            print("=> Using optimized execution (fused GroupNorm+swish, channels_last, torch.compile)")
+            # with a planner the whole model is compiled per canonical shape instead (see executable_factory)
+            optimize_for_inference(unwrap_model(self.diffusion.model), compile=self.planner is None,
+                                   compile_mode=getattr(self.config.sampling, 'compile_mode', None))
+
+        attention = getattr(self.config.sampling, 'attention', 'math')
+        if attention != 'math':
+            print("=> Using {} attention".format(attention))
+            set_attention_backend(unwrap_model(self.diffusion.model).Unet, attention)
+
+        precision = getattr(self.config.sampling, 'precision', 'fp32')
+        if precision not in PRECISIONS:
+            raise ValueError("unknown sampling.precision {}; choose from {}".format(precision, ', '.join(PRECISIONS)))
+        if precision != 'fp32' and (quantized or getattr(self.config.sampling, 'backend', 'torch') != 'torch'):
+            raise ValueError("sampling.precision {} needs the fp32 PyTorch model".format(precision))
+        self.precision = PRECISIONS[precision]
+
+        # callable used for sampling: the PyTorch model, or the same pipeline on ONNX Runtime
+        self.model = self.diffusion.model
+        if getattr(self.config.sampling, 'backend', 'torch') == 'onnx':
+            if getattr(self.config.sampling, 'eta', 0.) > 0:
+                raise ValueError("the ONNX backend only samples with sampling.eta = 0")
+            onnx_dir = getattr(self.config.sampling, 'onnx_dir', 'ckpt/onnx')
+            print("=> Using ONNX Runtime backend from {}".format(onnx_dir))
+            self.model = OnnxNet(self.config, onnx_dir, threads=getattr(self.config.sampling, 'onnx_threads', None))
+
+        self.cache = self.build_cache()
+        self.executables = ExecutableCache(self.executable_factory())
+        self.router = build_router(self.config)
+
+    def build_planner(self):
+        canonical_shapes = getattr(self.config.sampling, 'canonical_shapes', None)
+        if not canonical_shapes:
+            return None
+        return ShapePlanner(canonical_shapes,
+                            max_pad_ratio=getattr(self.config.sampling, 'max_pad_ratio', 0.25),
+                            max_downscale=getattr(self.config.sampling, 'max_downscale', 0.15))
+
+    def executable_factory(self):
+        """
+        Per-shape `torch.compile` of the whole PyTorch model, with eager fallback, when the planner
+        bounds the shapes in optimized execution; None (eager executables) otherwise.
+        """
+        sampling = self.config.sampling
+        if self.planner is None or getattr(sampling, 'execution', 'eager') != 'optimized' \
+                or not isinstance(self.model, torch.nn.Module) or getattr(sampling, 'quantized', None) \
+                or getattr(sampling, 'cuda_graph', False) or not hasattr(torch, 'compile'):
+            return None
+        compile_mode = getattr(sampling, 'compile_mode', None)
+        return lambda fn, shape: CompiledWithFallback(fn, 'Net {}'.format('x'.join(str(v) for v in shape)),
+                                                      mode=compile_mode)
+
+    def warmup(self, shapes=None, batch_sizes=None):
+        """
+        Run each padded shape once per batch size so real requests hit warm kernels and compiled
+        graphs. Shapes default to the canonical shapes of the planner, else to `sampling.warmup_shapes`;
+        batch sizes to `sampling.warmup_batch_sizes`, else 1 and `sampling.batch_size`.
+        """
+        if shapes is None:
+            shapes = self.planner.canonical_shapes if self.planner is not None \
+                else getattr(self.config.sampling, 'warmup_shapes', None) or []
+        if batch_sizes is None:
+            batch_sizes = getattr(self.config.sampling, 'warmup_batch_sizes', None) or \
+                [1, getattr(self.config.sampling, 'batch_size', 1)]
+        device = self.diffusion.device
+        with self.autocast():
+            self.executables.warmup(self.model, [(b, 6) + tuple(shape) for shape in shapes
+                                                 for b in sorted(set(batch_sizes))],
+                                    lambda shape: torch.zeros(shape, device=device))
+
+    def stats(self):
+        stats = {'executables': self.executables.stats()}
+        if self.planner is not None:
+            stats['planner'] = self.planner.stats()
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if self.router is not None:
+            stats['routes'] = self.router.stats()
+        return stats
+
+    def build_cache(self):
+        cache_dir = getattr(self.config.sampling, 'cache_dir', None)
+        if not cache_dir:
+            return None
+        if getattr(self.config.sampling, 'seed', None) is None:
+            raise ValueError("sampling.cache_dir requires sampling.seed so cached results are reproducible")
+        if not os.path.isfile(self.args.resume):
+            raise ValueError("sampling.cache_dir requires an existing checkpoint to identify results")
+        context = {'checkpoint': checkpoint_fingerprint(self.args.resume),
+                   'sampler': sampler_signature(self.config)}
+        max_bytes = int(getattr(self.config.sampling, 'cache_max_gb', 10) * 1024 ** 3)
+        print(f"=> Using result cache {cache_dir} ({max_bytes / 1024 ** 3:.1f} GB budget)")
+        return ResultCache(cache_dir, max_bytes, context)
+
+    def forward_sample(self, x, ids=None):
+        """
+        Same as `run_model`, but served from the result cache when `sampling.cache_dir` is set:
+        images already enhanced with this checkpoint and sampler configuration skip the model.
+        """
+        if self.cache is None:
+            return self.run_model(x, ids)
+
+        keys = [self.cache.key(x[k, :3]) for k in range(x.shape[0])]
+        outputs = [self.cache.get(key) for key in keys]
+        misses = [k for k, output in enumerate(outputs) if output is None]
+        if misses:
+            pred_img = self.run_model(x[misses], None if ids is None else [ids[k] for k in misses])
+            for k, pred in zip(misses, pred_img):
+                self.cache.put(keys[k], pred)
+                outputs[k] = pred
+        return torch.stack([output.to(self.diffusion.device) for output in outputs], dim=0)
+
+    def run_model(self, x, ids=None):
         """
         Process a single batch: extract low image, pad it, concatenate with itself,
-        run the forward pass, crop the prediction, and clamp to [0,1].
+        run the forward pass, crop the prediction, and clamp to [0,1]. With `sampling.routing`
+        each image first takes the route of its brightness (see models.routing).
 
         Args:
             x (torch.Tensor): Input tensor of shape [B, 6, H, W] (even if unpaired, low image is in the first 3 channels).
+            ids (list, optional): Name of each image, used in the route log (default: its index in the batch).
         
         Returns:
             pred_img (torch.Tensor): Predicted restoration, shape [B, C, H, W] with values in [0, 1].
         """
         # Extract low image (first 3 channels)
         x_cond = x[:, :3, :, :].to(self.diffusion.device)
+        if self.router is None:
+            return self.enhance(x_cond)
+
+        # Route each image by brightness; well exposed ones skip (part of) the pipeline
+        routes, luminance = self.router.route(x_cond)
+        ids = range(len(routes)) if ids is None else ids
+        for name, route, value in zip(ids, routes, luminance):
+            print(f"{name}: route={route} (mean luminance {value:.3f})")
+        pred_img = torch.empty_like(x_cond, dtype=torch.float32)
+        for route in set(routes):
+            members = [k for k, r in enumerate(routes) if r == route]
+            if route == 'passthrough':
+                pred_img[members] = x_cond[members].float().clamp(0, 1)
+            else:
+                pred_img[members] = self.enhance(x_cond[members], steps=self.router.steps(route))
+        return pred_img
+
+    def enhance(self, x_cond, steps=None):
+        """
+        Pad a [B, 3, H, W] low image batch, run the model (with `steps` sampling steps if given, see
+        `Net.forward`) and crop the prediction back, clamped to [0, 1].
+        """
         b, c, h, w = x_cond.shape
         
-        # Pad to multiple of 64
-        img_h_64 = int(64 * np.ceil(h / 64.0))
-        img_w_64 = int(64 * np.ceil(w / 64.0))
-        x_padded = F.pad(x_cond, (0, img_w_64 - w, 0, img_h_64 - h), mode='reflect')
+        if self.planner is not None:
+            # Pad (or slightly downscale) to one of the canonical shapes
+            x_padded, plan = self.planner.apply(x_cond)
+        else:
+            # Pad to multiple of 64
+            img_h_64 = int(64 * np.ceil(h / 64.0))
+            img_w_64 = int(64 * np.ceil(w / 64.0))
+            x_padded = F.pad(x_cond, (0, img_w_64 - w, 0, img_h_64 - h), mode='reflect')
         
         # Concatenate low image with itself to form 6-channel input
         model_input = torch.cat((x_padded, x_padded), dim=1)
         
-        # Forward pass through the diffusion model
-        output_dict = self.diffusion.model(model_input)
+        # Forward pass through the diffusion model, using the warm executable for this shape
+        tile_size = getattr(self.config.sampling, 'tile_size', 0) or 0
+        with self.autocast():
+            if tile_size and max(model_input.shape[2:]) > tile_size:
+                output_dict = run_tiled(lambda tiles: self.call_model(tiles, steps), model_input, tile_size,
+                                        getattr(self.config.sampling, 'tile_overlap', 64), batch_size=getattr(self.config.sampling, 'batch_size', 1))
+            else:
+                output_dict = self.call_model(model_input, steps)
         if "pred_x" not in output_dict:
             raise ValueError("Model output does not contain 'pred_x'")
         
         # Crop output back to original size and clamp values
-        pred_img = output_dict["pred_x"][:, :, :h, :w]
-        pred_img = torch.clamp(pred_img, 0, 1)
+        if self.planner is not None:
+            pred_img = self.planner.restore(output_dict["pred_x"], plan, (h, w))
+        else:
+            pred_img = output_dict["pred_x"][:, :, :h, :w]
+        pred_img = torch.clamp(pred_img.float(), 0, 1)
         return pred_img
 
+    def call_model(self, model_input, steps=None):
+        """The warm executable for this input shape, called with a step override when routing asks for one."""
+        executable = self.executables.get(model_input.shape, self.model)
+        return executable(model_input) if steps is None else executable(model_input, steps=steps)
+
+    def autocast(self):
+        """Mixed precision context of `sampling.precision`; fp32 runs without autocast."""
+        if self.precision is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=torch.device(self.diffusion.device).type, dtype=self.precision)
+
     def restore(self, val_loader):
         """
         Restore images from a validation DataLoader by processing each sample via forward_sample(),
@@ -59,9 +245,12 @@ class DiffusiveRestoration:
         image_folder = os.path.join(self.args.image_folder, self.config.data.val_dataset)
         os.makedirs(image_folder, exist_ok=True)
         with torch.no_grad():
-            for i, (x, y) in enumerate(val_loader):
+            for i, batch in enumerate(val_loader):
+                x, y, sizes = unpack_batch(batch)
                 t1 = time.time()
-                pred_x = self.forward_sample(x)
+                pred_x = self.forward_sample(x, ids=list(y))
                 t2 = time.time()
-                utils.logging.save_image(pred_x, os.path.join(image_folder, f"{y[0]}"))
-                print(f"Processing image {y[0]}, time={t2 - t1:.3f}")
+                for k in range(pred_x.shape[0]):
+                    h, w = sizes[k].tolist()
+                    utils.logging.save_image(pred_x[k, :, :h, :w], os.path.join(image_folder, f"{y[k]}"))
+                print(f"Processing images {', '.join(y)}, time={t2 - t1:.3f}")
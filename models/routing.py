@@ -0,0 +1,64 @@
+import torch
+
+# Rec. 601 luma weights
+LUMA = (0.299, 0.587, 0.114)
+ROUTES = ('full', 'reduced', 'decode', 'passthrough')
+
+
+class BrightnessRouter:
+    """
+    Pre-classifier picking how much of the pipeline each input needs, from its mean luminance:
+      - below `dim`: 'full', the regular sampler;
+      - from `dim` to `bright`: 'reduced', the sampler with `reduced_steps` DDIM steps;
+      - `bright` and above: `bright_action`, either 'passthrough' (the input is returned as is)
+        or 'decode' (the CTDN encoder/decoder runs but the diffusion stage is skipped).
+    """
+
+    def __init__(self, dim=0.25, bright=0.45, bright_action='passthrough', reduced_steps=5):
+        if bright_action not in ('passthrough', 'decode'):
+            raise ValueError("route_bright_action must be 'passthrough' or 'decode', got {}".format(bright_action))
+        if not dim <= bright:
+            raise ValueError("route_dim ({}) must not exceed route_bright ({})".format(dim, bright))
+        self.dim = dim
+        self.bright = bright
+        self.bright_action = bright_action
+        self.reduced_steps = reduced_steps
+        self.counts = {route: 0 for route in ROUTES}
+
+    @staticmethod
+    def luminance(x):
+        """Mean luminance of each image of a [B, 3, H, W] batch in [0, 1]."""
+        weights = torch.tensor(LUMA, device=x.device, dtype=x.dtype).view(1, 3, 1, 1)
+        return (x.clamp(0, 1) * weights).sum(dim=1).flatten(1).mean(dim=1)
+
+    def route(self, x):
+        """Returns ([route of each image], [luminance of each image])."""
+        luminance = self.luminance(x).tolist()
+        routes = []
+        for value in luminance:
+            if value >= self.bright:
+                route = self.bright_action
+            elif value >= self.dim:
+                route = 'reduced'
+            else:
+                route = 'full'
+            self.counts[route] += 1
+            routes.append(route)
+        return routes, luminance
+
+    def steps(self, route):
+        """`steps` argument of the model for a route (None: the configured sampler)."""
+        return {'full': None, 'reduced': self.reduced_steps, 'decode': 0}[route]
+
+    def stats(self):
+        return dict(self.counts)
+
+
+def build_router(config):
+    """BrightnessRouter of `sampling.routing`, or None when routing is off."""
+    sampling = config.sampling
+    if not getattr(sampling, 'routing', False):
+        return None
+    return BrightnessRouter(dim=getattr(sampling, 'route_dim', 0.25), bright=getattr(sampling, 'route_bright', 0.45),
+                            bright_action=getattr(sampling, 'route_bright_action', 'passthrough'),
+                            reduced_steps=getattr(sampling, 'route_reduced_steps', 5))
@@ -0,0 +1,101 @@
+import torch
+
+
+class StaticDDIMSampler:
+    """
+    Allocation-free version of the DDIM loop in `Net.sample_training`, for inference only.
+
+    The UNet input [x_cond, x_t] lives in one preallocated buffer per shape: the condition is
+    written once and only the latent half is updated in place. Timestep vectors and the per-step
+    DDIM coefficients are precomputed, so a step is
+
+        x_t <- coef_x[s] * x_t + coef_e[s] * eps(x_t, t_s) (+ c1[s] * noise when eta > 0)
+
+    which is the same update as sample_training with x0_t folded in. No noise is drawn when
+    eta == 0. On CUDA, with `cuda_graph=True`, that step is captured once per shape as a CUDA
+    graph and replayed for every timestep. DeepCache reuse (`Net.unet_step`) applies as in the
+    eager loop.
+    """
+
+    def __init__(self, net, b, eta=0., cuda_graph=False):
+        self.net = net
+        self.eta = eta
+        self.device = b.device
+        self.cuda_graph = cuda_graph and self.device.type == 'cuda'
+
+        timesteps = net.sampling_timesteps()
+        t = torch.tensor([i for i, _ in timesteps], device=self.device)
+        next_t = torch.tensor([j for _, j in timesteps], device=self.device)
+        at = net.compute_alpha(b, t.long()).view(-1)
+        at_next = net.compute_alpha(b, next_t.long()).view(-1)
+
+        c1 = eta * ((1 - at / at_next) * (1 - at_next) / (1 - at)).sqrt()
+        c2 = ((1 - at_next) - c1 ** 2).sqrt()
+        self.t = t.float()
+        self.coef_x = (at_next.sqrt() / at.sqrt()).view(-1, 1, 1, 1, 1)
+        self.coef_e = (c2 - at_next.sqrt() * (1 - at).sqrt() / at.sqrt()).view(-1, 1, 1, 1, 1)
+        self.c1 = c1.view(-1, 1, 1, 1, 1)
+        self.states = {}
+
+    def state(self, x_cond):
+        n, c, h, w = x_cond.shape
+        key = (n, c, h, w, x_cond.dtype)
+        if key not in self.states:
+            memory_format = torch.channels_last if self.net.channels_last else torch.contiguous_format
+            state = {'input': torch.empty(n, 2 * c, h, w, device=self.device, dtype=x_cond.dtype,
+                                          memory_format=memory_format),
+                     't': self.t[:, None].expand(-1, n).contiguous(),
+                     'noise': torch.zeros(n, c, h, w, device=self.device, dtype=x_cond.dtype),
+                     'step_t': torch.empty(n, device=self.device),
+                     'step_coef': torch.empty(3, 1, 1, 1, 1, device=self.device, dtype=x_cond.dtype)}
+            state['xt'] = state['input'][:, c:]
+            self.states[key] = state
+        return self.states[key]
+
+    def body(self, state, t, coef_x, coef_e, c1, step=0):
+        et, state['deep'] = self.net.unet_step(state['input'], t, step, state.get('deep'))
+        state['xt'].mul_(coef_x).addcmul_(et, coef_e)
+        if self.eta > 0:
+            state['xt'].addcmul_(state['noise'], c1)
+
+    def capture(self, state):
+        step_t, step_coef = state['step_t'], state['step_coef']
+        step_t.copy_(state['t'][0])
+        side = torch.cuda.Stream()
+        side.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(side):
+            for _ in range(2):
+                self.body(state, step_t, step_coef[0], step_coef[1], step_coef[2])
+        torch.cuda.current_stream().wait_stream(side)
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            self.body(state, step_t, step_coef[0], step_coef[1], step_coef[2])
+        state['graph'] = graph
+
+    @torch.no_grad()
+    def sample(self, x_cond, x_init, noise_fn=None):
+        """
+        Args:
+            x_cond: Normalized condition [N, C, H, W].
+            x_init: Initial latent noise [N, C, H, W].
+            noise_fn: Returns fresh noise of x_init's shape; only called when eta > 0.
+        """
+        state = self.state(x_cond)
+        if self.cuda_graph and 'graph' not in state:
+            state['input'][:, :x_cond.shape[1]].copy_(x_cond)
+            self.capture(state)
+
+        state['input'][:, :x_cond.shape[1]].copy_(x_cond)
+        state['xt'].copy_(x_init)
+        for s in range(self.t.shape[0]):
+            if self.eta > 0:
+                state['noise'].copy_(noise_fn())
+            if self.cuda_graph:
+                state['step_t'].copy_(state['t'][s])
+                state['step_coef'][0].copy_(self.coef_x[s])
+                state['step_coef'][1].copy_(self.coef_e[s])
+                state['step_coef'][2].copy_(self.c1[s])
+                state['graph'].replay()
+            else:
+                self.body(state, state['t'][s], self.coef_x[s], self.coef_e[s], self.c1[s], step=s)
+        return state['xt'].clone()
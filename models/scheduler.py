@@ -0,0 +1,198 @@
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+import torch
+import torch.nn.functional as F
+from models.ddm import Net
+
+
+class ScheduledRequest:
+    def __init__(self, image):
+        self.image = image
+        self.size = tuple(image.shape[-2:])
+        self.future = Future()
+        self.arrival = time.perf_counter()
+        self.admitted = None
+
+        # filled in on admission
+        self.cond = None
+        self.skips = None
+        self.x = None
+        self.generator = None
+        self.step = 0
+
+
+class ContinuousBatchScheduler:
+    """
+    Iteration-level (continuous) batching of the DDIM loop in `Net.sample_training`.
+
+    Instead of running a batch from the first to the last timestep, the scheduler keeps a pool
+    of in-flight latents that may be at different timesteps. Every tick runs one batched UNet
+    call per padded shape over all of them, each sample with its own `t`, applies the DDIM
+    update per sample and then lets finished requests leave and waiting ones join. A request
+    that arrives mid-way therefore starts on the next tick instead of waiting for a whole batch.
+
+    Args:
+        net: The (unwrapped) `Net`.
+        max_batch_size: Maximum number of latents in flight.
+        eta: DDIM eta, as in `Net.sample_training`.
+    """
+
+    def __init__(self, net, max_batch_size=16, eta=0.):
+        self.net = net
+        self.device = net.device
+        self.max_batch_size = max_batch_size
+        self.eta = eta
+        self.b = net.betas.to(self.device)
+        timesteps = net.sampling_timesteps()
+        self.t_seq = [i for i, _ in timesteps]
+        self.next_t_seq = [j for _, j in timesteps]
+
+        self.incoming = queue.Queue()
+        self.active = []
+        self.stopped = threading.Event()
+        self.ticks = 0
+        self.ticked_latents = 0
+
+    def generator(self):
+        seed = getattr(self.net.config.sampling, 'seed', None)
+        return None if seed is None else torch.Generator().manual_seed(seed)
+
+    def noise(self, request):
+        """Next noise draw of a request, from its own generator when `sampling.seed` is set (as in `Net`)."""
+        generators = None if request.generator is None else [request.generator]
+        return self.net.sample_noise((1,) + tuple(request.cond.shape), generators)[0]
+
+    def submit(self, image):
+        """Queue a [3, H, W] image in [0, 1]; returns a concurrent.futures.Future of the enhanced image."""
+        request = ScheduledRequest(image)
+        self.incoming.put(request)
+        return request.future
+
+    def pending(self):
+        return self.incoming.qsize() + len(self.active)
+
+    @staticmethod
+    def pad(image):
+        h, w = image.shape[-2:]
+        img_h_64 = int(64 * np.ceil(h / 64.0))
+        img_w_64 = int(64 * np.ceil(w / 64.0))
+        return F.pad(image.unsqueeze(0), (0, img_w_64 - w, 0, img_h_64 - h), mode='reflect')
+
+    def admit(self, block):
+        admitted = []
+        while len(self.active) + len(admitted) < self.max_batch_size:
+            try:
+                request = self.incoming.get(block=block and not self.active and not admitted, timeout=0.1)
+            except queue.Empty:
+                break
+            admitted.append(request)
+        if not admitted:
+            return
+
+        # encode newcomers together when they share a shape
+        groups = OrderedDict()
+        for request in admitted:
+            try:
+                padded = self.pad(request.image.to(self.device))
+            except Exception as e:
+                request.future.set_exception(e)
+                continue
+            groups.setdefault(tuple(padded.shape), []).append((request, padded))
+        for members in groups.values():
+            try:
+                cond, skips = self.net.encode(torch.cat([padded for _, padded in members], dim=0))
+            except Exception as e:
+                for request, _ in members:
+                    request.future.set_exception(e)
+                continue
+            for k, (request, _) in enumerate(members):
+                request.cond = cond[k]
+                request.skips = tuple(s[k] for s in skips)
+                request.generator = self.generator()
+                request.x = self.noise(request)
+                request.admitted = time.perf_counter()
+                self.active.append(request)
+
+    def tick(self):
+        groups = OrderedDict()
+        for request in self.active:
+            groups.setdefault(tuple(request.x.shape), []).append(request)
+
+        finished = []
+        for members in groups.values():
+            self.ticks += 1
+            self.ticked_latents += len(members)
+            cond = torch.stack([r.cond for r in members], dim=0)
+            xt = torch.stack([r.x for r in members], dim=0)
+            t = torch.tensor([self.t_seq[r.step] for r in members], device=self.device, dtype=torch.float)
+            next_t = torch.tensor([self.next_t_seq[r.step] for r in members], device=self.device, dtype=torch.float)
+            at = Net.compute_alpha(self.b, t.long())
+            at_next = Net.compute_alpha(self.b, next_t.long())
+
+            et = self.net.Unet(torch.cat([cond, xt], dim=1), t)
+            x0_t = (xt - et * (1 - at).sqrt()) / at.sqrt()
+
+            c1 = self.eta * ((1 - at / at_next) * (1 - at_next) / (1 - at)).sqrt()
+            c2 = ((1 - at_next) - c1 ** 2).sqrt()
+            xt_next = at_next.sqrt() * x0_t + c2 * et
+            if self.eta > 0:
+                xt_next = xt_next + c1 * torch.stack([self.noise(r) for r in members], dim=0)
+
+            for k, request in enumerate(members):
+                request.x = xt_next[k]
+                request.step += 1
+                if request.step == len(self.t_seq):
+                    finished.append(request)
+
+        if finished:
+            self.active = [r for r in self.active if r.step < len(self.t_seq)]
+            self.finish(finished)
+
+    def finish(self, finished):
+        groups = OrderedDict()
+        for request in finished:
+            groups.setdefault(tuple(request.x.shape), []).append(request)
+        for members in groups.values():
+            pred_fea = torch.stack([r.x for r in members], dim=0)
+            skips = tuple(torch.stack(level, dim=0) for level in zip(*[r.skips for r in members]))
+            try:
+                pred_x = self.net.decode(pred_fea, skips)
+            except Exception as e:
+                for request in members:
+                    request.future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            for k, request in enumerate(members):
+                h, w = request.size
+                output = torch.clamp(pred_x[k, :, :h, :w], 0, 1).cpu()
+                timings = {'queue_ms': 1000 * (request.admitted - request.arrival),
+                           'infer_ms': 1000 * (done - request.admitted),
+                           'total_ms': 1000 * (done - request.arrival)}
+                request.future.set_result((output, timings))
+
+    def step(self, block=False):
+        """Admit waiting requests, then advance every in-flight latent by one timestep."""
+        with torch.no_grad():
+            self.admit(block)
+            if self.active:
+                self.tick()
+
+    def fail_all(self, error):
+        for request in self.active:
+            if not request.future.done():
+                request.future.set_exception(error)
+        self.active = []
+
+    def run_forever(self):
+        while not self.stopped.is_set():
+            try:
+                self.step(block=True)
+            except Exception as e:
+                self.fail_all(e)
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,128 @@
+import math
+from collections import Counter, namedtuple
+import torch
+import torch.nn.functional as F
+from datasets.sampler import padded_shape
+
+ShapePlan = namedtuple('ShapePlan', ['mode', 'target', 'resized'])
+
+
+def pad_to(x, target):
+    h, w = x.shape[-2:]
+    pad_h, pad_w = target[0] - h, target[1] - w
+    if pad_h == 0 and pad_w == 0:
+        return x
+    mode = 'reflect' if pad_h < h and pad_w < w else 'replicate'
+    return F.pad(x, (0, pad_w, 0, pad_h), mode=mode)
+
+
+class ShapePlanner:
+    """
+    Maps arbitrary input sizes onto a small set of canonical shapes.
+
+    An input is padded up to the canonical shape that wastes the fewest pixels as long as the
+    padded fraction stays under `max_pad_ratio`. Otherwise it may be downscaled by at most
+    `max_downscale` so it fits one, and the output is resized back. Inputs that fit neither way
+    fall back to the usual pad-to-64 shape. Fewer distinct shapes mean fewer cuDNN autotune
+    runs and `torch.compile` recompiles.
+
+    Args:
+        canonical_shapes: List of (H, W) pairs, each a multiple of `multiple`.
+    """
+
+    def __init__(self, canonical_shapes, max_pad_ratio=0.25, max_downscale=0.15, multiple=64):
+        self.canonical_shapes = sorted({tuple(int(v) for v in shape) for shape in canonical_shapes},
+                                       key=lambda s: s[0] * s[1])
+        for h, w in self.canonical_shapes:
+            if h % multiple or w % multiple:
+                raise ValueError('canonical shape {}x{} is not a multiple of {}'.format(h, w, multiple))
+        self.max_pad_ratio = max_pad_ratio
+        self.max_downscale = max_downscale
+        self.multiple = multiple
+        self.plans = {}
+
+        self.modes = Counter()
+        self.input_pixels = 0
+        self.computed_pixels = 0
+
+    def plan(self, h, w):
+        if (h, w) in self.plans:
+            return self.plans[(h, w)]
+
+        best = None
+        for target_h, target_w in self.canonical_shapes:
+            if target_h >= h and target_w >= w:
+                waste = 1 - h * w / (target_h * target_w)
+                if waste <= self.max_pad_ratio and (best is None or waste < best[0]):
+                    best = (waste, ShapePlan('pad', (target_h, target_w), (h, w)))
+        if best is None:
+            for target_h, target_w in self.canonical_shapes:
+                scale = min(target_h / h, target_w / w)
+                if scale >= 1 or scale < 1 - self.max_downscale:
+                    continue
+                resized = (min(target_h, int(math.floor(h * scale))), min(target_w, int(math.floor(w * scale))))
+                waste = 1 - resized[0] * resized[1] / (target_h * target_w)
+                if waste <= self.max_pad_ratio and (best is None or waste < best[0]):
+                    best = (waste, ShapePlan('resize', (target_h, target_w), resized))
+        plan = best[1] if best is not None else ShapePlan('fallback', padded_shape(h, w, self.multiple), (h, w))
+        self.plans[(h, w)] = plan
+        return plan
+
+    def apply(self, x):
+        """Bring a [B, C, h, w] batch to its planned shape; returns (x, plan)."""
+        h, w = x.shape[-2:]
+        plan = self.plan(h, w)
+        if plan.mode == 'resize':
+            x = F.interpolate(x, size=plan.resized, mode='bilinear', align_corners=False, antialias=True)
+        self.modes[plan.mode] += x.shape[0]
+        self.input_pixels += x.shape[0] * h * w
+        self.computed_pixels += x.shape[0] * plan.target[0] * plan.target[1]
+        return pad_to(x, plan.target), plan
+
+    @staticmethod
+    def restore(pred, plan, size):
+        """Undo `apply` on the model output: crop the padding, then resize back if needed."""
+        pred = pred[:, :, :plan.resized[0], :plan.resized[1]]
+        if plan.mode == 'resize':
+            pred = F.interpolate(pred, size=size, mode='bilinear', align_corners=False)
+        return pred
+
+    def stats(self):
+        overhead = self.computed_pixels / self.input_pixels - 1 if self.input_pixels else 0.0
+        return {'modes': dict(self.modes), 'padding_overhead': overhead}
+
+
+class ExecutableCache:
+    """
+    Cache of model executables per input shape apart from the batch dimension, so every batch size
+    of a canonical shape shares one entry. `factory(fn, shape)` builds the callable for one shape
+    (eager by default, or a compiled function); `warmup` runs it on the given full shapes so the
+    first real request does not pay for autotuning or compilation.
+    """
+
+    def __init__(self, factory=None):
+        self.factory = factory
+        self.executables = {}
+        self.hits = 0
+        self.misses = 0
+
+    def executable(self, shape, fn):
+        key = tuple(shape[1:])
+        if key not in self.executables:
+            self.executables[key] = fn if self.factory is None else self.factory(fn, key)
+        return self.executables[key]
+
+    def get(self, shape, fn):
+        if tuple(shape[1:]) in self.executables:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return self.executable(shape, fn)
+
+    def warmup(self, fn, shapes, make_input):
+        with torch.no_grad():
+            for shape in shapes:
+                self.executable(shape, fn)(make_input(tuple(shape)))
+
+    def stats(self):
+        return {'shapes': len(self.executables), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,49 @@
+import math
+import torch
+
+
+def tile_starts(size, tile, overlap):
+    """Offsets of tiles of `tile` pixels covering `size`, spread evenly with at least `overlap` shared pixels."""
+    if size <= tile:
+        return [0]
+    count = math.ceil((size - overlap) / (tile - overlap))
+    return [round(i * (size - tile) / (count - 1)) for i in range(count)]
+
+
+def blend_window(tile, overlap, device):
+    """Weights rising linearly over `overlap` pixels at each edge of a tile, so seams cross-fade."""
+    ramp = torch.ones(tile, device=device)
+    if overlap > 0:
+        edge = torch.arange(1, overlap + 1, device=device, dtype=torch.float32) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge.flip(0)
+    return ramp[:, None] * ramp[None, :]
+
+
+def run_tiled(fn, x, tile, overlap=64, batch_size=4):
+    """
+    Run a model on overlapping tiles of `x` ([B, C, H, W], H and W multiples of 64) and blend
+    the predictions back together. `fn` takes a batch of [N, C, tile, tile] inputs and returns
+    {'pred_x': [N, 3, tile, tile]}; up to `batch_size` tiles go through it at once. Bounds the
+    activation memory of large images at the cost of some redundant computation in the overlaps.
+    """
+    if tile % 64 != 0 or not 0 <= overlap < tile:
+        raise ValueError("tile size must be a multiple of 64 and larger than the overlap, got {} / {}"
+                         .format(tile, overlap))
+    n, _, h, w = x.shape
+    tile_h, tile_w = min(tile, h), min(tile, w)
+    boxes = [(k, top, left) for k in range(n)
+             for top in tile_starts(h, tile_h, overlap) for left in tile_starts(w, tile_w, overlap)]
+    window = blend_window(tile, overlap, x.device)[:tile_h, :tile_w]
+
+    output, weight = None, torch.zeros(n, 1, h, w, device=x.device)
+    for start in range(0, len(boxes), batch_size):
+        chunk = boxes[start:start + batch_size]
+        tiles = torch.stack([x[k, :, top:top + tile_h, left:left + tile_w] for k, top, left in chunk], dim=0)
+        pred = fn(tiles)["pred_x"].float()
+        if output is None:
+            output = torch.zeros(n, pred.shape[1], h, w, device=x.device)
+        for (k, top, left), p in zip(chunk, pred):
+            output[k, :, top:top + tile_h, left:left + tile_w] += p * window
+            weight[k, :, top:top + tile_h, left:left + tile_w] += window
+    return {"pred_x": output / weight}
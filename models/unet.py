@@ -80,6 +80,9 @@ class Downsample(nn.Module):
 
 
 class ResnetBlock(nn.Module):
+    # set by models.optimize.fuse_norm_act once norm1/norm2 apply the swish themselves
+    fused_norm_act = False
+
     def __init__(self, *, in_channels, out_channels=None, conv_shortcut=False,
                  dropout, temb_channels=512):
         super().__init__()
@@ -120,13 +123,15 @@ class ResnetBlock(nn.Module):
     def forward(self, x, temb):
         h = x
         h = self.norm1(h)
-        h = nonlinearity(h)
+        if not self.fused_norm_act:
+            h = nonlinearity(h)
         h = self.conv1(h)
 
         h = h + self.temb_proj(nonlinearity(temb))[:, :, None, None]
 
         h = self.norm2(h)
-        h = nonlinearity(h)
+        if not self.fused_norm_act:
+            h = nonlinearity(h)
         h = self.dropout(h)
         h = self.conv2(h)
 
@@ -140,6 +145,10 @@ class ResnetBlock(nn.Module):
 
 
 class AttnBlock(nn.Module):
+    # 'math' (bmm + softmax) or 'sdpa' (F.scaled_dot_product_attention); set by
+    # models.optimize.set_attention_backend
+    backend = 'math'
+
     def __init__(self, in_channels):
         super().__init__()
         self.in_channels = in_channels
@@ -175,6 +184,13 @@ class AttnBlock(nn.Module):
 
         # compute attention
         b, c, h, w = q.shape
+        if self.backend == 'sdpa':
+            # same scale (c**-0.5) and softmax axis, one head of width c
+            q, k, v = (y.reshape(b, 1, c, h*w).transpose(2, 3) for y in (q, k, v))
+            h_ = torch.nn.functional.scaled_dot_product_attention(q, k, v)
+            h_ = h_.transpose(2, 3).reshape(b, c, h, w)
+            return x+self.proj_out(h_)
+
         q = q.reshape(b, c, h*w)
         q = q.permute(0, 2, 1)   # b,hw,c
         k = k.reshape(b, c, h*w)  # b,c,hw
@@ -195,6 +211,9 @@ class AttnBlock(nn.Module):
 
 
 class DiffusionUNet(nn.Module):
+    # set by models.optimize.fuse_norm_act once norm_out applies the swish itself
+    fused_norm_act = False
+
     def __init__(self, config):
         super().__init__()
         self.config = config
@@ -331,6 +350,69 @@ class DiffusionUNet(nn.Module):
 
         # end
         h = self.norm_out(h)
-        h = nonlinearity(h)
+        if not self.fused_norm_act:
+            h = nonlinearity(h)
         h = self.conv_out(h)
         return h
+
+    def forward_cached(self, x, t, level, deep=None):
+        """
+        DeepCache-style forward: resolution levels >= `level` and the middle block form the deep
+        branch. With `deep=None` the full network runs and the deep branch's output (the input of
+        up[level - 1]) is returned with the prediction; passing it back in on the next steps
+        recomputes only the high-resolution levels < `level` and reuses the deep features.
+
+        Returns:
+            (prediction, deep features)
+        """
+        if not 1 <= level < self.num_resolutions:
+            raise ValueError('deepcache level must be in [1, {}], got {}'.format(self.num_resolutions - 1, level))
+
+        # timestep embedding
+        temb = get_timestep_embedding(t, self.ch)
+        temb = self.temb.dense[0](temb)
+        temb = nonlinearity(temb)
+        temb = self.temb.dense[1](temb)
+
+        # downsampling, stopping before the deep levels when they are cached
+        hs = [self.conv_in(x)]
+        down_levels = self.num_resolutions if deep is None else level
+        for i_level in range(down_levels):
+            for i_block in range(self.num_res_blocks):
+                h = self.down[i_level].block[i_block](hs[-1], temb)
+                if len(self.down[i_level].attn) > 0:
+                    h = self.down[i_level].attn[i_block](h)
+                hs.append(h)
+            if i_level != down_levels-1 or (deep is None and i_level != self.num_resolutions-1):
+                hs.append(self.down[i_level].downsample(hs[-1]))
+        if deep is None:
+            h = hs[-1]
+            h = self.mid.block_1(h, temb)
+            h = self.mid.attn_1(h)
+            h = self.mid.block_2(h, temb)
+            for i_level in reversed(range(level, self.num_resolutions)):
+                for i_block in range(self.num_res_blocks+1):
+                    h = self.up[i_level].block[i_block](
+                        torch.cat([h, hs.pop()], dim=1), temb)
+                    if len(self.up[i_level].attn) > 0:
+                        h = self.up[i_level].attn[i_block](h)
+                h = self.up[i_level].upsample(h)
+            deep = h
+
+        # upsampling through the shallow levels
+        h = deep
+        for i_level in reversed(range(level)):
+            for i_block in range(self.num_res_blocks+1):
+                h = self.up[i_level].block[i_block](
+                    torch.cat([h, hs.pop()], dim=1), temb)
+                if len(self.up[i_level].attn) > 0:
+                    h = self.up[i_level].attn[i_block](h)
+            if i_level != 0:
+                h = self.up[i_level].upsample(h)
+
+        # end
+        h = self.norm_out(h)
+        if not self.fused_norm_act:
+            h = nonlinearity(h)
+        h = self.conv_out(h)
+        return h, deep
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+
+METRIC_COLUMNS = ('psnr', 'ssim', 'lpips', 'niqe', 'pi')
+
+
+class ResultsStore:
+    """
+    SQLite store of per-image evaluation results. Rows are keyed by image id and a run key, the
+    hash of everything that changes the numbers (checkpoint fingerprint, sampler signature,
+    dataset, metric mode), so re-running an evaluation only computes the images it is missing and
+    many checkpoints can share one database.
+
+    Image ids are `<subset>/<file name>`, the subset being the folder above `low/`.
+    """
+
+    def __init__(self, path, run):
+        self.path = path
+        self.run = run
+        self.run_key = hashlib.sha256(json.dumps(run, sort_keys=True).encode()).hexdigest()[:16]
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS runs (run_key TEXT PRIMARY KEY, run TEXT, created REAL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results (run_key TEXT, image_id TEXT, subset TEXT, {}, '
+                          'created REAL, PRIMARY KEY (run_key, image_id))'
+                          .format(', '.join(c + ' REAL' for c in METRIC_COLUMNS)))
+        self.conn.execute('INSERT OR IGNORE INTO runs VALUES (?, ?, ?)',
+                          (self.run_key, json.dumps(run, sort_keys=True), time.time()))
+        self.conn.commit()
+
+    def done(self, required=()):
+        """Image ids of this run that already have every metric in `required`."""
+        condition = ''.join(' AND {} IS NOT NULL'.format(c) for c in required)
+        rows = self.conn.execute('SELECT image_id FROM results WHERE run_key = ?' + condition, (self.run_key,))
+        return {row[0] for row in rows}
+
+    def add(self, record, commit=True):
+        image_id = record['name']
+        subset = image_id.rsplit('/', 1)[0] if '/' in image_id else ''
+        # metrics missing from the record (not selected with --metrics) keep their stored values
+        self.conn.execute('INSERT INTO results VALUES (?, ?, ?, {}, ?) ON CONFLICT (run_key, image_id) DO UPDATE SET '
+                          '{}, created = excluded.created'.format(
+                              ', '.join('?' * len(METRIC_COLUMNS)),
+                              ', '.join('{0} = COALESCE(excluded.{0}, {0})'.format(c) for c in METRIC_COLUMNS)),
+                          (self.run_key, image_id, subset) + tuple(record.get(c) for c in METRIC_COLUMNS) + (time.time(),))
+        if commit:
+            self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
+
+    def aggregate(self, percentiles=(50, 90)):
+        """
+        Mean, percentiles and count of every metric of this run, overall ('all') and per subset.
+        Returns {group: {metric: {'mean': ..., 'p50': ..., 'count': ...}}}.
+        """
+        rows = self.conn.execute('SELECT subset, {} FROM results WHERE run_key = ?'.format(', '.join(METRIC_COLUMNS)),
+                                 (self.run_key,)).fetchall()
+        groups = {'all': rows}
+        for row in rows:
+            if row[0]:
+                groups.setdefault(row[0], []).append(row)
+
+        summary = {}
+        for group, group_rows in groups.items():
+            summary[group] = {}
+            for i, metric in enumerate(METRIC_COLUMNS, start=1):
+                values = np.array([row[i] for row in group_rows if row[i] is not None], dtype=np.float64)
+                if len(values) == 0:
+                    continue
+                stats = {'mean': float(values.mean()), 'count': int(len(values))}
+                for p in percentiles:
+                    stats['p{}'.format(p)] = float(np.percentile(values, p))
+                summary[group][metric] = stats
+        return summary
+
+    def close(self):
+        self.conn.close()
+
+
+def print_summary(summary):
+    for group, metrics in summary.items():
+        if not metrics:
+            continue
+        count = max(stats['count'] for stats in metrics.values())
+        print("{} ({} images): ".format(group, count) + ", ".join(
+            "{}={:.4f} (p50 {:.4f}, p90 {:.4f})".format(metric.upper(), s['mean'], s.get('p50', s['mean']),
+                                                          s.get('p90', s['mean']))
+            for metric, s in metrics.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the runs of a results database and their aggregates.")
+    parser.add_argument("db", type=str, help="SQLite results database written by evaluate.py --results_db")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    for run_key, run in conn.execute('SELECT run_key, run FROM runs ORDER BY created').fetchall():
+        print("run {}: {}".format(run_key, run))
+        store = ResultsStore(args.db, json.loads(run))
+        print_summary(store.aggregate())
+        store.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+import asyncio
+import torch
+from models import InferenceDiffusion, DiffusiveRestoration
+from serving import build_server
+from utils.config_utils import parse_args_and_config
+
+
+def main():
+    args, config = parse_args_and_config(mode="serving")
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    print("Using device:", device)
+    config.device = device
+
+    print("=> Creating denoising-diffusion model...")
+    diffusion = InferenceDiffusion(args, config)
+    restoration_model = DiffusiveRestoration(diffusion, args, config)
+    restoration_model.warmup(batch_sizes=getattr(config.sampling, 'warmup_batch_sizes', None) or [1, args.max_batch_size])
+
+    server = build_server(restoration_model, args)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+from serving.batcher import *
+from serving.server import *
@@ -0,0 +1,206 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from datasets.sampler import padded_shape
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class LatencyStats:
+    """Rolling window of per-request latencies (milliseconds) plus global counters."""
+
+    def __init__(self, window=2048):
+        self.window = window
+        self.samples = {'queue_ms': deque(maxlen=window), 'infer_ms': deque(maxlen=window),
+                        'total_ms': deque(maxlen=window)}
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.batched_images = 0
+
+    def record(self, **timings):
+        for key, value in timings.items():
+            self.samples[key].append(value)
+
+    def summary(self):
+        summary = {'requests': self.requests, 'rejected': self.rejected, 'failed': self.failed,
+                   'batches': self.batches,
+                   'mean_batch_size': self.batched_images / self.batches if self.batches else 0.0}
+        for key, values in self.samples.items():
+            if values:
+                p50, p95, p99 = np.percentile(np.asarray(values), [50, 95, 99])
+                summary[key] = {'p50': float(p50), 'p95': float(p95), 'p99': float(p99),
+                                'mean': float(np.mean(values))}
+        return summary
+
+
+class DynamicBatcher:
+    """
+    Groups concurrent requests into model batches.
+
+    Requests enter a bounded asyncio queue (a full queue is reported to the caller instead of
+    waiting, which is the server's backpressure signal) and are sorted into buckets by padded
+    shape. A bucket is dispatched when it holds `max_batch_size` images or when its oldest
+    request has waited `max_wait_ms`. Batches run one at a time on a dedicated thread, so the
+    event loop keeps accepting requests while the model is busy; those then form the next batch.
+
+    Args:
+        run_batch: Callable taking a list of [3, H, W] tensors and returning a list of outputs.
+        multiple: Padding multiple used to decide which images can share a batch.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10, max_queue=64, multiple=64):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.multiple = multiple
+        self.max_queue = max_queue
+        self.queue = None
+        self.arrived = None
+        self.buckets = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = LatencyStats()
+        self.task = None
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.arrived = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, image):
+        """Enqueue one [3, H, W] tensor and wait for its output. Raises QueueFullError under overload."""
+        future = asyncio.get_running_loop().create_future()
+        request = {'image': image, 'future': future, 'arrival': time.perf_counter()}
+        try:
+            self.queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            raise QueueFullError('request queue is full ({} pending)'.format(self.queue.qsize()))
+        self.arrived.set()
+        self.stats.requests += 1
+        return await future
+
+    def pending(self):
+        queued = self.queue.qsize() if self.queue is not None else 0
+        return queued + sum(len(bucket) for bucket in self.buckets.values())
+
+    def summary(self):
+        return self.stats.summary()
+
+    def add(self, request):
+        key = padded_shape(*request['image'].shape[-2:], multiple=self.multiple)
+        self.buckets.setdefault(key, []).append(request)
+
+    def next_ready(self, now):
+        for key, bucket in self.buckets.items():
+            if len(bucket) >= self.max_batch_size or now - bucket[0]['arrival'] >= self.max_wait:
+                return key
+        return None
+
+    def next_deadline(self, now):
+        if not self.buckets:
+            return None
+        oldest = min(bucket[0]['arrival'] for bucket in self.buckets.values())
+        return max(0.0, oldest + self.max_wait - now)
+
+    async def loop(self):
+        while True:
+            # requests are only taken with get_nowait: a timed-out wait_for(queue.get()) can lose the
+            # item it dequeued on Python <= 3.11, a timed-out wait on the arrival event cannot
+            self.arrived.clear()
+            while not self.queue.empty():
+                self.add(self.queue.get_nowait())
+
+            key = self.next_ready(time.perf_counter())
+            if key is None:
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), timeout=self.next_deadline(time.perf_counter()))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            while key is not None:
+                bucket = self.buckets.pop(key)
+                batch, rest = bucket[:self.max_batch_size], bucket[self.max_batch_size:]
+                if rest:
+                    self.buckets[key] = rest
+                await self.dispatch(batch)
+                key = self.next_ready(time.perf_counter())
+
+    async def dispatch(self, batch):
+        start = time.perf_counter()
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.run_batch, [request['image'] for request in batch])
+        except Exception as e:
+            self.stats.failed += len(batch)
+            for request in batch:
+                if not request['future'].done():
+                    request['future'].set_exception(e)
+            return
+        end = time.perf_counter()
+
+        self.stats.batches += 1
+        self.stats.batched_images += len(batch)
+        for request, output in zip(batch, outputs):
+            timings = {'queue_ms': 1000 * (start - request['arrival']), 'infer_ms': 1000 * (end - start),
+                       'total_ms': 1000 * (end - request['arrival'])}
+            self.stats.record(**timings)
+            if not request['future'].done():
+                request['future'].set_result((output, timings))
+
+
+class ContinuousBatcher:
+    """
+    Serves requests through a `ContinuousBatchScheduler` running on a background thread, with
+    the same submit/pending/summary interface as `DynamicBatcher`. Batch statistics count
+    UNet calls (one per padded shape per tick) instead of whole-request batches.
+    """
+
+    def __init__(self, scheduler, max_queue=64):
+        self.scheduler = scheduler
+        self.max_queue = max_queue
+        self.stats = LatencyStats()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.scheduler.run_forever, daemon=True)
+        self.thread.start()
+
+    async def stop(self):
+        self.scheduler.stop()
+
+    async def submit(self, image):
+        if self.scheduler.incoming.qsize() >= self.max_queue:
+            self.stats.rejected += 1
+            raise QueueFullError('request queue is full ({} pending)'.format(self.scheduler.incoming.qsize()))
+        self.stats.requests += 1
+        try:
+            output, timings = await asyncio.wrap_future(self.scheduler.submit(image))
+        except Exception:
+            self.stats.failed += 1
+            raise
+        self.stats.record(**timings)
+        return output, timings
+
+    def pending(self):
+        return self.scheduler.pending()
+
+    def summary(self):
+        self.stats.batches = self.scheduler.ticks
+        self.stats.batched_images = self.scheduler.ticked_latents
+        return self.stats.summary()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import http.client
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+
+class EnhancementClient:
+    """Blocking client for serving/server.py; keeps one keep-alive connection per thread."""
+
+    def __init__(self, url, timeout=300):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, 'conn', None) is None:
+            self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self.local.conn
+
+    def request(self, method, path, body=None):
+        conn = self.connection()
+        try:
+            conn.request(method, path, body=body)
+            response = conn.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        except (ConnectionError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+
+    def health(self):
+        return json.loads(self.request('GET', '/health')[2])
+
+    def metrics(self):
+        return json.loads(self.request('GET', '/metrics')[2])
+
+    def enhance(self, data, fmt='png'):
+        """Returns (status, headers, body); body is the enhanced image when status == 200."""
+        return self.request('POST', '/enhance?format={}'.format(fmt), body=data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send images to a running LightenDiffusion server and report latency.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server address")
+    parser.add_argument("--input", default=None, help="Image file or directory to send")
+    parser.add_argument("--output", default=None, help="Directory to write enhanced images to")
+    parser.add_argument("--concurrency", default=4, type=int, help="Number of requests in flight")
+    parser.add_argument("--repeat", default=1, type=int, help="Send every image this many times")
+    parser.add_argument("--format", default="png", choices=["png", "jpg", "webp"], help="Response image format")
+    parser.add_argument("--health", action="store_true", help="Only query /health and /metrics")
+    args = parser.parse_args()
+
+    client = EnhancementClient(args.url)
+    if args.health or args.input is None:
+        print(json.dumps({'health': client.health(), 'metrics': client.metrics()}, indent=2))
+        return
+
+    if os.path.isdir(args.input):
+        paths = sorted(os.path.join(args.input, f) for f in os.listdir(args.input)
+                       if f.lower().endswith(IMAGE_EXTENSIONS))
+    else:
+        paths = [args.input]
+    if not paths:
+        sys.exit(f"Error: no images found in '{args.input}'")
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    def send(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        start = time.perf_counter()
+        status, headers, body = client.enhance(data, args.format)
+        latency = 1000 * (time.perf_counter() - start)
+        if status == 200 and args.output:
+            name = os.path.splitext(os.path.basename(path))[0] + '.' + args.format
+            with open(os.path.join(args.output, name), 'wb') as f:
+                f.write(body)
+        return status, latency
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(send, paths * args.repeat))
+    total = time.perf_counter() - start
+
+    latencies = np.asarray([latency for status, latency in results if status == 200])
+    failures = [status for status, _ in results if status != 200]
+    print(f"{len(results)} requests in {total:.2f}s ({len(results) / total:.2f} req/s), {len(failures)} failed")
+    if latencies.size:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"latency ms: p50={p50:.1f} p95={p95:.1f} p99={p99:.1f} max={latencies.max():.1f}")
+    print(json.dumps(client.metrics(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import io
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit, parse_qs
+import torch
+import torchvision.transforms.functional as TF
+from PIL import Image
+from datasets.sampler import pad_collate
+from models.ddm import unwrap_model
+from models.scheduler import ContinuousBatchScheduler
+from serving.batcher import DynamicBatcher, ContinuousBatcher, QueueFullError
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+CONTENT_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'webp': 'image/webp'}
+PIL_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'webp': 'WEBP'}
+
+
+def decode_image(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return TF.to_tensor(img.convert('RGB'))
+
+
+def encode_image(img, fmt, quality=95):
+    ndarr = img.mul(255).add_(0.5).clamp_(0, 255).permute(1, 2, 0).to('cpu', torch.uint8).numpy()
+    buffer = io.BytesIO()
+    options = {'compress_level': 1} if fmt == 'png' else {'quality': quality}
+    Image.fromarray(ndarr).save(buffer, format=PIL_FORMATS[fmt], **options)
+    return buffer.getvalue()
+
+
+def make_batch_runner(restoration):
+    """Adapt DiffusiveRestoration.forward_sample to the batcher's list-in/list-out interface."""
+    def run_batch(images):
+        x, _, sizes = pad_collate([(img, None) for img in images])
+        with torch.no_grad():
+            pred_x = restoration.forward_sample(x).cpu()
+        return [pred_x[k, :, :h, :w] for k, (h, w) in enumerate(sizes.tolist())]
+    return run_batch
+
+
+class EnhancementServer:
+    """
+    Minimal HTTP/1.1 server on asyncio streams.
+
+    POST /enhance   body: encoded image, query: format=png|jpg|webp, quality=1-100
+                    returns the enhanced image; latency breakdown in X-Queue-Ms / X-Infer-Ms / X-Total-Ms
+    GET  /health    liveness plus current queue depth
+    GET  /metrics   request counters, batch sizes and latency percentiles as JSON
+    """
+
+    def __init__(self, batcher, host='127.0.0.1', port=8000, model_stats=dict):
+        self.batcher = batcher
+        self.model_stats = model_stats
+        self.host = host
+        self.port = port
+        self.started = time.time()
+
+    async def serve_forever(self):
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"=> Serving on http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                if body is None:
+                    # body was not read, so the connection cannot be reused
+                    status, content_type, payload, extra = self.json_response(413, {'error': 'body too large'})
+                    headers['connection'] = 'close'
+                else:
+                    status, content_type, payload, extra = await self.route(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, content_type, payload, extra, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_BYTES:
+            return method, target, headers, None
+        body = await reader.readexactly(length) if length else b''
+        return method, target, headers, body
+
+    def write_response(self, writer, status, content_type, payload, extra, keep_alive):
+        head = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(payload)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{name}: {value}" for name, value in extra.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+
+    def json_response(self, status, obj):
+        return status, 'application/json', json.dumps(obj).encode(), {}
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/health':
+            return self.json_response(200, {'status': 'ok', 'pending': self.batcher.pending(),
+                                            'uptime_s': time.time() - self.started})
+        if url.path == '/metrics':
+            return self.json_response(200, dict(self.batcher.summary(), model=self.model_stats()))
+        if url.path != '/enhance':
+            return self.json_response(404, {'error': 'unknown path {}'.format(url.path)})
+        if method != 'POST':
+            return self.json_response(405, {'error': 'use POST'})
+
+        query = parse_qs(url.query)
+        fmt = query.get('format', ['png'])[0]
+        if fmt not in PIL_FORMATS:
+            return self.json_response(400, {'error': 'unsupported format {}'.format(fmt)})
+        try:
+            quality = int(query.get('quality', ['95'])[0])
+        except ValueError:
+            return self.json_response(400, {'error': 'quality must be an integer'})
+
+        loop = asyncio.get_running_loop()
+        try:
+            image = await loop.run_in_executor(None, decode_image, body)
+        except Exception as e:
+            return self.json_response(400, {'error': 'cannot decode image: {}'.format(e)})
+        try:
+            output, timings = await self.batcher.submit(image)
+        except QueueFullError as e:
+            return 503, 'application/json', json.dumps({'error': str(e)}).encode(), {'Retry-After': '1'}
+        except Exception as e:
+            return self.json_response(500, {'error': str(e)})
+        payload = await loop.run_in_executor(None, encode_image, output, fmt, quality)
+        extra = {'X-Queue-Ms': '{:.1f}'.format(timings['queue_ms']),
+                 'X-Infer-Ms': '{:.1f}'.format(timings['infer_ms']),
+                 'X-Total-Ms': '{:.1f}'.format(timings['total_ms'])}
+        return 200, CONTENT_TYPES[fmt], payload, extra
+
+
+def continuous_unsupported(config):
+    """Settings of `config` that the continuous scheduler, which drives the bare PyTorch `Net`, would ignore."""
+    sampling = config.sampling
+    checks = {'sampling.routing': getattr(sampling, 'routing', False),
+              'sampling.precision': getattr(sampling, 'precision', 'fp32') != 'fp32',
+              'sampling.tile_size': bool(getattr(sampling, 'tile_size', 0)),
+              'sampling.backend': getattr(sampling, 'backend', 'torch') != 'torch',
+              'sampling.cache_dir': bool(getattr(sampling, 'cache_dir', None)),
+              'sampling.canonical_shapes': bool(getattr(sampling, 'canonical_shapes', None)),
+              'sampling.static_engine': getattr(sampling, 'static_engine', False),
+              'sampling.cuda_graph': getattr(sampling, 'cuda_graph', False),
+              'sampling.deepcache_interval': (getattr(sampling, 'deepcache_interval', 1) or 1) > 1}
+    return [name for name, enabled in checks.items() if enabled]
+
+
+def build_server(restoration, args):
+    if args.scheduler == 'continuous':
+        unsupported = continuous_unsupported(restoration.config)
+        if unsupported:
+            raise ValueError("--scheduler continuous does not support {}; use --scheduler dynamic"
+                             .format(', '.join(unsupported)))
+        scheduler = ContinuousBatchScheduler(unwrap_model(restoration.diffusion.model),
+                                             max_batch_size=args.max_batch_size,
+                                             eta=getattr(restoration.config.sampling, 'eta', 0.))
+        batcher = ContinuousBatcher(scheduler, max_queue=args.max_queue)
+    else:
+        batcher = DynamicBatcher(make_batch_runner(restoration), max_batch_size=args.max_batch_size,
+                                 max_wait_ms=args.max_wait_ms, max_queue=args.max_queue)
+    return EnhancementServer(batcher, host=args.host, port=args.port, model_stats=restoration.stats)
@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.fixture
+def tiny_config():
+    """configs/unsupervised.yml on CPU with a small UNet and two sampling steps, for fast model tests."""
+    torch = pytest.importorskip("torch")
+    from benchmarks.common import load_config
+    config = load_config("unsupervised.yml", torch.device("cpu"))
+    config.model.ch = 32
+    config.model.ch_mult = [1, 1, 1, 1]
+    config.model.num_res_blocks = 1
+    config.diffusion.num_sampling_timesteps = 2
+    return config
@@ -0,0 +1,13 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from benchmarks.common import load_config
+from benchmarks.cost_model import validate, check
+
+
+def test_predictions_match_measured_runs():
+    config = load_config("unsupervised.yml", torch.device("cpu"))
+    rows = validate(config, [64, 128], 1, 2)
+    failures = check(rows, count_tolerance=0.01, memory_tolerance=0.25)
+    assert failures == 0, [row for row in rows if row['failed']]
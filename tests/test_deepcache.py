@@ -0,0 +1,57 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from models.unet import DiffusionUNet
+
+
+@pytest.fixture
+def unet(tiny_config):
+    torch.manual_seed(0)
+    return DiffusionUNet(tiny_config).eval()
+
+
+@pytest.fixture
+def inputs():
+    torch.manual_seed(1)
+    return torch.randn(2, 6, 64, 64), torch.tensor([999.0, 949.0])
+
+
+@pytest.mark.parametrize("level", [1, 2, 3])
+def test_full_pass_matches_forward(unet, inputs, level):
+    x, t = inputs
+    with torch.no_grad():
+        reference = unet(x, t)
+        pred, deep = unet.forward_cached(x, t, level)
+    torch.testing.assert_close(pred, reference)
+    assert deep.shape[0] == x.shape[0]
+
+
+@pytest.mark.parametrize("level", [1, 2, 3])
+def test_cached_pass_reuses_deep_features(unet, inputs, level):
+    # with the deep features of the same step, the shallow-only pass reproduces the full one
+    x, t = inputs
+    with torch.no_grad():
+        reference, deep = unet.forward_cached(x, t, level)
+        pred, reused = unet.forward_cached(x, t, level, deep)
+    torch.testing.assert_close(pred, reference)
+    assert reused is deep
+
+
+def test_rejects_bad_level(unet, inputs):
+    x, t = inputs
+    for level in (0, 4):
+        with pytest.raises(ValueError):
+            unet.forward_cached(x, t, level)
+
+
+def test_interval_one_is_the_plain_sampler(tiny_config):
+    from benchmarks.common import build_net
+    tiny_config.sampling.deepcache_interval = 1
+    torch.manual_seed(0)
+    net = build_net(tiny_config)
+    x, t = torch.randn(1, 6, 64, 64), torch.tensor([999.0])
+    with torch.no_grad():
+        et, deep = net.unet_step(x, t, step=1, deep=None)
+        torch.testing.assert_close(et, net.Unet(x, t))
+    assert deep is None
@@ -0,0 +1,51 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("skimage")
+
+from metrics import compute_psnr, compute_ssim, to_numpy
+from metrics_engine import MetricEngine, quantize_uint8
+
+
+@pytest.fixture
+def images():
+    torch.manual_seed(0)
+    gt = torch.rand(3, 3, 48, 40)
+    pred = (gt + 0.1 * torch.randn_like(gt)).clamp(0, 1)
+    # values outside [0, 1] are clamped the same way by both paths
+    pred[0, :, :4] = 1.5
+    return gt, pred
+
+
+def test_quantize_matches_to_numpy(images):
+    _, pred = images
+    assert (quantize_uint8(pred[0]).permute(1, 2, 0).numpy() == to_numpy(pred[0])).all()
+
+
+def test_parity_with_skimage(images):
+    gt, pred = images
+    engine = MetricEngine(torch.device("cpu"), parity=True, metrics=("psnr", "ssim"))
+    results = engine.compute_batch(pred, gt)
+    for k in range(gt.shape[0]):
+        gt_np, pred_np = to_numpy(gt[k]), to_numpy(pred[k])
+        assert results["psnr"][k] == pytest.approx(compute_psnr(gt_np, pred_np), abs=1e-6)
+        assert results["ssim"][k] == pytest.approx(compute_ssim(gt_np, pred_np), abs=1e-6)
+
+
+def test_float_mode_is_close(images):
+    gt, pred = images
+    parity = MetricEngine(torch.device("cpu"), parity=True, metrics=("psnr", "ssim")).compute_batch(pred, gt)
+    fast = MetricEngine(torch.device("cpu"), parity=False, metrics=("psnr", "ssim")).compute_batch(pred, gt)
+    assert fast["psnr"] == pytest.approx(parity["psnr"], abs=0.1)
+    assert fast["ssim"] == pytest.approx(parity["ssim"], abs=0.01)
+
+
+def test_compute_groups_sizes_in_input_order():
+    torch.manual_seed(0)
+    preds = [torch.rand(3, 32, 32), torch.rand(3, 24, 40), torch.rand(3, 32, 32)]
+    refs = [p.flip(-1) for p in preds]
+    engine = MetricEngine(torch.device("cpu"), metrics=("psnr",))
+    per_image = engine.compute(preds, refs)
+    for pred, ref, result in zip(preds, refs, per_image):
+        assert result["psnr"] == pytest.approx(compute_psnr(to_numpy(ref), to_numpy(pred)), abs=1e-6)
+    assert engine.compute(preds) == [{}, {}, {}]
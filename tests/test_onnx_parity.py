@@ -0,0 +1,42 @@
+import copy
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from benchmarks.common import load_config, build_net
+from models.onnx_backend import export_onnx, check_parity, OnnxNet
+
+TOLERANCE = 1e-3
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    config = load_config("unsupervised.yml", torch.device("cpu"))
+    config.diffusion.num_sampling_timesteps = 2
+    torch.manual_seed(0)
+    net = build_net(config)
+    onnx_dir = str(tmp_path_factory.mktemp("onnx"))
+    export_onnx(net, onnx_dir, height=64, width=64)
+    return net, OnnxNet(config, onnx_dir)
+
+
+@pytest.mark.parametrize("shape", [(64, 64), (128, 192)])
+def test_onnx_matches_pytorch(exported, shape):
+    net, onnx_net = exported
+    diffs = check_parity(net, onnx_net, shape)
+    assert all(v <= TOLERANCE for v in diffs.values()), diffs
+
+
+def test_parity_uses_plain_sampler_without_touching_config(exported):
+    net, onnx_net = exported
+    config = copy.deepcopy(net.config)
+    net.config.sampling.eta = 0.5
+    net.config.sampling.deepcache_interval = 2
+    try:
+        diffs = check_parity(net, onnx_net, (64, 64))
+        assert diffs['full'] <= TOLERANCE, diffs
+        assert net.config.sampling.eta == 0.5 and net.config.sampling.deepcache_interval == 2
+    finally:
+        net.config = config
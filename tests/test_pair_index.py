@@ -0,0 +1,65 @@
+import pytest
+
+# the datasets package imports torch through datasets/dataset.py
+pytest.importorskip("torch")
+
+from datasets.pair_index import PairIndex, size_index_path, read_size_index, write_size_index
+
+PAIRS = [("data/low/1.png", "data/high/1.png"),
+         ("data/Huawei/low/2_é.jpg", "data/Huawei/high/2_é.jpg"),
+         ("x", "y")]
+
+
+def write_list(path):
+    path.write_bytes("".join("{} {}\n".format(low, high) for low, high in PAIRS).encode())
+    return str(path)
+
+
+def test_from_lines_skips_blank_lines():
+    index = PairIndex.from_lines(["{} {}".format(*PAIRS[0]), "", "  ", b"x y extra\n"])
+    assert len(index) == 2
+    assert index[0] == PAIRS[0]
+    assert index.low_path(1) == "x" and index.high_path(1) == "y"
+
+
+def test_from_lines_rejects_single_path():
+    with pytest.raises(ValueError, match="list.txt:2"):
+        PairIndex.from_lines(["a b", "lonely"], source="list.txt")
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(tmp_path, mmap):
+    list_path = write_list(tmp_path / "pairs.txt")
+    index = PairIndex.from_list_file(list_path)
+    assert [index[i] for i in range(len(index))] == PAIRS
+
+    index_path = str(tmp_path / "pairs.idx")
+    index.save(index_path)
+    loaded = PairIndex.load(index_path, mmap=mmap)
+    assert [loaded[i] for i in range(len(loaded))] == PAIRS
+
+    # open() tells the two formats apart by the header
+    assert PairIndex.open(index_path)[1] == PAIRS[1]
+    assert PairIndex.open(list_path)[1] == PAIRS[1]
+
+
+def test_empty_index_round_trip(tmp_path):
+    index_path = str(tmp_path / "empty.idx")
+    PairIndex.from_lines([]).save(index_path)
+    assert len(PairIndex.load(index_path)) == 0
+
+
+def test_load_rejects_text_file(tmp_path):
+    with pytest.raises(ValueError):
+        PairIndex.load(write_list(tmp_path / "pairs.txt"))
+
+
+def test_size_index_round_trip(tmp_path):
+    assert size_index_path("data/LOLv1_val.txt") == "data/LOLv1_val.sizes.tsv"
+    assert size_index_path("data/LOLv1_val.idx") == "data/LOLv1_val.sizes.tsv"
+
+    rows = [{"low": "a.png", "high": "b.png", "width": 600, "height": 400, "channels": 3,
+             "low_mtime_ns": 1, "high_mtime_ns": 2, "low_bytes": 10, "high_bytes": 20}]
+    path = str(tmp_path / "pairs.sizes.tsv")
+    write_size_index(path, rows)
+    assert read_size_index(path) == rows
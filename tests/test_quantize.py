@@ -0,0 +1,32 @@
+import copy
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from benchmarks.common import build_net
+from models.quantize import quantize, save_quantized, load_quantized, default_backend
+
+
+def test_static_regions_round_trip(tiny_config, tmp_path):
+    tiny_config.sampling.seed = 0
+    torch.manual_seed(0)
+    fp32 = build_net(tiny_config)
+    int8 = copy.deepcopy(fp32)
+    images = [torch.rand(3, 64, 64) for _ in range(2)]
+    meta = quantize(int8, 'static', images, backend=default_backend())
+    assert meta['regions'] and any(isinstance(m, torch.ao.nn.quantized.Conv2d) for m in int8.modules())
+
+    path = str(tmp_path / 'int8.pt')
+    save_quantized(int8, meta, path)
+    loaded = load_quantized(build_net(tiny_config), path)
+
+    x = torch.rand(1, 3, 64, 64)
+    x = torch.cat([x, x], dim=1)
+    with torch.no_grad():
+        reference = fp32(x)['pred_x']
+        converted = int8(x)['pred_x']
+        reloaded = loaded(x)['pred_x']
+    assert reloaded.shape == reference.shape
+    torch.testing.assert_close(reloaded, converted)
+    # INT8 activations: close to fp32 relative to the spread of the output, not equal
+    assert (reloaded - reference).abs().mean() < 0.2 * reference.std()
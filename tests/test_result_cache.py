@@ -0,0 +1,80 @@
+import os
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from models.cache import ResultCache
+
+CONTEXT = {"checkpoint": "abc", "sampler": {"eta": 0.0, "steps": 20}}
+
+
+def fill(cache, keys):
+    """Put a 3x16x16 output under every key; returns the size of one entry on disk."""
+    for key in keys:
+        cache.put(key, torch.zeros(3, 16, 16))
+    return os.path.getsize(cache.path(keys[0]))
+
+
+def test_key_depends_on_pixels_shape_dtype_and_context(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 1 << 20, CONTEXT)
+    image = torch.rand(1, 3, 8, 8)
+    key = cache.key(image)
+    assert key == cache.key(image.clone())
+    assert key != cache.key(image + 1e-3)
+    assert key != cache.key(image.reshape(1, 3, 4, 16))
+    assert key != cache.key(image.double())
+
+    other = ResultCache(str(tmp_path / "cache"), 1 << 20, dict(CONTEXT, checkpoint="def"))
+    assert key != other.key(image)
+    # key order in the context does not matter
+    same = ResultCache(str(tmp_path / "cache"), 1 << 20, {"sampler": CONTEXT["sampler"], "checkpoint": "abc"})
+    assert key == same.key(image)
+
+
+def test_get_put(tmp_path):
+    cache = ResultCache(str(tmp_path), 1 << 20, CONTEXT)
+    output = torch.rand(3, 16, 16)
+    assert cache.get("missing") is None
+    cache.put("k", output)
+    torch.testing.assert_close(cache.get("k"), output)
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": os.path.getsize(cache.path("k"))}
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), 1 << 20, CONTEXT)
+    size = fill(cache, ["a", "b"])
+    cache.max_bytes = 2 * size
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    cache.put("c", torch.zeros(3, 16, 16))
+
+    assert cache.get("b") is None and not os.path.exists(cache.path("b"))
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] <= 2 * size
+
+
+def test_single_entry_over_budget_is_kept(tmp_path):
+    cache = ResultCache(str(tmp_path), 1, CONTEXT)
+    fill(cache, ["a", "b"])
+    assert cache.stats()["entries"] == 1 and cache.get("b") is not None
+
+
+def test_lru_order_survives_restart(tmp_path):
+    directory = str(tmp_path / "cache")
+    cache = ResultCache(directory, 1 << 20, CONTEXT)
+    size = fill(cache, ["a", "b"])
+    os.utime(cache.path("a"), ns=(1, 1))
+    os.utime(cache.path("b"), ns=(2, 2))
+
+    reopened = ResultCache(directory, 2 * size, CONTEXT)
+    assert reopened.stats()["entries"] == 2
+    reopened.put("c", torch.zeros(3, 16, 16))
+    assert reopened.get("a") is None and reopened.get("b") is not None
+
+
+def test_truncated_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path), 1 << 20, CONTEXT)
+    size = fill(cache, ["a"])
+    with open(cache.path("a"), "r+b") as f:
+        f.truncate(size // 2)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 0 and cache.stats()["entries"] == 0
@@ -0,0 +1,52 @@
+import pytest
+
+from results_store import ResultsStore
+
+RUN = {"checkpoint": "abc", "sampler": {"eta": 0.0}, "dataset": "LSRW", "parity": True}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "results.db")
+
+
+def test_resume_returns_finished_images(db):
+    store = ResultsStore(db, RUN)
+    store.add({"name": "Huawei/1.png", "psnr": 20.0, "ssim": 0.8})
+    store.add({"name": "Nikon/2.png", "psnr": 22.0}, commit=False)
+    store.commit()
+    store.close()
+
+    store = ResultsStore(db, dict(RUN))
+    assert store.done() == {"Huawei/1.png", "Nikon/2.png"}
+    # images missing a newly requested metric are computed again
+    assert store.done(required=("psnr", "ssim")) == {"Huawei/1.png"}
+    # another run key shares the database but not the results
+    assert ResultsStore(db, dict(RUN, checkpoint="def")).done() == set()
+
+
+def test_uncommitted_rows_are_lost(db):
+    store = ResultsStore(db, RUN)
+    store.add({"name": "a.png", "psnr": 20.0}, commit=False)
+    store.conn.rollback()
+    assert store.done() == set()
+
+
+def test_add_keeps_metrics_missing_from_the_record(db):
+    store = ResultsStore(db, RUN)
+    store.add({"name": "a.png", "psnr": 20.0, "ssim": 0.8})
+    store.add({"name": "a.png", "lpips": 0.1})
+    summary = store.aggregate()["all"]
+    assert (summary["psnr"]["mean"], summary["ssim"]["mean"], summary["lpips"]["mean"]) == (20.0, 0.8, 0.1)
+    assert summary["psnr"]["count"] == 1
+
+
+def test_aggregate_per_subset(db):
+    store = ResultsStore(db, RUN)
+    for name, psnr in (("Huawei/1.png", 10.0), ("Huawei/2.png", 20.0), ("Nikon/3.png", 30.0), ("4.png", 40.0)):
+        store.add({"name": name, "psnr": psnr})
+    summary = store.aggregate(percentiles=(50,))
+    assert set(summary) == {"all", "Huawei", "Nikon"}
+    assert summary["all"]["psnr"] == {"mean": 25.0, "count": 4, "p50": 25.0}
+    assert summary["Huawei"]["psnr"] == {"mean": 15.0, "count": 2, "p50": 15.0}
+    assert "ssim" not in summary["all"]
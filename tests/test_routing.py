@@ -0,0 +1,46 @@
+import types
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from models.routing import BrightnessRouter, build_router
+
+
+def gray(*levels):
+    return torch.stack([torch.full((3, 8, 8), level) for level in levels])
+
+
+def test_luminance_uses_luma_weights():
+    x = torch.zeros(2, 3, 4, 4)
+    x[0, 1] = 1.0
+    x[1] = 2.0  # clamped to 1
+    assert BrightnessRouter.luminance(x).tolist() == pytest.approx([0.587, 1.0])
+
+
+def test_route_thresholds():
+    router = BrightnessRouter(dim=0.25, bright=0.45, bright_action='passthrough', reduced_steps=5)
+    routes, luminance = router.route(gray(0.1, 0.3, 0.4, 0.5, 0.9))
+    assert routes == ['full', 'reduced', 'reduced', 'passthrough', 'passthrough']
+    assert luminance == pytest.approx([0.1, 0.3, 0.4, 0.5, 0.9])
+    assert router.stats() == {'full': 1, 'reduced': 2, 'decode': 0, 'passthrough': 2}
+
+    assert [router.steps(route) for route in ('full', 'reduced', 'decode')] == [None, 5, 0]
+
+
+def test_decode_action():
+    router = BrightnessRouter(bright_action='decode')
+    assert router.route(gray(0.8))[0] == ['decode']
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        BrightnessRouter(bright_action='skip')
+    with pytest.raises(ValueError):
+        BrightnessRouter(dim=0.5, bright=0.4)
+
+
+def test_build_router():
+    assert build_router(types.SimpleNamespace(sampling=types.SimpleNamespace())) is None
+    sampling = types.SimpleNamespace(routing=True, route_dim=0.1, route_bright_action='decode')
+    router = build_router(types.SimpleNamespace(sampling=sampling))
+    assert (router.dim, router.bright, router.bright_action, router.reduced_steps) == (0.1, 0.45, 'decode', 5)
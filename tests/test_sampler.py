@@ -0,0 +1,60 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from datasets.sampler import padded_shape, BucketBatchSampler, pad_collate, unpack_batch
+
+# padded to 64: (448, 640), (448, 640), (512, 512), (448, 640), (512, 512), (448, 640)
+SIZES = [(400, 600), (420, 620), (500, 500), (448, 640), (512, 512), (401, 577)]
+
+
+def test_padded_shape():
+    assert padded_shape(400, 600) == (448, 640)
+    assert padded_shape(64, 64) == (64, 64)
+    assert padded_shape(65, 1, multiple=32) == (96, 32)
+
+
+def test_batches_share_padded_shape():
+    sampler = BucketBatchSampler(SIZES, batch_size=3)
+    batches = list(sampler)
+    # buckets in order of first appearance, dataset order inside
+    assert batches == [[0, 1, 3], [5], [2, 4]]
+    assert len(sampler) == len(batches)
+    for batch in batches:
+        assert len({padded_shape(*SIZES[i]) for i in batch}) == 1
+
+
+def test_drop_last_and_indices():
+    sampler = BucketBatchSampler(SIZES, batch_size=2, drop_last=True)
+    assert list(sampler) == [[0, 1], [3, 5], [2, 4]]
+    assert len(sampler) == 3
+
+    sampler = BucketBatchSampler(SIZES, batch_size=4, indices=[4, 1, 2])
+    assert list(sampler) == [[4, 2], [1]]
+    assert len(sampler) == 2
+
+
+def test_pad_collate_keeps_sizes():
+    images = [torch.rand(6, 40, 50), torch.rand(6, 64, 30)]
+    x, ids, sizes = pad_collate([(images[0], "a.png"), (images[1], "b.png")])
+    assert x.shape == (2, 6, 64, 64)
+    assert ids == ["a.png", "b.png"]
+    assert sizes.tolist() == [[40, 50], [64, 30]]
+    for k, (h, w) in enumerate(sizes.tolist()):
+        torch.testing.assert_close(x[k, :, :h, :w], images[k])
+
+
+def test_pad_collate_small_image_uses_replicate():
+    # padding larger than the image is not possible with reflect
+    image = torch.rand(3, 8, 8)
+    x, _, _ = pad_collate([(image, "a.png")])
+    assert x.shape == (1, 3, 64, 64)
+    torch.testing.assert_close(x[0, :, 63, 63], image[:, 7, 7])
+
+
+def test_unpack_batch():
+    x = torch.rand(2, 6, 64, 96)
+    _, ids, sizes = unpack_batch((x, ["a", "b"]))
+    assert ids == ["a", "b"] and sizes.tolist() == [[64, 96], [64, 96]]
+    batch = (x, ["a", "b"], torch.tensor([[10, 20], [30, 40]]))
+    assert unpack_batch(batch) is batch
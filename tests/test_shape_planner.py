@@ -0,0 +1,65 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from models.shape_planner import ShapePlanner, ExecutableCache
+
+
+@pytest.fixture
+def planner():
+    return ShapePlanner([(384, 576), (448, 640), (512, 512)], max_pad_ratio=0.25, max_downscale=0.15)
+
+
+def test_rejects_shapes_off_the_multiple():
+    with pytest.raises(ValueError):
+        ShapePlanner([(400, 600)])
+
+
+def test_plan_modes(planner):
+    # LOLv1 size pads into the 448x640 shape
+    assert planner.plan(400, 600) == ('pad', (448, 640), (400, 600))
+    # a square input picks the shape wasting the fewest pixels
+    assert planner.plan(500, 500) == ('pad', (512, 512), (500, 500))
+    # slightly too large for every shape: downscaled into one
+    mode, target, resized = planner.plan(460, 660)
+    assert mode == 'resize' and target == (448, 640)
+    assert resized[0] <= 448 and resized[1] <= 640
+    # too large to downscale within max_downscale: the usual pad to 64
+    assert planner.plan(1000, 1000) == ('fallback', (1024, 1024), (1000, 1000))
+
+
+@pytest.mark.parametrize("size", [(400, 600), (460, 660), (1000, 1000)])
+def test_apply_restore_round_trip(planner, size):
+    x = torch.rand(2, 3, *size)
+    y, plan = planner.apply(x)
+    assert y.shape == (2, 3) + tuple(plan.target)
+
+    restored = planner.restore(y, plan, size)
+    assert restored.shape == x.shape
+    if plan.mode == 'resize':
+        # bilinear down and up again: close on smooth content, not equal
+        smooth = torch.linspace(0, 1, size[1]).expand(1, 3, *size)
+        y, plan = planner.apply(smooth)
+        assert (planner.restore(y, plan, size) - smooth).abs().max() < 0.02
+    else:
+        torch.testing.assert_close(restored, x)
+
+
+def test_stats(planner):
+    planner.apply(torch.rand(2, 3, 400, 600))
+    planner.apply(torch.rand(1, 3, 1000, 1000))
+    stats = planner.stats()
+    assert stats['modes'] == {'pad': 2, 'fallback': 1}
+    computed = 2 * 448 * 640 + 1024 * 1024
+    assert stats['padding_overhead'] == pytest.approx(computed / (2 * 400 * 600 + 1000 * 1000) - 1)
+
+
+def test_executable_cache_ignores_batch_size():
+    built = []
+    cache = ExecutableCache(lambda fn, shape: built.append(shape) or fn)
+    fn = lambda x: x + 1
+    assert cache.get((1, 6, 448, 640), fn) is fn
+    cache.get((4, 6, 448, 640), fn)
+    cache.get((1, 6, 512, 512), fn)
+    assert built == [(6, 448, 640), (6, 512, 512)]
+    assert cache.stats() == {'shapes': 2, 'hits': 1, 'misses': 2}
@@ -0,0 +1,61 @@
+import json
+import struct
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from utils.slim_checkpoint import save_tensors, read_header, load_tensors
+
+
+@pytest.fixture
+def tensors():
+    torch.manual_seed(0)
+    return {"conv.weight": torch.randn(4, 3, 3, 3),
+            "conv.bias": torch.randn(4).half(),
+            "steps": torch.arange(5, dtype=torch.int64),
+            "mask": torch.tensor([True, False, True]),
+            "scale": torch.tensor(0.5, dtype=torch.bfloat16),
+            "transposed": torch.randn(3, 5).t()}
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip(tmp_path, tensors, mmap):
+    path = str(tmp_path / "model.safetensors")
+    save_tensors(path, tensors, metadata={"epoch": 3, "format": "slim"})
+    loaded, metadata = load_tensors(path, mmap=mmap)
+    assert metadata == {"epoch": "3", "format": "slim"}
+    assert set(loaded) == set(tensors)
+    for name, t in tensors.items():
+        assert loaded[name].dtype == t.dtype and loaded[name].shape == t.shape
+        assert torch.equal(loaded[name], t)
+
+
+def test_layout_is_aligned(tmp_path, tensors):
+    path = str(tmp_path / "model.safetensors")
+    save_tensors(path, tensors)
+    header, data_start = read_header(path)
+    assert data_start % 8 == 0
+    for info in header.values():
+        start, end = info["data_offsets"]
+        itemsize = {"F32": 4, "F16": 2, "BF16": 2, "I64": 8, "BOOL": 1}[info["dtype"]]
+        assert start % itemsize == 0
+
+    # header layout of the safetensors format: u64 little-endian size, then JSON
+    with open(path, "rb") as f:
+        size = struct.unpack("<Q", f.read(8))[0]
+        assert json.loads(f.read(size)) == header
+
+
+def test_mmap_tensors_are_copy_on_write(tmp_path, tensors):
+    path = str(tmp_path / "model.safetensors")
+    save_tensors(path, tensors)
+    loaded, _ = load_tensors(path, mmap=True)
+    loaded["conv.weight"].zero_()
+    reloaded, _ = load_tensors(path)
+    assert torch.equal(reloaded["conv.weight"], tensors["conv.weight"])
+
+
+def test_empty_file(tmp_path):
+    path = str(tmp_path / "empty.safetensors")
+    save_tensors(path, {}, metadata={"note": "empty"})
+    assert load_tensors(path) == ({}, {"note": "empty"})
@@ -0,0 +1,91 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+from PIL import Image
+
+import datasets.streaming as streaming
+from datasets.streaming import StreamingPairDataset
+
+
+@pytest.fixture
+def shard_dir(tmp_path):
+    """Three list shards of 4, 3 and 5 pairs of tiny PNGs."""
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    shards = tmp_path / "shards"
+    shards.mkdir()
+    n = 0
+    for s, count in enumerate((4, 3, 5)):
+        lines = []
+        for _ in range(count):
+            low, high = image_dir / "low{:02d}.png".format(n), image_dir / "high{:02d}.png".format(n)
+            Image.new("RGB", (8, 8), (n, n, n)).save(low)
+            Image.new("RGB", (8, 8), (255 - n, 0, 0)).save(high)
+            lines.append("{} {}".format(low, high))
+            n += 1
+        (shards / "part{}.txt".format(s)).write_text("\n".join(lines) + "\n")
+    return str(shards)
+
+
+def make_dataset(source, **kwargs):
+    kwargs = dict(dict(patch_size=8, batch_size=2, shuffle_buffer=4, prefetch=2, num_threads=2, seed=3), **kwargs)
+    return StreamingPairDataset(source, **kwargs)
+
+
+def ids(dataset):
+    return [img_id for _, img_id in dataset]
+
+
+def test_epoch_covers_every_pair_once(shard_dir):
+    dataset = make_dataset(shard_dir)
+    epoch = ids(dataset)
+    assert sorted(epoch) == ["low{:02d}.png".format(n) for n in range(12)]
+
+    image, _ = next(iter(dataset))
+    assert image.shape == (6, 8, 8)
+
+
+def test_order_depends_on_seed_and_epoch_only(shard_dir):
+    first = ids(make_dataset(shard_dir))
+    assert ids(make_dataset(shard_dir)) == first
+
+    dataset = make_dataset(shard_dir)
+    dataset.set_epoch(1)
+    assert sorted(ids(dataset)) == sorted(first) and ids(dataset) != first
+
+
+def test_ranks_get_disjoint_shards(shard_dir, monkeypatch):
+    per_rank = []
+    for rank in range(2):
+        monkeypatch.setattr(streaming, "get_rank_and_world_size", lambda rank=rank: (rank, 2))
+        per_rank.append(ids(make_dataset(shard_dir)))
+    assert not set(per_rank[0]) & set(per_rank[1])
+    assert len(per_rank[0]) + len(per_rank[1]) == 12
+
+
+def test_resume_skips_consumed_batches(shard_dir):
+    dataset = make_dataset(shard_dir)
+    dataset.set_epoch(2)
+    full = ids(dataset)
+    state = dataset.state_dict(batches=3)
+    assert state == {"epoch": 2, "batches": 3, "seed": 3}
+
+    resumed = make_dataset(shard_dir, seed=0)
+    resumed.load_state_dict(state)
+    assert ids(resumed) == full[3 * 2:]
+
+    # a later resume point accumulates on top of the first one, a new epoch starts over
+    assert resumed.state_dict(batches=1)["batches"] == 4
+    resumed.set_epoch(3)
+    assert resumed.state_dict(batches=0)["batches"] == 0
+
+
+def test_list_file_and_missing_source(shard_dir, tmp_path):
+    dataset = make_dataset(shard_dir + "/part1.txt", train=False)
+    assert ids(dataset) == ["low04.png", "low05.png", "low06.png"]
+
+    with pytest.raises(FileNotFoundError):
+        make_dataset(str(tmp_path / "missing.txt"))
+    (tmp_path / "empty").mkdir()
+    with pytest.raises(FileNotFoundError):
+        make_dataset(str(tmp_path / "empty"))
@@ -1,3 +1,5 @@
 from utils.logging import *
 from utils.sampling import *
 from utils.optimize import *
+from utils.slim_checkpoint import *
+from utils.profiling import *
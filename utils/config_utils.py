@@ -17,7 +17,7 @@ def parse_args_and_config(mode="training"):
     Parse command line arguments and configuration file.
     
     Args:
-        mode: Either "training" or "evaluation" to determine specific arguments
+        mode: "training", "evaluation", "inference" or "serving" to determine specific arguments
         
     Returns:
         args: Command line arguments
@@ -32,6 +32,10 @@ def parse_args_and_config(mode="training"):
     parser.add_argument("--image_folder", default='results/', type=str,
                         help="Location to save restored images")
     
+    if mode in ("training", "evaluation"):
+        parser.add_argument("--profile", action="store_true",
+                            help="Profile the first profiling.steps iterations (see the profiling config section)")
+
     # Add mode-specific arguments
     if mode == "training":
         parser.add_argument('--seed', default=230, type=int, metavar='N',
@@ -39,8 +43,45 @@ def parse_args_and_config(mode="training"):
     elif mode == "evaluation":
         parser.add_argument("--paired", action="store_true", 
                             help="Set if the dataset is paired (supervised)")
+        parser.add_argument("--fast_metrics", action="store_true",
+                            help="Compute PSNR/SSIM in float instead of matching the uint8 skimage numbers")
+        parser.add_argument("--results_db", default=None, type=str,
+                            help="SQLite file storing per-image results; images already in it are skipped")
+        parser.add_argument("--metric_workers", default=0, type=int,
+                            help="Threads saving and scoring outputs in the background (0: inline)")
+        parser.add_argument("--metric_queue", default=8, type=int,
+                            help="Maximum batches waiting for the metric workers")
+        parser.add_argument("--metrics", default="psnr,ssim,lpips,niqe,pi", type=str,
+                            help="Comma separated metrics to compute; backends of the others are never loaded")
         # Override default resume path for evaluation
         parser.set_defaults(resume='ckpt/stage2/stage2_weight.pth.tar')
+    elif mode == "inference":
+        parser.add_argument("--input", required=True, type=str,
+                            help="Directory of low-light images or a glob pattern")
+        parser.add_argument("--batch_size", default=4, type=int,
+                            help="Maximum images per model call (images are grouped by padded shape)")
+        parser.add_argument("--decode_workers", default=4, type=int, help="Threads decoding input images")
+        parser.add_argument("--write_workers", default=4, type=int, help="Threads encoding and writing outputs")
+        parser.add_argument("--queue_size", default=32, type=int,
+                            help="Maximum decoded images and pending writes held in memory")
+        parser.add_argument("--format", default="png", choices=["png", "jpg", "webp"], help="Output image format")
+        parser.add_argument("--quality", default=95, type=int, help="JPEG/WebP quality (1-100)")
+        parser.add_argument("--png_compress_level", default=1, type=int,
+                            help="PNG zlib compression level (0-9, lower is faster)")
+        parser.add_argument("--lossless", action="store_true", help="Write lossless WebP")
+        parser.set_defaults(resume='ckpt/stage2/stage2_weight.pth.tar')
+    elif mode == "serving":
+        parser.add_argument("--host", default="127.0.0.1", type=str, help="Address to bind")
+        parser.add_argument("--port", default=8000, type=int, help="Port to listen on")
+        parser.add_argument("--max_batch_size", default=8, type=int, help="Largest batch sent to the model")
+        parser.add_argument("--max_wait_ms", default=10.0, type=float,
+                            help="Longest a request waits for batch mates before it is dispatched")
+        parser.add_argument("--max_queue", default=64, type=int,
+                            help="Requests accepted before new ones are rejected with 503")
+        parser.add_argument("--scheduler", default="dynamic", choices=["dynamic", "continuous"],
+                            help="dynamic: batch whole requests; continuous: let requests join the "
+                                 "sampling loop between timesteps")
+        parser.set_defaults(resume='ckpt/stage2/stage2_weight.pth.tar')
     
     args = parser.parse_args()
 
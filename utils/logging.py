@@ -2,6 +2,7 @@ import torch
 import shutil
 import os
 import torchvision.utils as tvu
+from PIL import Image
 
 
 def save_image(img, file_directory):
@@ -10,6 +11,25 @@ def save_image(img, file_directory):
     tvu.save_image(img, file_directory)
 
 
+def encode_image(img, file_directory, quality=95, compress_level=6, lossless=False):
+    """
+    Save a [C, H, W] tensor in [0, 1] with PIL. The format follows the file extension:
+    `compress_level` (0-9) applies to PNG, `quality` (1-100) to JPEG and WebP, `lossless` to WebP.
+    """
+    os.makedirs(os.path.dirname(file_directory) or '.', exist_ok=True)
+    ndarr = img.mul(255).add_(0.5).clamp_(0, 255).permute(1, 2, 0).to('cpu', torch.uint8).numpy()
+    ext = os.path.splitext(file_directory)[1].lower()
+    if ext == '.png':
+        options = {'compress_level': compress_level}
+    elif ext in ('.jpg', '.jpeg'):
+        options = {'quality': quality}
+    elif ext == '.webp':
+        options = {'quality': quality, 'lossless': lossless}
+    else:
+        options = {}
+    Image.fromarray(ndarr).save(file_directory, **options)
+
+
 def save_checkpoint(state, filename):
     if not os.path.exists(os.path.dirname(filename)):
         os.makedirs(os.path.dirname(filename))
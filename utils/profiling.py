@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import torch
+import torch.nn as nn
+
+
+def synchronize(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def module_flops(module, inputs, output):
+    """Multiply-add FLOPs (2 per MAC) of a convolution or linear layer, from its output shape."""
+    if isinstance(module, (nn.Conv2d, nn.ConvTranspose2d)):
+        kh, kw = module.kernel_size
+        if isinstance(module, nn.Conv2d):
+            macs = output.numel() * (module.in_channels // module.groups) * kh * kw
+        else:
+            # every input pixel is scattered through the kernel
+            macs = inputs[0].numel() * (module.out_channels // module.groups) * kh * kw
+        return 2 * macs
+    if isinstance(module, nn.Linear):
+        return 2 * output.numel() * module.in_features
+    return 0
+
+
+def profiled_modules(net):
+    """
+    {name: [modules]} of the instrumented parts of a `Net`: the CTDN pyramid, channel down/up and
+    Retinex decomposition, and every resolution level of the DiffusionUNet. The UNet levels are
+    containers without a forward of their own, so a level is timed as the sum of its blocks.
+    """
+    groups = {'decom.ReconNet.pyramid': [net.decom.ReconNet.pyramid],
+              'decom.ReconNet.channel_down': [net.decom.ReconNet.channel_down],
+              'decom.ReconNet.channel_up': [net.decom.ReconNet.channel_up],
+              'decom.retinex': [net.decom.retinex],
+              'Unet': [net.Unet]}
+    for i_level, down in enumerate(net.Unet.down):
+        groups['Unet.down.{}'.format(i_level)] = list(down.block) + list(down.attn) + \
+            ([down.downsample] if hasattr(down, 'downsample') else [])
+    groups['Unet.mid'] = [net.Unet.mid.block_1, net.Unet.mid.attn_1, net.Unet.mid.block_2]
+    for i_level, up in enumerate(net.Unet.up):
+        groups['Unet.up.{}'.format(i_level)] = list(up.block) + list(up.attn) + \
+            ([up.upsample] if hasattr(up, 'upsample') else [])
+    return groups
+
+
+class ModuleProfiler(object):
+    """
+    Forward hooks recording, per module group, the call count, wall time, estimated FLOPs
+    (convolutions and linear layers) and, on CUDA, the peak allocated memory, plus the time of
+    every UNet call within a forward of the model (its sampling steps). Each hooked call is also
+    labelled in torch.profiler traces. Hooks assume one forward at a time (no DataParallel replicas).
+    """
+
+    def __init__(self, net, device):
+        self.net = net
+        self.device = torch.device(device)
+        self.groups = profiled_modules(net)
+        self.stats = {name: {'calls': 0, 'time_ms': 0.0, 'gflops': 0.0, 'peak_mb': 0.0} for name in self.groups}
+        self.steps = []
+        self.handles = []
+        self.frames = []
+        self.unet_calls = 0
+
+    def attach(self):
+        for name, modules in self.groups.items():
+            for module in modules:
+                self.handles.append(module.register_forward_pre_hook(self.enter_hook(name)))
+                self.handles.append(module.register_forward_hook(self.exit_hook(name)))
+        for module in self.net.modules():
+            if isinstance(module, (nn.Conv2d, nn.ConvTranspose2d, nn.Linear)):
+                self.handles.append(module.register_forward_hook(self.flops_hook))
+        self.handles.append(self.net.register_forward_pre_hook(self.reset_steps))
+        return self
+
+    def detach(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def reset_steps(self, module, inputs):
+        self.unet_calls = 0
+
+    def fold_peak(self):
+        """Account the peak since the last reset to every open frame, then start a new interval."""
+        if self.device.type != 'cuda':
+            return
+        peak = torch.cuda.max_memory_allocated(self.device)
+        for frame in self.frames:
+            frame['peak'] = max(frame['peak'], peak - frame['start_mem'])
+        torch.cuda.reset_peak_memory_stats(self.device)
+
+    def enter_hook(self, name):
+        def hook(module, inputs):
+            self.fold_peak()
+            label = torch.autograd.profiler.record_function(name)
+            label.__enter__()
+            synchronize(self.device)
+            start_mem = torch.cuda.memory_allocated(self.device) if self.device.type == 'cuda' else 0
+            self.frames.append({'name': name, 'label': label, 'flops': 0, 'peak': 0, 'start_mem': start_mem,
+                                'start': time.perf_counter()})
+        return hook
+
+    def exit_hook(self, name):
+        def hook(module, inputs, output):
+            synchronize(self.device)
+            elapsed = 1000 * (time.perf_counter() - self.frames[-1]['start'])
+            self.fold_peak()
+            frame = self.frames.pop()
+            frame['label'].__exit__(None, None, None)
+            stats = self.stats[name]
+            stats['calls'] += 1
+            stats['time_ms'] += elapsed
+            stats['gflops'] += frame['flops'] / 1e9
+            stats['peak_mb'] = max(stats['peak_mb'], frame['peak'] / 2 ** 20)
+            if name == 'Unet':
+                self.steps.append({'step': self.unet_calls, 'time_ms': elapsed, 'gflops': frame['flops'] / 1e9})
+                self.unet_calls += 1
+        return hook
+
+    def flops_hook(self, module, inputs, output):
+        flops = module_flops(module, inputs, output)
+        for frame in self.frames:
+            frame['flops'] += flops
+
+    def summary(self):
+        """Per-group totals and per-step averages over all recorded forwards."""
+        per_step = {}
+        for record in self.steps:
+            entry = per_step.setdefault(record['step'], {'calls': 0, 'time_ms': 0.0, 'gflops': record['gflops']})
+            entry['calls'] += 1
+            entry['time_ms'] += record['time_ms']
+        return {'modules': self.stats,
+                'steps': {step: {'calls': e['calls'], 'mean_ms': e['time_ms'] / e['calls'], 'gflops': e['gflops']}
+                          for step, e in sorted(per_step.items())}}
+
+    def table(self):
+        summary = self.summary()
+        lines = ["{:<30}{:>8}{:>14}{:>12}{:>12}{:>12}".format('module', 'calls', 'total ms', 'mean ms',
+                                                            'GFLOPs/call', 'peak MB')]
+        for name, s in summary['modules'].items():
+            if s['calls'] == 0:
+                continue
+            lines.append("{:<30}{:>8}{:>14.1f}{:>12.2f}{:>12.2f}{:>12.1f}".format(
+                name, s['calls'], s['time_ms'], s['time_ms'] / s['calls'], s['gflops'] / s['calls'], s['peak_mb']))
+        if summary['steps']:
+            lines.append("")
+            lines.append("{:<30}{:>8}{:>14}{:>12}".format('UNet call in forward', 'calls', 'mean ms', 'GFLOPs'))
+            for step, s in summary['steps'].items():
+                lines.append("{:<30}{:>8}{:>14.2f}{:>12.2f}".format(step, s['calls'], s['mean_ms'], s['gflops']))
+        return "\n".join(lines)
+
+
+class Profiling(object):
+    """
+    Instrumentation of the first `steps` iterations (training steps or evaluation batches) of a
+    run: a ModuleProfiler and, with `trace`, a torch.profiler session exported as a Chrome trace.
+    Call `step()` after every iteration; results are written to `output_dir` once `steps` are done
+    or on `close()`.
+    """
+
+    def __init__(self, net, device, output_dir, steps=5, trace=True):
+        self.output_dir = output_dir
+        self.steps = steps
+        self.count = 0
+        self.modules = ModuleProfiler(net, device).attach()
+        self.profiler = None
+        if trace:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.device(device).type == 'cuda':
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+            self.profiler.__enter__()
+
+    @property
+    def active(self):
+        return self.modules is not None
+
+    def step(self):
+        if not self.active:
+            return
+        self.count += 1
+        if self.count >= self.steps:
+            self.close()
+
+    def close(self):
+        if not self.active:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.modules.detach()
+        print("=> Profile of {} iteration(s):".format(self.count))
+        print(self.modules.table())
+        with open(os.path.join(self.output_dir, 'modules.json'), 'w') as f:
+            json.dump(self.modules.summary(), f, indent=2)
+        with open(os.path.join(self.output_dir, 'modules.txt'), 'w') as f:
+            f.write(self.modules.table() + "\n")
+        if self.profiler is not None:
+            self.profiler.__exit__(None, None, None)
+            self.profiler.export_chrome_trace(os.path.join(self.output_dir, 'trace.json'))
+            with open(os.path.join(self.output_dir, 'ops.txt'), 'w') as f:
+                f.write(self.profiler.key_averages().table(sort_by='self_cpu_time_total', row_limit=50))
+            self.profiler = None
+        print("=> wrote profile to {}".format(self.output_dir))
+        self.modules = None
+
+
+def profiling_from_config(args, config, net):
+    """Profiling session for `net` if enabled by `--profile` or `profiling.enabled`, else None."""
+    profiling = getattr(config, 'profiling', None)
+    if not (getattr(args, 'profile', False) or getattr(profiling, 'enabled', False)):
+        return None
+    output_dir = getattr(profiling, 'output_dir', 'results/profile')
+    print("=> Profiling the first {} iteration(s) into {}".format(getattr(profiling, 'steps', 5), output_dir))
+    return Profiling(net, config.device, output_dir, steps=getattr(profiling, 'steps', 5),
+                     trace=getattr(profiling, 'trace', True))
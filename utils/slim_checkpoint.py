@@ -0,0 +1,72 @@
+import os
+import json
+import struct
+import numpy as np
+import torch
+
+# safetensors layout: u64 little-endian header size, JSON header, then the raw tensor bytes
+SAFETENSORS_DTYPES = {'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+                      'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8,
+                      'U8': torch.uint8, 'BOOL': torch.bool}
+SAFETENSORS_NAMES = {dtype: name for name, dtype in SAFETENSORS_DTYPES.items()}
+
+
+def save_tensors(path, tensors, metadata=None):
+    """
+    Write a dict of tensors in the safetensors format. Tensors are laid out by decreasing element
+    size so every tensor stays aligned for zero-copy memory-mapped loading; `metadata` values are
+    stored as strings.
+    """
+    tensors = {name: t.detach().cpu().contiguous() for name, t in tensors.items()}
+    order = sorted(tensors, key=lambda name: (-tensors[name].element_size(), name))
+    header, offset = {}, 0
+    for name in order:
+        t = tensors[name]
+        nbytes = t.numel() * t.element_size()
+        header[name] = {'dtype': SAFETENSORS_NAMES[t.dtype], 'shape': list(t.shape),
+                        'data_offsets': [offset, offset + nbytes]}
+        offset += nbytes
+    if metadata:
+        header['__metadata__'] = {str(k): str(v) for k, v in metadata.items()}
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name in order:
+            f.write(tensors[name].reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    return header, 8 + header_size
+
+
+def load_tensors(path, device='cpu', mmap=True):
+    """
+    Read a safetensors file; returns (tensors, metadata). With `mmap` the CPU tensors are
+    copy-on-write views of the file, so pages are only read when a weight is first touched.
+    Other devices receive each tensor straight from the mapping.
+    """
+    header, data_start = read_header(path)
+    metadata = header.pop('__metadata__', {})
+    if not header:
+        return {}, metadata
+    if mmap:
+        data = np.memmap(path, dtype=np.uint8, mode='c', offset=data_start)
+    else:
+        data = np.fromfile(path, dtype=np.uint8, offset=data_start)
+    data = torch.from_numpy(data)
+
+    device = torch.device(device)
+    tensors = {}
+    for name, info in header.items():
+        start, end = info['data_offsets']
+        tensor = data[start:end].view(SAFETENSORS_DTYPES[info['dtype']]).reshape(info['shape'])
+        tensors[name] = tensor if device.type == 'cpu' else tensor.to(device)
+    return tensors, metadata